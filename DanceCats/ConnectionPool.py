@@ -0,0 +1,204 @@
+"""
+Docstring for DanceCats.ConnectionPool module.
+
+This module contains ConnectionPool class which keeps connected
+DatabaseConnector instances of the running process so the queries to
+the same Connection can skip the connect and authenticate handshake.
+"""
+
+from __future__ import print_function
+import os
+import time
+import threading
+from contextlib import contextmanager
+from DanceCats import config
+from .DatabaseConnector import DatabaseConnector, DatabaseConnectorException
+
+
+class ConnectionPool(object):
+    """
+    ConnectionPool class.
+
+    Idle connectors are kept per (Connection's id, Connection's last
+    updated time), so editing a Connection stops reusing the connectors
+    which were opened with its old settings.
+    """
+
+    def __init__(self, pool_config):
+        """
+        Constructor for ConnectionPool class.
+
+        :param pool_config:
+            Application config, read on use:
+                CONNECTION_POOL_MAX_SIZE: max idle connectors
+                    kept per Connection.
+                CONNECTION_POOL_IDLE_SECONDS: seconds an idle connector
+                    is kept before being closed.
+        """
+        self.config = pool_config
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def max_size(self):
+        """Return max idle connectors kept per Connection."""
+        return self.config.get('CONNECTION_POOL_MAX_SIZE', 5)
+
+    @property
+    def idle_seconds(self):
+        """Return seconds an idle connector is kept."""
+        return self.config.get('CONNECTION_POOL_IDLE_SECONDS', 300)
+
+    @staticmethod
+    def pool_key(connection):
+        """
+        Return the key of a Connection in the pool.
+
+        :param connection: Connection Model object.
+        :return: None if the Connection was not saved.
+        """
+        if not connection.connection_id:
+            return None
+        return connection.connection_id, connection.last_updated
+
+    @contextmanager
+    def connector(self, connection, **kwargs):
+        """
+        Borrow a connected DatabaseConnector for the block.
+
+        The connector goes back to the pool when the block finishes
+        and is closed if the block raised.
+
+        :param connection: Connection Model object.
+        :param kwargs: DatabaseConnector's keyword arguments.
+        """
+        db_connector = self.borrow(connection, **kwargs)
+        try:
+            yield db_connector
+        except Exception:
+            self.discard(db_connector)
+            raise
+        else:
+            self.release(db_connector)
+
+    def borrow(self, connection, **kwargs):
+        """
+        Return a connected DatabaseConnector of the given Connection.
+
+        Idle connectors are checked before they are handed out,
+        a new one is connected if none of them is usable.
+
+        :param connection: Connection Model object.
+        :param kwargs: DatabaseConnector's keyword arguments.
+        :return: Connected DatabaseConnector.
+        """
+        key = self.pool_key(connection)
+        self._evict(key)
+
+        while key is not None:
+            with self._lock:
+                idle_connectors = self._idle.get(key, [])
+                if not idle_connectors:
+                    break
+                db_connector = idle_connectors.pop()[1]
+
+            if db_connector.ping():
+                db_connector.configure(**kwargs)
+                return db_connector
+            self._close(db_connector)
+
+        db_connector = DatabaseConnector(
+            connection.type,
+            connection.db_config_generator(),
+            **kwargs
+        )
+        db_connector.connect()
+        db_connector.pool_key = key
+        return db_connector
+
+    def release(self, db_connector):
+        """
+        Give a borrowed connector back to the pool.
+
+        :param db_connector: DatabaseConnector returned by `borrow`.
+        """
+        key = getattr(db_connector, 'pool_key', None)
+        if key is None:
+            self._close(db_connector)
+            return
+
+        try:
+            db_connector.reset()
+        except DatabaseConnectorException:
+            self._close(db_connector)
+            return
+
+        self._evict(key)
+        with self._lock:
+            idle_connectors = self._idle.setdefault(key, [])
+            if len(idle_connectors) < self.max_size:
+                idle_connectors.append((time.time(), db_connector))
+                return
+        self._close(db_connector)
+
+    def discard(self, db_connector):
+        """Close a borrowed connector instead of giving it back."""
+        self._close(db_connector)
+
+    def clear(self):
+        """Close all idle connectors."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for idle_connectors in idle.values():
+            for _, db_connector in idle_connectors:
+                self._close(db_connector)
+
+    def _evict(self, key=None):
+        """
+        Close connectors that were idle for too long.
+
+        Also close connectors of old versions of the given key's
+        Connection. Connectors opened by the parent process are
+        dropped without closing since their sockets are shared.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._idle = {}
+            return
+
+        expired_before = time.time() - self.idle_seconds
+        evicted = []
+        with self._lock:
+            for idle_key in list(self._idle):
+                is_old_version = key is not None and \
+                    idle_key[0] == key[0] and idle_key != key
+                kept = []
+                for released_on, db_connector in self._idle[idle_key]:
+                    if is_old_version or released_on < expired_before:
+                        evicted.append(db_connector)
+                    else:
+                        kept.append((released_on, db_connector))
+                if kept:
+                    self._idle[idle_key] = kept
+                else:
+                    del self._idle[idle_key]
+
+        for db_connector in evicted:
+            self._close(db_connector)
+
+    @staticmethod
+    def _close(db_connector):
+        """Close a connector, ignore failures of dead connections."""
+        if db_connector.connection is None:
+            return
+        try:
+            db_connector.close()
+        except DatabaseConnectorException as exception:
+            print('[ConnectionPool] {0}'.format(exception))
+
+
+# pylint: disable=C0103
+connection_pool = ConnectionPool(config)
+# pylint: enable=C0103
@@ -2,11 +2,17 @@
 
 from __future__ import print_function
 import datetime
+import sqlalchemy
 import sqlalchemy.exc
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
-from .. import app, db, config, \
+from rq import Queue, Worker
+from .. import app, db, rdb, config, create_app, \
     Models, Constants, Helpers
+from ..FrequencyTaskChecker import FrequencyTaskChecker
+from ..JobWorker import enqueue_query_jobs, query_queue_names
+from .. import QueryCache
+from .. import Retention
 
 
 # pylint: disable=C0103
@@ -29,9 +35,19 @@ def list_all():
 
     print('Connection')
     print('- connection_update_encryption')
+    print('- query_cache_clear [--connection_id]')
 
     print('Scheduling')
-    print('- schedule_update')
+    print('- frequency_checker')
+    print('- schedule_update [--enqueue_missed]')
+    print('- schedule_rate')
+
+    print('Tracker')
+    print('- tracker_compact')
+
+    print('Worker')
+    print('- query_worker [--index]')
+    print('- green_worker [--index] [--pool-size]')
 
     return True
 
@@ -43,37 +59,194 @@ def db_create_all():
 
 
 @manager.command
-def schedule_update():
-    """Update outdated schedules on offline time."""
-    schedules = Models.Schedule.query.filter(
+def schedule_update(enqueue_missed=False):
+    """
+    Update outdated schedules on offline time.
+
+    Next runs are computed in one pass and written together.
+    :param enqueue_missed: Enqueue one missed run of each schedule.
+    """
+    interval = app.config.get('FREQUENCY_INTERVAL_SECONDS', 60)
+    now = datetime.datetime.now()
+    next_check = now + datetime.timedelta(seconds=interval)
+    outdated_filter = [
         Models.Schedule.is_active,
         Models.Schedule.schedule_type != Constants.SCHEDULE_ONCE,
-        Models.Schedule.next_run <= datetime.datetime.now()
+        Models.Schedule.next_run <= now
+    ]
+
+    schedules = Models.Schedule.query.with_entities(
+        Models.Schedule.schedule_id,
+        Models.Schedule.job_id,
+        Models.Schedule.schedule_type,
+        Models.Schedule.minute_of_hour,
+        Models.Schedule.hour_of_day,
+        Models.Schedule.day_of_week,
+        Models.Schedule.day_of_month
+    ).filter(
+        Models.Schedule.schedule_type != Constants.SCHEDULE_CRON,
+        *outdated_filter
     ).all()
+    if schedules:
+        schedule_table = Models.Schedule.__table__
+        db.session.execute(
+            schedule_table.update().where(
+                schedule_table.c.id == sqlalchemy.bindparam('schedule_id')
+            ).values(nextRun=sqlalchemy.bindparam('next_run')),
+            [
+                {
+                    'schedule_id': schedule.schedule_id,
+                    'next_run': Helpers.next_run_time(
+                        schedule.schedule_type, now, next_check,
+                        minute_of_hour=schedule.minute_of_hour,
+                        hour_of_day=schedule.hour_of_day,
+                        day_of_week=schedule.day_of_week,
+                        day_of_month=schedule.day_of_month
+                    )
+                } for schedule in schedules
+            ]
+        )
+    missed_runs = [(schedule.job_id, schedule.schedule_id)
+                   for schedule in schedules]
 
-    while len(schedules) > 0:
-        for schedule in schedules:
-            print(
-                "Update next run time for schedule with id {id}.".format(
-                    id=schedule.schedule_id
-                )
-            )
-            schedule.update_next_run(
-                validated=True,
-                interval=app.config.get(
-                    'FREQUENCY_INTERVAL_SECONDS', 60
+    # Cron schedules' occurrences are materialized on the models.
+    for schedule in Models.Schedule.query.filter(
+            Models.Schedule.schedule_type == Constants.SCHEDULE_CRON,
+            *outdated_filter
+    ).all():
+        schedule.update_next_run(validated=True, interval=interval)
+        missed_runs.append((schedule.job_id, schedule.schedule_id))
+
+    trackers = []
+    if enqueue_missed and missed_runs:
+        active_job_ids = set(
+            job_id for job_id, in Models.QueryDataJob.query.with_entities(
+                Models.QueryDataJob.job_id
+            ).filter(
+                Models.QueryDataJob.connection_id.isnot(None),
+                Models.QueryDataJob.job_id.in_(
+                    set(job_id for job_id, _ in missed_runs)
                 )
             )
-            db.session.commit()
+        )
+        trackers = [Models.TrackJobRun(job_id, schedule_id=schedule_id)
+                    for job_id, schedule_id in missed_runs
+                    if job_id in active_job_ids]
+        db.session.add_all(trackers)
+
+    db.session.commit()
+    print("Updated next run time of {count} schedules.".format(
+        count=len(missed_runs)
+    ))
 
-        schedules = Models.Schedule.query.filter(
-            Models.Schedule.is_active,
-            Models.Schedule.next_run < datetime.datetime.now()
-        ).all()
+    if trackers:
+        with app.app_context():
+            enqueue_query_jobs(trackers)
+        print("Enqueued {count} missed runs.".format(count=len(trackers)))
 
     print("Finished!")
 
 
+@manager.command
+def frequency_checker():
+    """Start the frequency task checker without the web stack."""
+    create_app('ftc')
+    FrequencyTaskChecker(
+        interval=app.config.get('FREQUENCY_INTERVAL_SECONDS', 60),
+        pid_path=app.config.get('FREQUENCY_PID', 'frequency.pid'),
+        lease_seconds=app.config.get('FREQUENCY_LEASE_SECONDS', 30),
+        shard_index=app.config.get('FREQUENCY_SHARD_INDEX', 0),
+        shard_count=app.config.get('FREQUENCY_SHARD_COUNT', 1),
+        jitter_seconds=app.config.get('FREQUENCY_JITTER_SECONDS', 0)
+    ).daemonize()
+
+
+@manager.command
+def schedule_rate():
+    """Print the smoothed rate of enqueued jobs of each schedule shard."""
+    shard_count = app.config.get('FREQUENCY_SHARD_COUNT', 1)
+    for shard_index in range(0, shard_count):
+        checker = FrequencyTaskChecker(shard_index=shard_index,
+                                       shard_count=shard_count)
+        print(
+            "Shard {index}: {rate:.3f} jobs per minute.".format(
+                index=shard_index,
+                rate=checker.get_enqueue_rate(rdb.connection) * 60
+            )
+        )
+
+
+def worker_queues(index):
+    """
+    Return the queues of query jobs starting from the one of an index.
+
+    Workers with different indexes run jobs of different connections
+    in parallel.
+    """
+    queue_names = query_queue_names()
+    first = index % len(queue_names)
+    queue_names = queue_names[first:] + queue_names[:first]
+    if 'default' not in queue_names:
+        queue_names.append('default')
+    return [Queue(queue_name, connection=rdb.connection)
+            for queue_name in queue_names]
+
+
+@manager.option('-i', '--index', dest='index', type=int, default=0,
+                help='Index of the worker, decides its first queue.')
+def query_worker(index=0):
+    """Run an RQ worker for query jobs, one job at a time."""
+    create_app('worker')
+    Worker(worker_queues(index), connection=rdb.connection).work()
+
+
+@manager.option('-i', '--index', dest='index', type=int, default=0,
+                help='Index of the worker, decides its first queue.')
+@manager.option('-s', '--pool-size', dest='pool_size', type=int,
+                default=None, help='Number of jobs run at the same time.')
+def green_worker(index=0, pool_size=None):
+    """Run a worker for query jobs, many jobs at a time in green threads."""
+    from ..GreenWorker import GreenWorker, patch_drivers
+
+    patch_drivers()
+    create_app('worker')
+    GreenWorker(
+        worker_queues(index),
+        pool_size=pool_size or app.config.get(
+            'JOB_WORKER_GREEN_POOL_SIZE', 100
+        ),
+        connection=rdb.connection
+    ).work()
+
+
+@manager.command
+def query_cache_clear(connection_id=None):
+    """Remove cached query results of a connection or of all of them."""
+    if connection_id is not None:
+        connection_ids = [connection_id]
+    else:
+        connection_ids = [
+            connection.connection_id
+            for connection in Models.Connection.query.with_entities(
+                Models.Connection.connection_id
+            )
+        ]
+
+    for cleared_connection_id in connection_ids:
+        QueryCache.invalidate(rdb.connection, cleared_connection_id)
+    print("Cleared the query cache of {count} connections.".format(
+        count=len(connection_ids)
+    ))
+
+
+@manager.command
+def tracker_compact():
+    """Archive trackers over their retention and prune the archive."""
+    archived_count, pruned_count = Retention.compact_trackers()
+    print("Archived {archived} trackers, pruned {pruned} archived trackers."
+          .format(archived=archived_count, pruned=pruned_count))
+
+
 @manager.command
 def add_allowed_user(email):
     """
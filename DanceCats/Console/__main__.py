@@ -1,6 +1,7 @@
 """Main file for Console package."""
 
 import os
+from DanceCats import app, create_app
 from DanceCats.Console import manager
 
 
@@ -11,4 +12,5 @@ else:
         "Can't load configurations. Please specify configuration file"
     )
 
+create_app('console')
 manager.run()
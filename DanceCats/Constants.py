@@ -86,10 +86,18 @@ JOB_TYPES_DICT = {
 
 # Job Feature name section
 JOB_FEATURE_QUERY_TIME_OUT = 'queryTimeOut'
+JOB_FEATURE_SERVER_SIDE_CURSOR = 'serverSideCursor'
+JOB_FEATURE_RESULT_CACHE_SECONDS = 'resultCacheSeconds'
 
 JOB_FEATURE_DICT = {
     JOB_FEATURE_QUERY_TIME_OUT: {
         'py_type': int
+    },
+    JOB_FEATURE_SERVER_SIDE_CURSOR: {
+        'py_type': bool
+    },
+    JOB_FEATURE_RESULT_CACHE_SECONDS: {
+        'py_type': int
     }
 }
 
@@ -107,6 +115,7 @@ SCHEDULE_HOURLY = 1
 SCHEDULE_DAILY = 2
 SCHEDULE_WEEKLY = 3
 SCHEDULE_MONTHLY = 4
+SCHEDULE_CRON = 5
 
 SCHEDULE_TYPES_DICT = {
     SCHEDULE_ONCE: {
@@ -123,6 +132,9 @@ SCHEDULE_TYPES_DICT = {
     },
     SCHEDULE_MONTHLY: {
         'name': 'Monthly'
+    },
+    SCHEDULE_CRON: {
+        'name': 'Cron'
     }
 }
 
@@ -146,6 +158,10 @@ SCHEDULE_TYPES_LIST = [
     (
         SCHEDULE_MONTHLY,
         SCHEDULE_TYPES_DICT[SCHEDULE_MONTHLY]['name']
+    ),
+    (
+        SCHEDULE_CRON,
+        SCHEDULE_TYPES_DICT[SCHEDULE_CRON]['name']
     )
 ]
 
@@ -0,0 +1,208 @@
+"""
+Docstring for DanceCats.Cron module.
+
+This module contains CronExpression class which compiles the five
+fields cron expressions (minute, hour, day of month, month, day of week)
+of cron schedules into bitsets and finds their next occurrences.
+"""
+
+import calendar
+import datetime
+
+
+MONTH_NAMES = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN',
+               'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+DAY_OF_WEEK_NAMES = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
+
+# (lowest value, highest value, names starting from the lowest value)
+FIELDS = [
+    (0, 59, None),
+    (0, 23, None),
+    (1, 31, None),
+    (1, 12, MONTH_NAMES),
+    (0, 7, DAY_OF_WEEK_NAMES)
+]
+
+# Every day of week pattern repeats in 28 years, no run in that is no run.
+MAX_SEARCH_YEARS = 28
+
+
+class CronExpressionError(ValueError):
+    """Raised when a cron expression can not be compiled."""
+
+
+def next_bit(bits, start):
+    """
+    Return the position of the lowest set bit not lower than start.
+
+    :return: None if there is no such bit.
+    """
+    remaining = bits >> start
+    if not remaining:
+        return None
+    return start + (remaining & -remaining).bit_length() - 1
+
+
+def parse_value(value, lowest, names):
+    """Parse a number or a name of a cron field's value."""
+    if names is not None and value.upper() in names:
+        return names.index(value.upper()) + lowest
+    if not value.isdigit():
+        raise CronExpressionError('Invalid value: {0}'.format(value))
+    return int(value)
+
+
+def parse_field(field, lowest, highest, names=None):
+    """
+    Compile a cron field into a bitset of its values.
+
+    Support `*`, values, names, ranges `a-b`, steps `*/n` and `a-b/n`
+    and lists separated by commas.
+
+    :return: (bitset, True if the field starts with `*`).
+    """
+    bits = 0
+    for part in field.split(','):
+        value_range, _, step = part.partition('/')
+        step = parse_value(step, 0, None) if step else 1
+
+        if value_range == '*':
+            first, last = lowest, highest
+        elif '-' in value_range:
+            first, last = value_range.split('-', 1)
+            first = parse_value(first, lowest, names)
+            last = parse_value(last, lowest, names)
+        else:
+            first = parse_value(value_range, lowest, names)
+            last = highest if step > 1 else first
+
+        if not lowest <= first <= last <= highest or step < 1:
+            raise CronExpressionError('Invalid field: {0}'.format(field))
+
+        for value in range(first, last + 1, step):
+            bits |= 1 << value
+
+    return bits, field.startswith('*')
+
+
+class CronExpression(object):
+    """
+    CronExpression class.
+
+    Each field is kept as a bitset so finding the next matching value of
+    a field is a bit scan. As in Vixie cron, when both day of month and
+    day of week are restricted, a day matching either of them matches.
+    A field starting with `*`, such as `*/2`, is not a restriction there
+    and days must then match both fields.
+    """
+
+    def __init__(self, expression):
+        """
+        Compile a cron expression.
+
+        :param expression: Five fields separated by spaces.
+        :raise CronExpressionError: If the expression is invalid.
+        """
+        fields = expression.split() if expression else []
+        if len(fields) != len(FIELDS):
+            raise CronExpressionError(
+                'A cron expression needs {0} fields.'.format(len(FIELDS))
+            )
+
+        compiled = [parse_field(field, *field_spec)
+                    for field, field_spec in zip(fields, FIELDS)]
+        self.expression = ' '.join(fields)
+        self.minutes = compiled[0][0]
+        self.hours = compiled[1][0]
+        self.days_of_month, self.is_any_day_of_month = compiled[2]
+        self.months = compiled[3][0]
+        self.days_of_week, self.is_any_day_of_week = compiled[4]
+        # Both 0 and 7 are Sunday.
+        if self.days_of_week & (1 << 7):
+            self.days_of_week = (self.days_of_week | 1) & ~(1 << 7)
+
+    def days_in_month(self, year, month):
+        """Return the bitset of the month's days which match."""
+        first_day_of_week, last_day = calendar.monthrange(year, month)
+        # Python's Monday is 0, cron's Sunday is 0.
+        first_day_of_week = (first_day_of_week + 1) % 7
+        month_days = ((1 << last_day) - 1) << 1
+
+        week_days = 0
+        for day in range(1, last_day + 1):
+            if self.days_of_week & (1 << ((first_day_of_week + day - 1) % 7)):
+                week_days |= 1 << day
+
+        if self.is_any_day_of_month or self.is_any_day_of_week:
+            return self.days_of_month & week_days
+        return (self.days_of_month & month_days) | week_days
+
+    def next_occurrence(self, after):
+        """
+        Return the first occurrence which is strictly after a time.
+
+        :param after: datetime instance.
+        :return: None if the expression never matches.
+        """
+        start = after.replace(second=0, microsecond=0) + \
+            datetime.timedelta(minutes=1)
+        year, month = start.year, start.month
+        day, hour, minute = start.day, start.hour, start.minute
+
+        while year <= after.year + MAX_SEARCH_YEARS:
+            if not self.months & (1 << month):
+                month = next_bit(self.months, month + 1)
+                if month is None:
+                    year, month = year + 1, next_bit(self.months, 1)
+                day, hour, minute = 1, 0, 0
+                continue
+
+            next_day = next_bit(self.days_in_month(year, month), day)
+            if next_day is None:
+                year, month = (year, month + 1) if month < 12 \
+                    else (year + 1, 1)
+                day, hour, minute = 1, 0, 0
+                continue
+            if next_day != day:
+                day, hour, minute = next_day, 0, 0
+
+            next_hour = next_bit(self.hours, hour)
+            if next_hour is None:
+                day, hour, minute = day + 1, 0, 0
+                continue
+            if next_hour != hour:
+                hour, minute = next_hour, 0
+
+            minute = next_bit(self.minutes, minute)
+            if minute is None:
+                hour, minute = hour + 1, 0
+                continue
+
+            return datetime.datetime(year, month, day, hour, minute)
+
+        return None
+
+    def next_occurrences(self, after, count):
+        """Return the next `count` occurrences strictly after a time."""
+        occurrences = []
+        occurrence = self.next_occurrence(after)
+        while occurrence is not None and len(occurrences) < count:
+            occurrences.append(occurrence)
+            occurrence = self.next_occurrence(occurrence)
+        return occurrences
+
+
+_COMPILED = {}
+
+
+def compile_cron(expression):
+    """
+    Return the compiled CronExpression of an expression.
+
+    Compiled expressions are reused, at most 1024 of them are kept.
+    """
+    if expression not in _COMPILED:
+        if len(_COMPILED) >= 1024:
+            _COMPILED.clear()
+        _COMPILED[expression] = CronExpression(expression)
+    return _COMPILED[expression]
@@ -2,18 +2,54 @@
 Docstring for DanceCats.DatabaseConnector module.
 
 This module contain DatabaseConnector and DatabaseConnectorException class
-which is used to wrap different DBMS Connector drivers.
+which is used to wrap different DBMS Connector drivers. Drivers are
+imported on first use, so processes only load the drivers of the
+connections they query.
 """
 
 import traceback
 import re
-import pymssql
-import psycopg2
-import mysql.connector
+import uuid
+import importlib
+from operator import itemgetter
 from . import Constants
 from . import Helpers
 
 
+DRIVER_MODULES = {
+    Constants.DB_MYSQL: 'mysql.connector',
+    Constants.DB_SQLSERVER: 'pymssql',
+    Constants.DB_POSTGRESQL: 'psycopg2'
+}
+
+_drivers = {}
+
+
+def register_driver(connection_type, module_name):
+    """
+    Register the driver module of a connection type.
+
+    :param connection_type: Connection type defined in Constants module.
+    :param module_name: Name of the DB-API module, imported on first use.
+    """
+    DRIVER_MODULES[connection_type] = module_name
+    _drivers.pop(connection_type, None)
+
+
+def get_driver(connection_type):
+    """
+    Return the driver module of a connection type, import it if needed.
+
+    :param connection_type: Connection type defined in Constants module.
+    :return: DB-API module or None if the type has no driver.
+    """
+    driver = _drivers.get(connection_type)
+    if driver is None and connection_type in DRIVER_MODULES:
+        driver = importlib.import_module(DRIVER_MODULES[connection_type])
+        _drivers[connection_type] = driver
+    return driver
+
+
 class DatabaseConnector(object):
     """
     DatabaseConnector class.
@@ -22,6 +58,10 @@ class DatabaseConnector(object):
     other DBMS Connector drivers to different DBMS.
     """
 
+    # Thread pool running drivers which block in C code, such as
+    # eventlet.tpool, set by cooperative workers.
+    thread_pool = None
+
     def __init__(self, connection_type, config, **kwargs):
         """
         Constructor for DatabaseConnector class.
@@ -40,20 +80,39 @@ class DatabaseConnector(object):
                 hide_password: hide password field in the result or not.
                 dict_format: return data rows in dictionary or tuple format.
                 timeout: default timeout for the connection.
+                batch_size: default number of rows fetched per round trip
+                    by `iter_batches` and `iter_rows`.
+                server_side_cursor: keep the result set on the database
+                    server and stream it to the client while fetching.
         """
         self.type = connection_type
         self.config = config
-        self.is_sql_data_type = kwargs.get('sql_data_style', False)
-        self.is_hiding_password = kwargs.get('hide_password', True)
-        self.is_return_dict = kwargs.get('dict_format', False)
-        self.timeout = kwargs.get('timeout', 60)
+        self.configure(**kwargs)
 
         self.connection = None
         self.cursor = None
+        self._prefetched_rows = []
+        self._row_processor = tuple
 
         self.columns_name = ()
         self.ignore_position = []
 
+    def configure(self, **kwargs):
+        """
+        Set the class's behaviour.
+
+        Used by the constructor and whenever a connected instance
+        is reused for a different kind of query.
+
+        :param kwargs: See the constructor's keyword arguments.
+        """
+        self.is_sql_data_type = kwargs.get('sql_data_style', False)
+        self.is_hiding_password = kwargs.get('hide_password', True)
+        self.is_return_dict = kwargs.get('dict_format', False)
+        self.timeout = kwargs.get('timeout', 60)
+        self.batch_size = kwargs.get('batch_size', 1000)
+        self.is_server_side_cursor = kwargs.get('server_side_cursor', False)
+
     def connect(self, timeout=None):
         """
         Connect to the Database via the right driver.
@@ -63,16 +122,24 @@ class DatabaseConnector(object):
         :return: raise DatabaseConnectorException on failed.
         """
         try:
+            driver = get_driver(self.type)
             if self.type == Constants.DB_MYSQL:
                 self.config['connection_timeout'] = \
                     self.timeout if timeout is None else timeout
-                self.connection = mysql.connector.connect(**self.config)
+                self.connection = driver.connect(**self.config)
             elif self.type == Constants.DB_SQLSERVER:
-                self.connection = pymssql.connect(**self.config)
+                if self.thread_pool is None:
+                    self.connection = driver.connect(**self.config)
+                else:
+                    self.connection = self.thread_pool.Proxy(
+                        self.thread_pool.execute(driver.connect,
+                                                 **self.config),
+                        autowrap_names=('cursor',)
+                    )
             elif self.type == Constants.DB_POSTGRESQL:
                 self.config['connect_timeout'] = \
                     self.timeout if timeout is None else timeout
-                self.connection = psycopg2.connect(**self.config)
+                self.connection = driver.connect(**self.config)
         except Exception as exception:
             traceback.print_exc()
             raise DatabaseConnectorException(
@@ -98,6 +165,46 @@ class DatabaseConnector(object):
                 trace_back=exception
             )
 
+    def ping(self):
+        """
+        Check if the connection is still usable.
+
+        :return: True if a trivial query could be run else False.
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+            cursor.close()
+            self.connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def reset(self):
+        """
+        Close the cursor and roll back the open transaction.
+
+        Leave the connection ready for the next query,
+        raise DatabaseConnectorException on failed.
+        Rows left unread on MySQL's unbuffered cursors are discarded.
+        """
+        try:
+            if self.cursor is not None:
+                if self.type == Constants.DB_MYSQL and \
+                        self.connection.unread_result:
+                    self.connection.consume_results()
+                self.cursor.close()
+                self.cursor = None
+            self._prefetched_rows = []
+            self.connection.rollback()
+        except Exception as exception:
+            raise DatabaseConnectorException(
+                'Could not reset the connection.',
+                self.type,
+                trace_back=exception
+            )
+
     def connection_test(self, timeout=None):
         """
         Test the connection.
@@ -114,17 +221,23 @@ class DatabaseConnector(object):
     def execute(self, query):
         """Execute the given query. Return True on success."""
         try:
+            self.cursor = self._open_cursor()
+            self.cursor.execute(query)
+            self._prefetched_rows = []
+            self.ignore_position = []
+
             if self.type == Constants.DB_MYSQL:
-                self.cursor = self.connection.cursor()
-                self.cursor.execute(query)
                 self.columns_name = self.cursor.column_names
 
             elif self.type in [
                     Constants.DB_SQLSERVER,
                     Constants.DB_POSTGRESQL
             ]:
-                self.cursor = self.connection.cursor()
-                self.cursor.execute(query)
+                # Named cursors of psycopg2 only describe
+                # the result after the first fetch.
+                if self.cursor.description is None:
+                    self._prefetched_rows = \
+                        list(self.cursor.fetchmany(self.batch_size))
 
                 # create columns' name tuple
                 self.columns_name = ()
@@ -133,6 +246,7 @@ class DatabaseConnector(object):
 
             if self.is_hiding_password:
                 self._password_field_coordinator()
+            self._row_processor = self._compile_row_processor()
         except Exception as exception:
             traceback.print_exc()
             raise DatabaseConnectorException(
@@ -143,15 +257,44 @@ class DatabaseConnector(object):
         else:
             return True
 
+    def _open_cursor(self):
+        """
+        Open a cursor on the current connection.
+
+        Default cursors buffer the whole result on the client, MySQL's
+        cursors are only buffered when asked to. In server side cursor
+        mode the result stays on the server and is transferred while
+        fetching.
+        """
+        if not self.is_server_side_cursor:
+            if self.type == Constants.DB_MYSQL:
+                return self.connection.cursor(buffered=True)
+            return self.connection.cursor()
+
+        if self.type == Constants.DB_MYSQL:
+            return self.connection.cursor(buffered=False)
+
+        if self.type == Constants.DB_SQLSERVER:
+            return self.connection.cursor(as_dict=False)
+
+        if self.type == Constants.DB_POSTGRESQL:
+            cursor = self.connection.cursor(
+                name='dancecats_{uid}'.format(uid=uuid.uuid4().hex)
+            )
+            cursor.itersize = self.batch_size
+            return cursor
+
+        return self.connection.cursor()
+
     def fetch(self):
         """Fetch single row of the result."""
         try:
             if self.type in [Constants.DB_MYSQL,
                              Constants.DB_SQLSERVER,
                              Constants.DB_POSTGRESQL]:
-                data = self.cursor.fetchone()
-                return self._convert_dict_one(data) \
-                    if self.is_return_dict else self._tuple_process_one(data)
+                data = self._prefetched_rows.pop(0) \
+                    if self._prefetched_rows else self.cursor.fetchone()
+                return None if data is None else self._row_processor(data)
         except Exception as exception:
             traceback.print_exc()
             raise DatabaseConnectorException(
@@ -166,9 +309,11 @@ class DatabaseConnector(object):
             if self.type in [Constants.DB_MYSQL,
                              Constants.DB_SQLSERVER,
                              Constants.DB_POSTGRESQL]:
-                data = self.cursor.fetchmany(size)
-                return self._convert_dict_many(data) \
-                    if self.is_return_dict else self._tuple_process_many(data)
+                data = self._prefetched_rows[:size]
+                self._prefetched_rows = self._prefetched_rows[size:]
+                if len(data) < size:
+                    data += list(self.cursor.fetchmany(size - len(data)))
+                return [self._row_processor(row) for row in data]
         except Exception as exception:
             traceback.print_exc()
             raise DatabaseConnectorException(
@@ -183,9 +328,9 @@ class DatabaseConnector(object):
             if self.type in [Constants.DB_MYSQL,
                              Constants.DB_SQLSERVER,
                              Constants.DB_POSTGRESQL]:
-                data = self.cursor.fetchall()
-                return self._convert_dict_many(data) \
-                    if self.is_return_dict else self._tuple_process_many(data)
+                data = self._prefetched_rows + list(self.cursor.fetchall())
+                self._prefetched_rows = []
+                return [self._row_processor(row) for row in data]
         except Exception as exception:
             traceback.print_exc()
             raise DatabaseConnectorException(
@@ -194,75 +339,112 @@ class DatabaseConnector(object):
                 trace_back=exception
             )
 
-    def _convert_dict_one(self, data_tuple):
-        """Convert one row of data from tuple type to dict type."""
-        if len(self.columns_name) == 0:
-            raise DatabaseConnectorException(
-                'Column(s) name is empty.',
-                self.type
-            )
-
-        data_dict = {}
-
-        for i in range(0, len(self.columns_name)):
-            if i in self.ignore_position:
-                continue
-            data_dict[self.columns_name[i]] = \
-                Helpers.py2sql_type_convert(data_tuple[i]) \
-                if self.is_sql_data_type \
-                else data_tuple[i]
-
-        return data_dict
-
-    def _convert_dict_many(self, data_tuple_list):
-        """Convert many rows of data from tuple type to dict type."""
-        if len(self.columns_name) == 0:
-            raise DatabaseConnectorException(
-                'Column(s) name is empty.',
-                self.type
-            )
+    def iter_batches(self, batch_size=None):
+        """
+        Iterate over the result in batches of processed rows.
 
-        data_dict_list = []
+        Rows are pulled from the cursor with `fetchmany` so only
+        one batch is held in memory at a time.
 
-        for i in range(0, len(data_tuple_list)):
-            data_dict = {}
+        :param batch_size:
+            Number of rows per batch, fall back to
+            the class's default batch size.
+        :return: Generator of lists of processed rows.
+        """
+        batch_size = batch_size or self.batch_size
 
-            for j in range(0, len(self.columns_name)):
-                if j in self.ignore_position:
-                    continue
-                data_dict[self.columns_name[j]] = \
-                    Helpers.py2sql_type_convert(data_tuple_list[i][j]) \
-                    if self.is_sql_data_type else data_tuple_list[i][j]
+        while True:
+            rows = self.fetch_many(batch_size)
+            if not rows:
+                break
+            yield rows
 
-            data_dict_list.append(data_dict)
+    def iter_rows(self, batch_size=None):
+        """
+        Iterate over the result row by row.
 
-        return data_dict_list
+        :param batch_size:
+            Number of rows fetched per round trip, fall back to
+            the class's default batch size.
+        :return: Generator of processed rows.
+        """
+        for rows in self.iter_batches(batch_size):
+            for row in rows:
+                yield row
 
-    def _tuple_process_one(self, data_tuple):
-        """Process one row of tuple data."""
-        new_data_tuple = ()
+    def _compile_row_processor(self):
+        """
+        Build the function processing rows of the current result set.
 
-        for i in range(0, len(data_tuple)):
-            if i in self.ignore_position:
-                new_data_tuple += (None,)
-                continue
-            new_data_tuple += (
-                Helpers.py2sql_type_convert(data_tuple[i])
-                if self.is_sql_data_type else data_tuple[i],
+        Kept columns and per column converters are worked out once per
+        query, so processing a row only touches the hidden columns and
+        the columns that need to be converted.
+        """
+        if self.is_return_dict and len(self.columns_name) == 0:
+            raise DatabaseConnectorException(
+                'Column(s) name is empty.',
+                self.type
             )
 
-        return new_data_tuple
-
-    def _tuple_process_many(self, data_tuple_list):
-        """Process many rows of tuple data."""
-        new_data_tuple_list = []
+        hidden_positions = sorted(set(self.ignore_position))
+        kept_positions = [i for i in range(0, len(self.columns_name))
+                          if i not in hidden_positions]
+        converters = [
+            (i, self._column_converter(i))
+            for i in kept_positions
+        ] if self.is_sql_data_type else []
+
+        if self.is_return_dict:
+            kept_names = [self.columns_name[i] for i in kept_positions]
+            # itemgetter of one position returns the value, not a tuple.
+            if len(kept_positions) > 1:
+                kept_getter = itemgetter(*kept_positions)
+            elif kept_positions:
+                kept_getter = itemgetter(slice(kept_positions[0],
+                                               kept_positions[0] + 1))
+            else:
+                kept_getter = itemgetter(slice(0, 0))
+
+            def process_dict_row(row):
+                """Convert needed columns and return kept ones in dict."""
+                if converters:
+                    row = list(row)
+                    for i, converter in converters:
+                        row[i] = converter(row[i])
+                return dict(zip(kept_names, kept_getter(row)))
+
+            return process_dict_row
+
+        if not converters and not hidden_positions:
+            return tuple
+
+        def process_tuple_row(row):
+            """Hide and convert needed columns of the row."""
+            row = list(row)
+            for i in hidden_positions:
+                row[i] = None
+            for i, converter in converters:
+                row[i] = converter(row[i])
+            return tuple(row)
+
+        return process_tuple_row
+
+    def _column_converter(self, position):
+        """
+        Choose the SQL style converter of a column.
 
-        for i in range(0, len(data_tuple_list)):
-            new_data_tuple_list.append(
-                self._tuple_process_one(data_tuple_list[i])
-            )
+        String and binary columns only need NULL to be converted,
+        other columns go through the full conversion.
 
-        return new_data_tuple_list
+        :param position: Column's position in the result.
+        :return: Converter function.
+        """
+        type_code = self.cursor.description[position][1]
+        driver = get_driver(self.type)
+        if type_code is not None and driver is not None and \
+                type_code in [driver.STRING, driver.BINARY]:
+            return _null_convert
+        return Helpers.py2sql_type_convert
 
     def _password_field_coordinator(self):
         """Coordinate password field and mark to ignore it."""
@@ -280,6 +462,11 @@ class DatabaseConnector(object):
                 self.ignore_position.append(i)
 
 
+def _null_convert(obj):
+    """Return obj in SQL style, for columns which could only be NULL."""
+    return 'NULL' if obj is None else obj
+
+
 class DatabaseConnectorException(Exception):
     """Use as a exception type of DatabaseConnector class."""
 
@@ -0,0 +1,136 @@
+"""
+Docstring for DanceCats.ExportCache module.
+
+This module renders jobs' results into spreadsheet files once per
+(tracker, format) and keeps the rendered files on disk, so downloads
+and mails of the same result reuse them.
+"""
+
+import os
+import glob
+import tempfile
+import time
+import uuid
+from pyexcel.sheets import Sheet
+from DanceCats import config
+from . import Constants
+from . import ResultStorage
+
+
+EXPORT_TYPES = ['xls', 'xlsx', 'ods']
+
+
+def export_folder():
+    """Return the folder where rendered exports are kept."""
+    folder = config.get(
+        'EXPORT_CACHE_FOLDER',
+        os.path.join(tempfile.gettempdir(), 'dancecats_exports')
+    )
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return folder
+
+
+def export_path(tracker_id, result_type):
+    """Return the path of a tracker's export."""
+    return os.path.join(
+        export_folder(),
+        'Result_tid_{tracker_id}.{ext}'.format(
+            tracker_id=tracker_id,
+            ext=result_type
+        )
+    )
+
+
+def is_expired(path, now=None):
+    """Check if an export is older than its result's validity."""
+    now = time.time() if now is None else now
+    return os.path.getmtime(path) < \
+        now - config.get('JOB_RESULT_VALID_SECONDS', 86400)
+
+
+def get_export(tracker, result_type):
+    """
+    Return the path of a tracker's result rendered in a format.
+
+    The export is rendered on the first call, later calls return
+    the same file until it expires or is evicted.
+
+    :param tracker: TrackJobRun Model object.
+    :param result_type: xls, xlsx or ods.
+    :return: None if the job did not succeed or
+             the result does not exist anymore.
+    """
+    if tracker is None or tracker.status != Constants.JOB_RAN_SUCCESS:
+        return None
+
+    path = export_path(tracker.track_job_run_id, result_type)
+
+    try:
+        if not is_expired(path):
+            # Keep the modified time for ETag and expiration,
+            # access time is used for the eviction order.
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+            return path
+    except OSError:
+        pass
+
+    result = ResultStorage.open_tracker_reader(tracker)
+    if result is None:
+        return None
+
+    sheet_data = [list(result.header)]
+    for row in result.iter_rows():
+        sheet_data.append(list(row))
+
+    rendering_path = '{path}.{suffix}.tmp'.format(
+        path=path,
+        suffix=uuid.uuid4().hex
+    )
+    with open(rendering_path, 'wb') as export_file:
+        Sheet(sheet_data).save_to_memory(result_type, export_file)
+    os.rename(rendering_path, path)
+
+    evict()
+    return path
+
+
+def evict():
+    """
+    Remove expired exports and least recently used ones.
+
+    Exports are removed until their total size fits EXPORT_CACHE_MAX_BYTES.
+    """
+    now = time.time()
+    exports = []
+    for path in glob.glob(os.path.join(export_folder(), 'Result_tid_*')):
+        if path.endswith('.tmp'):
+            continue
+        try:
+            if is_expired(path, now):
+                os.remove(path)
+            else:
+                exports.append((os.path.getatime(path),
+                                os.path.getsize(path),
+                                path))
+        except OSError:
+            pass
+
+    total_size = sum([size for _, size, _ in exports])
+    max_size = config.get('EXPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    for _, size, path in sorted(exports):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
+
+
+def remove(tracker_id):
+    """Remove all exports of a tracker."""
+    for result_type in EXPORT_TYPES:
+        path = export_path(tracker_id, result_type)
+        if os.path.exists(path):
+            os.remove(path)
@@ -13,6 +13,7 @@ from wtforms import StringField, PasswordField, TextAreaField, \
     validators
 from wtforms.compat import iteritems
 from . import Constants, config
+from .Cron import compile_cron, CronExpressionError
 
 
 class RegisterForm(Form):
@@ -50,6 +51,10 @@ class ConnectionForm(Form):
     database = StringField('Database', validators=[
         validators.DataRequired()
     ])
+    max_concurrent_jobs = IntegerField('Max Concurrent Jobs', validators=[
+        validators.optional(),
+        validators.NumberRange(min=1)
+    ])
 
 
 class ScheduleForm(Form):
@@ -65,8 +70,31 @@ class ScheduleForm(Form):
                            validators=[
                                validators.DataRequired()
                            ])
+    second_offset = IntegerField('Second Offset',
+                                 default=0,
+                                 validators=[
+                                     validators.Optional(),
+                                     validators.NumberRange(min=0, max=59)
+                                 ])
+    cron_expression = StringField('Cron Expression',
+                                  render_kw={
+                                      'placeholder': '*/15 8-18 * * MON-FRI'
+                                  })
     is_active = BooleanField('Active')
 
+    def validate_cron_expression(self, field):
+        """Cron schedules need a valid cron expression."""
+        if self.schedule_type.data != Constants.SCHEDULE_CRON:
+            return
+        if not field.data or not field.data.strip():
+            raise validators.ValidationError(
+                'Cron schedules need a cron expression.'
+            )
+        try:
+            compile_cron(field.data)
+        except CronExpressionError as exception:
+            raise validators.ValidationError(str(exception))
+
 
 class QueryJobForm(Form):
     """Used to create/edit data getting jobs."""
@@ -93,6 +121,13 @@ class QueryJobForm(Form):
                                       validators.NumberRange(min=0)
                                   ],
                                   default=config.get('DB_TIMEOUT', 0))
+    server_side_cursor = BooleanField('Stream Results From Server')
+    result_cache_seconds = IntegerField('Cache Result For Seconds',
+                                        validators=[
+                                            validators.Optional(),
+                                            validators.NumberRange(min=0)
+                                        ],
+                                        default=0)
     emails = FieldList(StringField('Email',
                                    render_kw={
                                        'placeholder': 'report_to@viisix.space'
@@ -117,5 +152,7 @@ class QueryJobForm(Form):
         :param obj: Job Model object.
         """
         for name, field in iteritems(self._fields):
-            if name not in ['query_time_out', 'emails', 'schedules']:
+            if name not in ['query_time_out', 'server_side_cursor',
+                            'result_cache_seconds',
+                            'emails', 'schedules']:
                 field.populate_obj(obj, name)
@@ -7,44 +7,72 @@ enqueue the next running job into the queue.
 
 from __future__ import print_function
 import time
+import math
 import datetime
+import heapq
 import atexit
 import signal
 from setproctitle import setproctitle
 from dateutil.relativedelta import relativedelta as dateutil_relativedelta
 from DanceCats import Helpers
 from DanceCats import app, db, rdb
-from DanceCats.Models import Schedule, TrackJobRun
-from DanceCats.JobWorker import job_worker_query
+from DanceCats.Models import Schedule, TrackJobRun, FencingToken
+from DanceCats.JobWorker import enqueue_query_jobs, enqueue_parked_jobs
+from DanceCats.LeaderLock import LeaderLock
 
 
 class FrequencyTaskChecker(Helpers.Daemonize):
     """
     Frequency Task Checker class.
 
-    This class will check and enqueue scheduled jobs
-    when the running time will come. After that sleep
-    for `interval` seconds and repeat.
+    This class keeps active schedules in a heap ordered by their next run
+    time, enqueues scheduled jobs when their running time comes and sleeps
+    until the earliest next run, at most `interval` seconds. Schedules
+    which changed are reloaded on every wake up.
+
+    Several checkers can run on different hosts, only the one holding
+    the leader lock of its shard checks the schedules. Schedules are
+    split into `shard_count` shards by their id. Leaders record their
+    fencing token in the database when elected and in every transaction
+    enqueuing jobs, a leader whose token is older stops.
     """
 
     PROCESS_TITLE = 'frequency task checker'
     PROCESS_TITLE_SHORT = 'FTC'
 
-    def __init__(self, pid_path='frequency.pid', interval=60):
+    def __init__(self, pid_path='frequency.pid', interval=60, **kwargs):
         """
         Constructor for FrequencyTaskChecker class.
 
         :param interval: Seconds the checker will sleep throughout idle time.
         :type interval: int
+        :param kwargs:
+            lease_seconds: Seconds the leader lock is held without renew.
+            shard_index: Shard of schedules checked by this checker.
+            shard_count: Number of shards.
+            jitter_seconds: Window the runs are spread over by job.
         """
         Helpers.Daemonize.__init__(self, pid_path)
         self.interval = interval
+        self.shard_index = kwargs.get('shard_index', 0)
+        self.shard_count = kwargs.get('shard_count', 1)
+        self.jitter_seconds = kwargs.get('jitter_seconds', 0)
+        self.rate_key = 'dancecats:metrics:ftc:{index}:{count}'.format(
+            index=self.shard_index,
+            count=self.shard_count
+        )
+        self.leader_lock = LeaderLock(
+            'ftc:{index}:{count}'.format(index=self.shard_index,
+                                         count=self.shard_count),
+            kwargs.get('lease_seconds', 30)
+        )
+        self.reset_schedules()
 
     def run(self):
         """
         This method will check and enqueue scheduled jobs
         when the running time will come. After that sleep
-        for `interval` seconds and repeat.
+        until the next running time and repeat.
         """
         atexit.register(self._exit_handler)
         signal.signal(signal.SIGINT, self._exit_handler)
@@ -53,66 +81,283 @@ class FrequencyTaskChecker(Helpers.Daemonize):
 
         while True:
             try:
-                self.task_checker()
-                Helpers.fq_sleep(
-                    self.interval - Helpers.Timer().get_total_seconds()
-                )
+                if self.elect():
+                    self.task_checker()
+                with app.app_context():
+                    enqueue_parked_jobs(rdb.connection)
+                Helpers.fq_sleep(self.seconds_to_next_run())
             except Exception as e:
                 print('[{0}] {1}'.format(self.PROCESS_TITLE, e))
                 self._remove_zombie_process()
                 break
         self._exit_handler()
 
+    def _exit_handler(self, *args):
+        """Give up the leader lock before quiting the process."""
+        try:
+            with app.app_context():
+                self.leader_lock.release(rdb.connection)
+        except Exception as e:
+            print('[{0}] {1}'.format(self.PROCESS_TITLE, e))
+        Helpers.Daemonize._exit_handler(self, *args)
+
+    def elect(self):
+        """
+        Acquire or renew the leader lock of the shard.
+
+        The heap is dropped whenever the lock is not held, a new
+        leader loads all its schedules again.
+
+        :return: True if this checker is the leader.
+        """
+        token = self.leader_lock.token
+        with app.app_context():
+            if self.leader_lock.acquire(rdb.connection) == token and \
+                    token is not None:
+                return True
+
+        self.reset_schedules()
+        if self.leader_lock.is_leader:
+            print(
+                "[FQ] Became leader of shard {index} with token {token}".
+                format(index=self.shard_index, token=self.leader_lock.token)
+            )
+            # Fence older leaders out right away.
+            FencingToken.seed(self.leader_lock.key)
+            if not self.fence():
+                self.step_down()
+                return False
+            db.session.commit()
+        return self.leader_lock.is_leader
+
+    def reset_schedules(self):
+        """Drop the heap, all schedules are loaded on the next refresh."""
+        self._heap = []
+        self._next_runs = {}
+        self._refreshed_on = None
+
+    def in_shard(self, schedule_id_column):
+        """Return the filter of schedule ids checked by this checker."""
+        return schedule_id_column % self.shard_count == self.shard_index
+
+    def fence(self):
+        """
+        Record the leader's token in the current transaction.
+
+        Never fenced when running without leader election.
+
+        :return: True if no newer leader of the shard was recorded.
+        """
+        if not self.leader_lock.is_leader:
+            return True
+        return FencingToken.check(self.leader_lock.key,
+                                  self.leader_lock.token)
+
+    def step_down(self):
+        """Roll back and give up the leadership after being fenced."""
+        print("[FQ] Lost leadership of shard {index}, skip enqueuing.".
+              format(index=self.shard_index))
+        db.session.rollback()
+        self.leader_lock.token = None
+        self.reset_schedules()
+
+    def push_schedule(self, schedule):
+        """
+        Put a schedule into the heap or remove it if it is inactive.
+
+        Schedules are ordered by their next run plus their second offset
+        and jitter. Heap entries are not removed right away, an entry is
+        outdated when its time is not the schedule's run time anymore.
+        """
+        if not schedule.is_active or schedule.next_run is None:
+            self._next_runs.pop(schedule.schedule_id, None)
+            return
+
+        run_time = schedule.get_run_time(self.jitter_seconds)
+        if self._next_runs.get(schedule.schedule_id) != run_time:
+            self._next_runs[schedule.schedule_id] = run_time
+            heapq.heappush(self._heap, (run_time, schedule.schedule_id))
+
+    def refresh_schedules(self):
+        """
+        Load schedules which changed since the last refresh.
+
+        All active schedules are loaded on the first refresh. Changes
+        are looked back for `interval` seconds more to catch
+        transactions which were committed after the last refresh.
+        """
+        db.session.commit()
+        refreshing_on = datetime.datetime.now()
+
+        schedules = Schedule.query.filter(
+            self.in_shard(Schedule.schedule_id)
+        )
+        if self._refreshed_on is None:
+            schedules = schedules.filter(Schedule.is_active).all()
+        else:
+            schedules = schedules.filter(
+                Schedule.last_updated >= self._refreshed_on -
+                dateutil_relativedelta(seconds=self.interval)
+            ).all()
+
+        for schedule in schedules:
+            self.push_schedule(schedule)
+        self._refreshed_on = refreshing_on
+
+    def pop_due_schedules(self, cur_time):
+        """Pop ids of schedules whose next run is not after cur_time."""
+        due_schedule_ids = []
+        while self._heap and self._heap[0][0] <= cur_time:
+            next_run, schedule_id = heapq.heappop(self._heap)
+            if self._next_runs.get(schedule_id) == next_run:
+                due_schedule_ids.append(schedule_id)
+        return due_schedule_ids
+
+    def seconds_to_next_run(self):
+        """
+        Return seconds until the earliest next run.
+
+        At most interval, and a third of the leader lock's lease
+        so the lease is renewed in time.
+        """
+        max_seconds = min(self.interval,
+                          self.leader_lock.lease_seconds / 3.0)
+        while self._heap and \
+                self._next_runs.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+        if not self._heap:
+            return max_seconds
+
+        seconds = (self._heap[0][0] -
+                   datetime.datetime.now()).total_seconds()
+        return max(0, min(max_seconds, seconds))
+
     def task_checker(self):
         """
         This method will check and enqueue scheduled jobs for run method.
+
+        Schedules which were missed for more than `interval` seconds,
+        while the checker was stopped, are moved to their next run
+        without being enqueued.
         """
         cur_time = datetime.datetime.now()
-        if cur_time.second < 2:
-            time.sleep(2 - cur_time.second)
         print(
             "[FQ] Checking and scheduling at {start_time}".
             format(start_time=cur_time)
         )
 
-        next_schedules = Schedule.query.filter(
-            Schedule.is_active,
-            Schedule.next_run >= cur_time,
-            Schedule.next_run < cur_time + dateutil_relativedelta(
-                seconds=self.interval
-            )
+        self.refresh_schedules()
+        cur_time = datetime.datetime.now()
+
+        due_schedule_ids = self.pop_due_schedules(cur_time)
+        if not due_schedule_ids:
+            return
+
+        # Fenced before reading the due schedules, so they are read
+        # after the transactions of older leaders ended.
+        if not self.fence():
+            self.step_down()
+            return
+
+        due_schedules = Schedule.query.filter(
+            Schedule.schedule_id.in_(due_schedule_ids)
         ).all()
+        for schedule_id in set(due_schedule_ids) - \
+                set([schedule.schedule_id for schedule in due_schedules]):
+            self._next_runs.pop(schedule_id, None)
 
-        with app.app_context():
-            for next_schedule in next_schedules:
+        trackers = []
+        updated_schedules = []
+        for next_schedule in due_schedules:
+            if not next_schedule.is_active or \
+                    next_schedule.get_run_time(self.jitter_seconds) > \
+                    cur_time:
+                self.push_schedule(next_schedule)
+                continue
+
+            late_seconds = int((
+                cur_time - next_schedule.get_run_time(self.jitter_seconds)
+            ).total_seconds())
+            if late_seconds > self.interval:
+                print(
+                    "[FQ] Schedule {schedule_id} missed its run at "
+                    "{next_run}.".format(
+                        schedule_id=next_schedule.schedule_id,
+                        next_run=next_schedule.next_run
+                    )
+                )
+                # Move to the first run after this second.
+                next_schedule.update_next_run(validated=True, interval=1)
+            else:
                 if next_schedule.Job.is_active:
-                    tracker = TrackJobRun(job_id=next_schedule.Job.job_id,
-                                          schedule_id=next_schedule.schedule_id
-                                          )
-                    db.session.add(tracker)
-                    db.session.commit()
-
-                    queue = rdb.queue['default']
-                    queue.enqueue(
-                        f=job_worker_query, kwargs={
-                            'job_id': next_schedule.Job.job_id,
-                            'tracker_id': tracker.track_job_run_id
-                        },
-                        timeout=app.config.get(
-                            'JOB_WORKER_EXECUTE_TIMEOUT', 3600
-                        ),
-                        ttl=app.config.get(
-                            'JOB_WORKER_ENQUEUE_TIMEOUT', 1800
-                        ),
-                        result_ttl=app.config.get(
-                            'JOB_RESULT_VALID_SECONDS', 86400
-                        ),
-                        job_id="{tracker_id}".format(
-                            tracker_id=tracker.track_job_run_id
-                        )
+                    trackers.append(
+                        TrackJobRun(job_id=next_schedule.job_id,
+                                    schedule_id=next_schedule.schedule_id,
+                                    fencing_token=self.leader_lock.token)
                     )
-
+                # Move to the first run after the one which is enqueued,
+                # the offset and jitter may have passed the next minute.
                 next_schedule.update_next_run(
                     validated=True,
-                    interval=self.interval)
-                db.session.commit()
+                    interval=1 - int((
+                        cur_time - next_schedule.next_run
+                    ).total_seconds())
+                )
+            updated_schedules.append(next_schedule)
+
+        # Trackers, next runs and the fencing token are written
+        # in the same transaction.
+        db.session.add_all(trackers)
+        db.session.commit()
+
+        for next_schedule in updated_schedules:
+            self.push_schedule(next_schedule)
+
+        if trackers:
+            with app.app_context():
+                self.enqueue_trackers(trackers)
+                self.record_enqueue_rate(rdb.connection, len(trackers))
+
+    def record_enqueue_rate(self, connection, enqueued_count):
+        """
+        Update the smoothed rate of enqueued jobs of the shard.
+
+        The rate is an exponentially weighted moving average in jobs
+        per second over FREQUENCY_RATE_WINDOW_SECONDS seconds, stored
+        in Redis with the time it was updated.
+
+        :param connection: Redis connection.
+        :param enqueued_count: Number of jobs enqueued now.
+        """
+        now = time.time()
+        window = app.config.get('FREQUENCY_RATE_WINDOW_SECONDS', 300)
+        connection.hmset(self.rate_key, {
+            'rate': self.get_enqueue_rate(connection, now) +
+            float(enqueued_count) / window,
+            'updatedOn': now
+        })
+
+    def get_enqueue_rate(self, connection, now=None):
+        """
+        Return the smoothed rate of enqueued jobs of the shard.
+
+        :param connection: Redis connection.
+        :param now: Epoch time the rate is decayed to, default is now.
+        :return: Jobs per second.
+        """
+        rate, updated_on = connection.hmget(self.rate_key,
+                                            'rate', 'updatedOn')
+        if updated_on is None:
+            return 0.0
+
+        if now is None:
+            now = time.time()
+        window = app.config.get('FREQUENCY_RATE_WINDOW_SECONDS', 300)
+        return float(rate) * \
+            math.exp(-max(0.0, now - float(updated_on)) / window)
+
+    @staticmethod
+    def enqueue_trackers(trackers):
+        """Enqueue the tracked runs in one Redis round trip."""
+        enqueue_query_jobs(trackers)
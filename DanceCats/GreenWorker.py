@@ -0,0 +1,89 @@
+"""
+Docstring for DanceCats.GreenWorker module.
+
+This module contains GreenWorker class, an RQ worker which runs many
+jobs concurrently in one process with eventlet green threads. Query jobs
+spend most of their time waiting on the databases, so one process can
+drive many of them while the connections' semaphores bound the load
+on each database.
+"""
+
+import eventlet
+from eventlet import tpool
+from rq import Worker
+from rq.timeouts import BaseDeathPenalty, JobTimeoutException
+from .DatabaseConnector import DatabaseConnector
+
+
+def patch_drivers():
+    """
+    Make the database drivers cooperative.
+
+    Must be called before the worker starts. Sockets used by MySQL
+    Connector and Redis are green after monkey patching, psycopg2 waits
+    through eventlet's hub and pymssql, which blocks inside C code,
+    runs in eventlet's thread pool.
+    """
+    eventlet.monkey_patch()
+
+    from eventlet.support.psycopg2_patcher import make_psycopg_green
+    make_psycopg_green()
+
+    DatabaseConnector.thread_pool = tpool
+
+
+class GreenDeathPenalty(BaseDeathPenalty):
+    """Stop a job which runs too long in its own green thread."""
+
+    def setup_death_penalty(self):
+        """Raise JobTimeoutException in the job after the timeout."""
+        self._green_timeout = eventlet.Timeout(
+            self._timeout,
+            JobTimeoutException(
+                'Job exceeded maximum timeout value '
+                '({0} seconds)'.format(self._timeout)
+            )
+        )
+
+    def cancel_death_penalty(self):
+        """Cancel the timeout of the job."""
+        self._green_timeout.cancel()
+
+
+class GreenWorker(Worker):
+    """
+    GreenWorker class.
+
+    Instead of forking a work horse for every job, jobs are performed
+    in a pool of green threads. When the pool is full the worker waits
+    for a free green thread before dequeuing more jobs.
+    """
+
+    death_penalty_class = GreenDeathPenalty
+
+    def __init__(self, queues, pool_size=100, **kwargs):
+        """
+        Constructor for GreenWorker class.
+
+        :param queues: RQ queues to listen to, in order of priority.
+        :param pool_size: Number of jobs run at the same time.
+        :param kwargs: RQ Worker's keyword arguments.
+        """
+        Worker.__init__(self, queues, **kwargs)
+        self.pool = eventlet.GreenPool(pool_size)
+
+    def execute_job(self, job, queue):
+        """Perform the job in a green thread of the pool."""
+        self.set_state('busy')
+        self.pool.spawn_n(self.perform_job, job, queue)
+
+    def work(self, burst=False, logging_level="INFO"):
+        """
+        Start the work loop, wait for the running jobs when it stops.
+
+        :return: True if any job was performed.
+        """
+        try:
+            return Worker.work(self, burst, logging_level)
+        finally:
+            self.pool.waitall()
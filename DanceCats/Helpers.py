@@ -2,17 +2,23 @@
 
 from decimal import Decimal
 import datetime
+import calendar
 import time
 import base64
 import hashlib
 import uuid
 import re
+import csv
+import zlib
+from StringIO import StringIO
 import psutil
 import os
 from multiprocessing import Process
 import sys
 from Crypto import Random
 from Crypto.Cipher import ARC4, AES
+from dateutil.relativedelta import relativedelta
+from . import Constants
 
 
 def encrypt_password(password):
@@ -202,6 +208,72 @@ def py2sql_type_convert(obj):
     return obj
 
 
+def csv_value(obj):
+    """Given any object, return its value as a CSV cell."""
+    if obj is None:
+        return ''
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    return obj
+
+
+def iter_csv(header, chunks):
+    """
+    Yield a result as CSV text, one piece per chunk of rows.
+
+    :param header: Columns' name.
+    :param chunks: Iterable of lists of rows.
+    """
+    output = StringIO()
+    writer = csv.writer(output)
+
+    writer.writerow([csv_value(value) for value in header])
+    yield output.getvalue()
+
+    for rows in chunks:
+        output.seek(0)
+        output.truncate()
+        writer.writerows([[csv_value(value) for value in row]
+                          for row in rows])
+        yield output.getvalue()
+
+
+def iter_json(header, chunks, dumps):
+    """
+    Yield a result as a JSON object of header and rows.
+
+    :param header: Columns' name.
+    :param chunks: Iterable of lists of rows.
+    :param dumps: Function used to serialize values to JSON.
+    """
+    yield '{"header": ' + dumps(list(header)) + ', "rows": ['
+    separator = ''
+    for rows in chunks:
+        if rows:
+            yield separator + ', '.join([dumps(list(row)) for row in rows])
+            separator = ', '
+    yield ']}'
+
+
+def iter_gzip(pieces, level=6):
+    """
+    Compress pieces of data into a gzip stream.
+
+    Compressed data is flushed after every piece so nothing waits
+    for the end of the stream to be sent.
+
+    :param pieces: Iterable of byte strings.
+    :param level: Compression level.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        data = compressor.compress(piece) + \
+            compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 def is_in_range(value, floor, cell):
     """
     Given three integer number x, n, m with n <= m.
@@ -233,6 +305,124 @@ def validate_day_of_month(value):
     return is_in_range(value, 1, 31)
 
 
+def validate_second_offset(value):
+    """Validate if a number is second of a minute."""
+    return is_in_range(value, 0, 59)
+
+
+def spread_seconds(key, window):
+    """
+    Return a stable number of seconds of a key inside a window.
+
+    Keys are hashed so runs of different jobs scheduled at the same
+    minute are spread over the window, always the same way for a key.
+
+    :param key: Key to be spread, job's id for schedules.
+    :param window: Seconds the keys are spread over.
+    :return: Integer from 0 to window.
+    """
+    if not window:
+        return 0
+    digest = hashlib.md5(str(key).encode()).hexdigest()
+    return int(digest[:8], 16) % (int(window) + 1)
+
+
+SCHEDULE_STEPS = {
+    Constants.SCHEDULE_HOURLY: datetime.timedelta(hours=1),
+    Constants.SCHEDULE_DAILY: datetime.timedelta(days=1),
+    Constants.SCHEDULE_WEEKLY: datetime.timedelta(weeks=1)
+}
+
+
+def timedelta_microseconds(delta):
+    """Return a timedelta as an exact number of microseconds."""
+    return (delta.days * 86400 + delta.seconds) * 1000000 + \
+        delta.microseconds
+
+
+def monthly_run_time(first_run, day_of_month, months):
+    """
+    Return the run time of a monthly schedule some months after its first.
+
+    Stepping one month at a time clips the day to the shortest month
+    passed through, so the day is the smallest last day of the months
+    on the way. Two Februaries are always passed in 25 months so the
+    day does not change after them.
+
+    :param first_run: First run time, its day is already clipped.
+    :param day_of_month: Scheduled day of month.
+    :param months: Number of months after the first run.
+    """
+    day = day_of_month
+    for month_index in range(0, min(months, 24) + 1):
+        year, month = divmod(first_run.month - 1 + month_index, 12)
+        day = min(day, calendar.monthrange(first_run.year + year,
+                                           month + 1)[1])
+
+    year, month = divmod(first_run.month - 1 + months, 12)
+    return first_run.replace(year=first_run.year + year,
+                             month=month + 1,
+                             day=day)
+
+
+def next_run_time(schedule_type, now, next_check, **kwargs):
+    """
+    Return the first run time of a schedule which is after next_check.
+
+    Runs are counted from the current hour, day, week or month of now
+    with the seconds set to zero.
+
+    :param schedule_type: Hourly, daily, weekly or monthly.
+    :param now: Current time.
+    :param next_check: Time which the run must be after.
+    :param kwargs:
+        minute_of_hour, hour_of_day, day_of_week, day_of_month
+        of the schedule.
+    :return: Next run time.
+    """
+    minute_of_hour = kwargs.get('minute_of_hour', 0)
+    hour_of_day = kwargs.get('hour_of_day', 0)
+    first_run = now.replace(second=0)
+
+    if schedule_type == Constants.SCHEDULE_HOURLY:
+        first_run += relativedelta(minute=minute_of_hour)
+
+    elif schedule_type == Constants.SCHEDULE_DAILY:
+        first_run += relativedelta(minute=minute_of_hour,
+                                   hour=hour_of_day)
+
+    elif schedule_type == Constants.SCHEDULE_WEEKLY:
+        first_run += relativedelta(minute=minute_of_hour,
+                                   hour=hour_of_day,
+                                   weekday=kwargs.get('day_of_week', 0))
+
+    elif schedule_type == Constants.SCHEDULE_MONTHLY:
+        day_of_month = kwargs.get('day_of_month', 1)
+        first_run += relativedelta(minute=minute_of_hour,
+                                   hour=hour_of_day,
+                                   day=day_of_month)
+        if next_check < first_run:
+            return first_run
+
+        months = (next_check.year - first_run.year) * 12 + \
+            next_check.month - first_run.month
+        run_time = monthly_run_time(first_run, day_of_month, months)
+        if next_check >= run_time:
+            run_time = monthly_run_time(first_run, day_of_month, months + 1)
+        return run_time
+
+    else:
+        raise ValueError('Schedule type has no next run time!')
+
+    if next_check < first_run:
+        return first_run
+
+    step = SCHEDULE_STEPS[schedule_type]
+    steps = timedelta_microseconds(next_check - first_run) // \
+        timedelta_microseconds(step) + 1
+    return first_run + step * steps
+
+
 def generate_runtime():
     """
     Generate an epoch timestamp in milliseconds at the this function run.
@@ -6,13 +6,24 @@ passed to the RQ worker to run in the background.
 """
 
 from __future__ import print_function
+import time
+import datetime
 import traceback
 from flask_mail import Message
-from StringIO import StringIO
-from pyexcel.sheets import Sheet
-from DanceCats.DatabaseConnector \
-    import DatabaseConnector, DatabaseConnectorException
+from rq import Queue
+from rq.job import JobStatus
+from rq.utils import utcnow
+from DanceCats.DatabaseConnector import DatabaseConnectorException
+from .ConnectionPool import connection_pool
 from .Helpers import Timer
+from .Semaphore import Semaphore
+from .SingleFlight import SingleFlight
+from . import ResultStorage
+from . import ExportCache
+from . import QueryCache
+
+
+PARKED_JOBS_KEY = 'dancecats:parked_query_jobs'
 
 
 def job_worker_send_mail_result(tracker_id, job_name, recipients):
@@ -32,19 +43,22 @@ def job_worker_send_mail_result(tracker_id, job_name, recipients):
         )
     )
 
-    from DanceCats import app, rdb, mail
-
-    with app.app_context():
-        queue = rdb.queue['default']
-        result = queue.fetch_job(str(tracker_id)).result
-
-        results_file = StringIO()
-        results_file_data = [list(result['header'])]
+    from DanceCats import create_app, mail
+    from .Models import TrackJobRun
 
-        for row in result['rows']:
-            results_file_data.append(list(row))
+    with create_app('worker').app_context():
+        export_path = ExportCache.get_export(
+            TrackJobRun.query.get(tracker_id), 'xlsx'
+        )
+        if export_path is None:
+            print(
+                "Result of tracker {tracker_id} is not available, "
+                "skip sending it".format(tracker_id=tracker_id)
+            )
+            return
 
-        Sheet(results_file_data).save_to_memory("xlsx", results_file)
+        with open(export_path, 'rb') as export_file:
+            export_data = export_file.read()
 
         message = Message(
             "Job {job_name} ran successfully on DanceCats!".format(
@@ -63,7 +77,7 @@ def job_worker_send_mail_result(tracker_id, job_name, recipients):
             content_type="application/"
                          "vnd.openxmlformats-officedocument."
                          "spreadsheetml.sheet",
-            data=results_file.getvalue()
+            data=export_data
         )
 
         mail.send(message)
@@ -72,10 +86,28 @@ def job_worker_send_mail_result(tracker_id, job_name, recipients):
 def job_worker_query(job_id, tracker_id):
     """Enqueue this function for querying database.
 
-    For now only focus on execute and save results to redis.
+    The result is written batch by batch to the result storage
+    and its location is saved on the tracker. When the job's connection
+    already runs its maximum of jobs, the job is parked and enqueued
+    again after JOB_WORKER_RETRY_DELAY_SECONDS seconds. Jobs with a result
+    cache TTL are served from the query cache while their result is cached.
+    Trackers which joined the job's flight get the same result.
+    :param job_id: Id of job that will be run.
+    :param tracker_id: Job tracker id of tracking object.
+    :return: Location of the result.
+    """
+    from DanceCats import create_app
+
+    with create_app('worker').app_context():
+        return run_query_job(job_id, tracker_id)
+
+
+def run_query_job(job_id, tracker_id):
+    """Run a query job, need an application context.
+
     :param job_id: Id of job that will be run.
     :param tracker_id: Job tracker id of tracking object.
-    :return: Query result.
+    :return: Location of the result.
     """
     timer = Timer()
 
@@ -85,57 +117,104 @@ def job_worker_query(job_id, tracker_id):
     )
 
     from .Models import QueryDataJob, TrackJobRun
-    from DanceCats import app, db, rdb, config, \
+    from DanceCats import db, rdb, config, \
         Constants
 
+    redis_connection = rdb.connection
     job = QueryDataJob.query.get(job_id)
-    job.update_executed_times()
-
     tracker = TrackJobRun.query.get(tracker_id)
-    tracker.start()
-    db.session.commit()
+    cache_writer = QueryCache.open_writer(
+        QueryCache.cache_key(job.connection_id, job.query_string),
+        job[Constants.JOB_FEATURE_RESULT_CACHE_SECONDS]
+        if Constants.JOB_FEATURE_RESULT_CACHE_SECONDS in job
+        else 0
+    )
+    # Results cached by jobs with a longer TTL may be older than this one.
+    cached_result = QueryCache.get(
+        redis_connection, cache_writer.key, cache_writer.ttl
+    ) if cache_writer.is_caching else None
+
+    # Cached results do not need a slot on the connection.
+    semaphore = connection_semaphore(job.Connection)
+    if cached_result is None and \
+            not semaphore.acquire(redis_connection, tracker_id):
+        print(
+            "Connection {connection_id} is busy, park tracker "
+            "{tracker_id}".format(connection_id=job.connection_id,
+                                  tracker_id=tracker_id)
+        )
+        retry_query_job(redis_connection, job, tracker)
+        return None
 
+    # The slot is released by the finally clause whatever happens next.
+    result_writer = None
     try:
-        db_connector = DatabaseConnector(
-            job.Connection.type,
-            job.Connection.db_config_generator(),
-            sql_data_style=False,
-            dict_format=False,
-            timeout=job[Constants.JOB_FEATURE_QUERY_TIME_OUT]
-            if Constants.JOB_FEATURE_QUERY_TIME_OUT in job
-            else config.get('DB_TIMEOUT', 0)
+        # The flight lasted as long as the job could wait in the queue,
+        # it now lasts as long as the job can run.
+        job_flight(job_id).renew(
+            redis_connection, tracker_id,
+            config.get('JOB_WORKER_EXECUTE_TIMEOUT', 3600)
         )
+        job.update_executed_times()
+        tracker.start()
+        db.session.commit()
 
-        db_connector.connect()
-        db_connector.execute(job.query_string)
-        results = {
-            'header': db_connector.columns_name,
-            'rows': db_connector.fetch_all()
-        }
-        db_connector.close()
+        if cached_result is not None:
+            print("Serve tracker {tracker_id} from the query cache".format(
+                tracker_id=tracker_id
+            ))
+            header, batches = cached_result
+            result_writer = ResultStorage.open_writer(tracker_id)
+            result_writer.write_header(header)
+            for rows in batches:
+                result_writer.write_rows(rows)
+        else:
+            with connection_pool.connector(
+                job.Connection,
+                sql_data_style=False,
+                dict_format=False,
+                timeout=job[Constants.JOB_FEATURE_QUERY_TIME_OUT]
+                if Constants.JOB_FEATURE_QUERY_TIME_OUT in job
+                else config.get('DB_TIMEOUT', 0),
+                batch_size=config.get('QUERY_FETCH_BATCH_SIZE', 1000),
+                server_side_cursor=job[
+                    Constants.JOB_FEATURE_SERVER_SIDE_CURSOR
+                ] if Constants.JOB_FEATURE_SERVER_SIDE_CURSOR in job
+                else False
+            ) as db_connector:
+                db_connector.execute(job.query_string)
+                result_writer = ResultStorage.open_writer(tracker_id)
+                result_writer.write_header(db_connector.columns_name)
+                cache_writer.write_header(db_connector.columns_name)
+                for rows in db_connector.iter_batches():
+                    result_writer.write_rows(rows)
+                    cache_writer.write_rows(rows)
+            cache_writer.close(redis_connection)
+        result_location = result_writer.close()
 
         tracker.complete(
             is_success=True,
-            run_duration=timer.get_total_milliseconds()
+            run_duration=timer.get_total_milliseconds(),
+            result_location=result_location
         )
         db.session.commit()
 
         if len(job.emails) > 0:
-            with app.app_context():
-                queue = rdb.queue['mailer']
-                queue.enqueue(
-                    f=job_worker_send_mail_result,
-                    kwargs={
-                        'tracker_id': tracker_id,
-                        'job_name': job.name,
-                        'recipients': job.recipients
-                    },
-                    job_id='mail_{tracker_id}'.format(tracker_id=tracker_id)
-                )
+            rdb.queue['mailer'].enqueue(
+                f=job_worker_send_mail_result,
+                kwargs={
+                    'tracker_id': tracker_id,
+                    'job_name': job.name,
+                    'recipients': job.recipients
+                },
+                job_id='mail_{tracker_id}'.format(tracker_id=tracker_id)
+            )
 
-        return results
+        return result_location
 
     except DatabaseConnectorException as exception:
+        if result_writer is not None:
+            result_writer.discard()
         tracker.complete(
             is_success=False,
             run_duration=timer.get_total_milliseconds(),
@@ -148,6 +227,9 @@ def job_worker_query(job_id, tracker_id):
         db.session.commit()
 
     except Exception as exception:
+        db.session.rollback()
+        if result_writer is not None:
+            result_writer.discard()
         tracker.complete(
             is_success=False,
             run_duration=timer.get_total_milliseconds(),
@@ -155,4 +237,323 @@ def job_worker_query(job_id, tracker_id):
         )
         db.session.commit()
 
+    finally:
+        semaphore.release(redis_connection, tracker_id)
+        complete_followers(redis_connection, tracker)
+        # A slot is free, parked jobs may get it.
+        enqueue_parked_jobs(redis_connection)
+
     return None
+
+
+def retry_query_job(redis_connection, job, tracker):
+    """
+    Park a job whose connection is busy to enqueue it again later.
+
+    The job keeps the enqueue timeout left since its tracker was
+    scheduled. It dies in the queue once its enqueue timeout is over,
+    and so do its followers.
+    Need an application context.
+    :param redis_connection: Redis connection.
+    :param job: QueryDataJob Model object.
+    :param tracker: Queued TrackJobRun Model object.
+    :return: True if the job was parked.
+    """
+    from DanceCats import db, config, Constants
+
+    db.session.rollback()
+    delay = config.get('JOB_WORKER_RETRY_DELAY_SECONDS', 1)
+    ttl = config.get('JOB_WORKER_ENQUEUE_TIMEOUT', 1800) - int((
+        datetime.datetime.now() - tracker.scheduled_on
+    ).total_seconds())
+    if ttl <= delay:
+        print("Give up tracker {tracker_id} after waiting for a slot".format(
+            tracker_id=tracker.track_job_run_id
+        ))
+        tracker.status = Constants.JOB_DIED_IN_QUEUE
+        tracker.error_string = \
+            'Connection {connection_id} stayed busy.'.format(
+                connection_id=job.connection_id
+            )
+        db.session.commit()
+        complete_followers(redis_connection, tracker)
+        return False
+
+    queue = Queue(query_queue_name(job.connection_id),
+                  connection=redis_connection)
+    park_query_job(
+        redis_connection, queue,
+        create_query_job(queue, job.job_id, tracker.track_job_run_id,
+                         ttl=ttl),
+        delay
+    )
+    return True
+
+
+def park_query_job(redis_connection, queue, rq_job, delay):
+    """
+    Save an RQ job without enqueuing it until delay seconds passed.
+
+    Parked jobs are kept in a sorted set by the time they are due,
+    `enqueue_parked_jobs` enqueues them. A parked job which is never
+    enqueued expires with its RQ job.
+    :param redis_connection: Redis connection.
+    :param queue: RQ queue the job will be enqueued to.
+    :param rq_job: RQ job created by `create_query_job`.
+    :param delay: Seconds the job stays parked.
+    """
+    with redis_connection.pipeline() as pipeline:
+        rq_job.save(pipeline=pipeline)
+        pipeline.zadd(PARKED_JOBS_KEY, time.time() + delay,
+                      '{queue_name}:{rq_job_id}'.format(queue_name=queue.name,
+                                                        rq_job_id=rq_job.id))
+        pipeline.execute()
+
+
+def enqueue_parked_jobs(redis_connection, now=None):
+    """
+    Enqueue the parked jobs which are due.
+
+    Called by workers when they release a connection's slot and by the
+    frequency task checker on every wake up. Each job is enqueued by
+    the process which removed it from the parked jobs.
+    :param redis_connection: Redis connection.
+    :param now: Timestamp the jobs are due by, default is now.
+    :return: List of enqueued RQ jobs.
+    """
+    if now is None:
+        now = time.time()
+
+    rq_jobs = []
+    for member in redis_connection.zrangebyscore(PARKED_JOBS_KEY,
+                                                 '-inf', now):
+        if not redis_connection.zrem(PARKED_JOBS_KEY, member):
+            continue
+        queue_name, rq_job_id = member.rsplit(':', 1)
+        queue = Queue(queue_name, connection=redis_connection)
+        rq_job = queue.fetch_job(rq_job_id)
+        if rq_job is not None:
+            rq_jobs.append(queue.enqueue_job(rq_job))
+    return rq_jobs
+
+
+def complete_followers(redis_connection, tracker):
+    """
+    Land the flight led by a tracker and complete its followers alike.
+
+    Followers share the tracker's result location.
+    Need an application context.
+    :param redis_connection: Redis connection.
+    :param tracker: Completed TrackJobRun Model object.
+    :return: List of completed followers.
+    """
+    from .Models import TrackJobRun
+    from DanceCats import db, Constants
+
+    follower_ids = job_flight(tracker.job_id).land(
+        redis_connection, tracker.track_job_run_id
+    )
+    if not follower_ids:
+        return []
+
+    followers = TrackJobRun.query.filter(
+        TrackJobRun.track_job_run_id.in_(
+            [int(follower_id) for follower_id in follower_ids]
+        )
+    ).all()
+    for follower in followers:
+        follower.ran_on = tracker.ran_on
+        follower.complete(
+            is_success=tracker.status == Constants.JOB_RAN_SUCCESS,
+            run_duration=tracker.duration,
+            error_string=tracker.error_string,
+            result_location=tracker.result_location
+        )
+    db.session.commit()
+    print(
+        "Completed trackers {follower_ids} with tracker {tracker_id}".format(
+            follower_ids=', '.join(follower_ids),
+            tracker_id=tracker.track_job_run_id
+        )
+    )
+    return followers
+
+
+def job_flight(job_id):
+    """
+    Return the flight which coalesces concurrent runs of a job.
+
+    A flight lasts until its leading run completes. It expires with the
+    leader's RQ job while the leader waits in the queue, after
+    JOB_WORKER_ENQUEUE_TIMEOUT seconds, then the leader renews it for
+    JOB_WORKER_EXECUTE_TIMEOUT seconds when it starts running.
+    :param job_id: Id of the Job.
+    :return: SingleFlight instance.
+    """
+    from DanceCats import config
+
+    return SingleFlight(
+        'job:{job_id}'.format(job_id=job_id),
+        lease_seconds=config.get('JOB_WORKER_ENQUEUE_TIMEOUT', 1800)
+    )
+
+
+def connection_semaphore(connection):
+    """
+    Return the semaphore bounding the running jobs of a connection.
+
+    :param connection: Connection Model object.
+    :return: Semaphore instance, without limit if connection is None.
+    """
+    from DanceCats import config
+
+    if connection is None:
+        return Semaphore('connection:none', 0)
+
+    limit = connection.max_concurrent_jobs
+    if limit is None:
+        limit = config.get('CONNECTION_MAX_CONCURRENT_JOBS', 4)
+    return Semaphore(
+        'connection:{connection_id}'.format(
+            connection_id=connection.connection_id
+        ),
+        limit,
+        lease_seconds=config.get('JOB_WORKER_EXECUTE_TIMEOUT', 3600)
+    )
+
+
+def query_queue_names():
+    """Return the names of the queues of query jobs."""
+    from DanceCats import config
+
+    queue_count = config.get('JOB_WORKER_QUERY_QUEUES', 1)
+    if queue_count <= 1:
+        return ['default']
+    return ['query_{index}'.format(index=index)
+            for index in range(0, queue_count)]
+
+
+def query_queue_name(connection_id):
+    """
+    Return the name of the queue of jobs querying a connection.
+
+    Connections are split over JOB_WORKER_QUERY_QUEUES queues by their id.
+    """
+    queue_names = query_queue_names()
+    return queue_names[(connection_id or 0) % len(queue_names)]
+
+
+def create_query_job(queue, job_id, tracker_id, rq_job_id=None, ttl=None):
+    """
+    Create an RQ job running job_worker_query without enqueuing it.
+
+    :param queue: RQ queue the job will be enqueued to.
+    :param job_id: Id of job that will be run.
+    :param tracker_id: Job tracker id of tracking object.
+    :param rq_job_id: Id of the RQ job, a random one if None.
+    :param ttl: Seconds the job lives in the queue,
+        default is JOB_WORKER_ENQUEUE_TIMEOUT.
+    :return: RQ job.
+    """
+    from DanceCats import config
+
+    return queue.job_class.create(
+        job_worker_query,
+        kwargs={
+            'job_id': job_id,
+            'tracker_id': tracker_id
+        },
+        connection=queue.connection,
+        timeout=config.get('JOB_WORKER_EXECUTE_TIMEOUT', 3600),
+        ttl=ttl if ttl is not None
+        else config.get('JOB_WORKER_ENQUEUE_TIMEOUT', 1800),
+        result_ttl=config.get('JOB_RESULT_VALID_SECONDS', 86400),
+        status=JobStatus.QUEUED,
+        id=rq_job_id,
+        origin=queue.name
+    )
+
+
+def enqueue_query_jobs(trackers):
+    """Enqueue job_worker_query for trackers in two Redis round trips.
+
+    Each job goes to the queue of its connection. A tracker whose job
+    is already queued or running joins that run's flight and is
+    completed with its result instead of being enqueued. Flights led by
+    the trackers are landed again if they cannot be enqueued.
+    Need an application context.
+    :param trackers: List of committed TrackJobRun Model objects.
+    :return: List of enqueued RQ jobs.
+    """
+    from DanceCats import rdb
+    from .Models import QueryDataJob
+
+    if not trackers:
+        return []
+
+    with rdb.connection.pipeline(transaction=False) as pipeline:
+        for tracker in trackers:
+            job_flight(tracker.job_id).join(pipeline,
+                                            tracker.track_job_run_id)
+        leaders = pipeline.execute()
+    trackers = [tracker for tracker, leader in zip(trackers, leaders)
+                if leader is None]
+    if not trackers:
+        return []
+
+    try:
+        job_connection_ids = dict(QueryDataJob.query.with_entities(
+            QueryDataJob.job_id,
+            QueryDataJob.connection_id
+        ).filter(
+            QueryDataJob.job_id.in_(
+                set(tracker.job_id for tracker in trackers)
+            )
+        ).all())
+        return push_query_jobs(trackers, job_connection_ids)
+    except Exception:
+        for tracker in trackers:
+            job_flight(tracker.job_id).land(rdb.connection,
+                                            tracker.track_job_run_id)
+        raise
+
+
+def push_query_jobs(trackers, job_connection_ids):
+    """
+    Enqueue job_worker_query for trackers in one Redis round trip.
+
+    :param trackers: List of committed TrackJobRun Model objects.
+    :param job_connection_ids: Dictionary of jobs' connection ids.
+    :return: List of enqueued RQ jobs.
+    """
+    from DanceCats import rdb
+
+    queues = {}
+    rq_jobs = []
+    with rdb.connection.pipeline() as pipeline:
+        for tracker in trackers:
+            queue_name = query_queue_name(
+                job_connection_ids.get(tracker.job_id)
+            )
+            if queue_name not in queues:
+                queues[queue_name] = Queue(queue_name,
+                                           connection=rdb.connection)
+                pipeline.sadd(queues[queue_name].redis_queues_keys,
+                              queues[queue_name].key)
+            queue = queues[queue_name]
+
+            rq_job = create_query_job(
+                queue, tracker.job_id, tracker.track_job_run_id,
+                rq_job_id="{tracker_id}".format(
+                    tracker_id=tracker.track_job_run_id
+                )
+            )
+            rq_job.enqueued_at = utcnow()
+            # Save the job before pushing its id in the same pipeline,
+            # so workers never pop an id without its job. RQ's
+            # enqueue_job pushes the id outside of the given pipeline.
+            rq_job.save(pipeline=pipeline)
+            queue.push_job_id(rq_job.id, pipeline=pipeline)
+            rq_jobs.append(rq_job)
+        pipeline.execute()
+    return rq_jobs
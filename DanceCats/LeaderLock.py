@@ -0,0 +1,88 @@
+"""
+Docstring for DanceCats.LeaderLock module.
+
+This module contains LeaderLock class, a lease lock in Redis which
+elects one leader among processes running the same daemon.
+Every Redis connection used with a lock must reach the same Redis server.
+"""
+
+import os
+import socket
+import uuid
+
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLock(object):
+    """
+    LeaderLock class.
+
+    The leader holds the lock for `lease_seconds` and has to renew
+    it before the lease ends. Every acquisition gets a fencing token
+    which is larger than the tokens of all previous leaders, writes
+    tagged with an older token come from a leader that lost its lease.
+    """
+
+    KEY_FORMAT = 'dancecats:leader:{name}'
+
+    def __init__(self, name, lease_seconds=30):
+        """
+        Constructor for LeaderLock class.
+
+        :param name: Name of the lock, one leader is elected per name.
+        :param lease_seconds: Seconds a leader keeps the lock without renew.
+        """
+        self.key = self.KEY_FORMAT.format(name=name)
+        self.token_key = self.key + ':token'
+        self.lease_seconds = lease_seconds
+        self.owner = '{host}:{pid}:{uid}'.format(
+            host=socket.gethostname(),
+            pid=os.getpid(),
+            uid=uuid.uuid4().hex
+        )
+        self.token = None
+
+    @property
+    def is_leader(self):
+        """Check if the lock was held on the last acquire call."""
+        return self.token is not None
+
+    def acquire(self, connection):
+        """
+        Acquire the lock or renew its lease if it is already held.
+
+        :param connection: Redis connection.
+        :return: Fencing token if this process is the leader else None.
+        """
+        lease_milliseconds = int(self.lease_seconds * 1000)
+
+        if self.token is not None:
+            if not connection.eval(RENEW_SCRIPT, 1, self.key,
+                                   self.owner, lease_milliseconds):
+                self.token = None
+
+        if self.token is None and \
+                connection.set(self.key, self.owner,
+                               px=lease_milliseconds, nx=True):
+            self.token = connection.incr(self.token_key)
+
+        return self.token
+
+    def release(self, connection):
+        """Release the lock if it is still held by this process."""
+        if self.token is not None:
+            connection.eval(RELEASE_SCRIPT, 1, self.key, self.owner)
+            self.token = None
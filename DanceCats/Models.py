@@ -6,16 +6,21 @@ SQLAlchemy's Base Model.
 """
 
 from __future__ import unicode_literals
+import time
 import datetime
 from dateutil.relativedelta import relativedelta
 from flask_login import UserMixin
-from sqlalchemy import and_, not_
+from sqlalchemy import and_, inspect, true, false
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.collections import attribute_mapped_collection
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.associationproxy import association_proxy
 from DanceCats import db, config
 from . import Helpers
 from . import Constants
+from . import ResultStorage
+from . import ExportCache
+from . import Cron
 
 
 # pylint: disable=R0902
@@ -104,8 +109,8 @@ class User(UserMixin, db.Model):
                              default=datetime.datetime.now)
     version = db.Column(db.Integer, index=False, nullable=False)
 
-    connections = db.relationship('Connection', backref='User', lazy='joined')
-    jobs = db.relationship('Job', backref='User', lazy='joined')
+    connections = db.relationship('Connection', backref='User', lazy='select')
+    jobs = db.relationship('Job', backref='User', lazy='select')
 
     def __init__(self, user_email, user_password):
         """
@@ -158,6 +163,8 @@ class Connection(db.Model):
     user_name = db.Column('userName', db.String(100), nullable=False)
     password = db.Column(db.TEXT, nullable=True)
     database = db.Column(db.String(100), nullable=False)
+    max_concurrent_jobs = db.Column('maxConcurrentJobs', db.Integer,
+                                    nullable=True)
     user_id = db.Column('userId', db.Integer,
                         db.ForeignKey('user.id'), nullable=False)
     last_updated = db.Column('lastUpdated',
@@ -166,7 +173,11 @@ class Connection(db.Model):
                              default=datetime.datetime.now)
     version = db.Column(db.Integer, index=True, nullable=False)
 
-    jobs = db.relationship('Job', backref='Connection', lazy='joined')
+    jobs = db.relationship('Job', backref='Connection', lazy='select')
+
+    # Generated configs of the process by Connection's id:
+    # ((last updated time, version), expired on, config).
+    _db_configs = {}
 
     def __init__(self, db_type, host, database, creator_user_id, **kwargs):
         """
@@ -185,6 +196,8 @@ class Connection(db.Model):
             port: Port of the database if different to the default port.
             user_name: User which is used to connect to the database.
             password: Password which is used to connect to the database.
+            max_concurrent_jobs: Number of jobs running on the database
+                at the same time, CONNECTION_MAX_CONCURRENT_JOBS if None.
         """
         if not db_type:
             raise TypeError("Connection's type cannot be empty or None.")
@@ -209,6 +222,7 @@ class Connection(db.Model):
             "{host} - {db}".format(host=host, db=database)
         )
         self.port = kwargs.get('port')
+        self.max_concurrent_jobs = kwargs.get('max_concurrent_jobs')
         self.encrypt_password(kwargs.get('password'))
         self.version = Constants.MODEL_CONNECTION_VERSION
 
@@ -224,7 +238,39 @@ class Connection(db.Model):
 
         Generate the database configuration which will
         be passed to DatabaseConnector class's constructor.
+        Configs of saved connections are kept by the process for
+        CONNECTION_CONFIG_CACHE_SECONDS seconds, so the password is not
+        decrypted on every use. Editing the Connection changes its last
+        updated time, the config is generated again then. Connections
+        with unsaved changes are not cached.
         """
+        cache_seconds = config.get('CONNECTION_CONFIG_CACHE_SECONDS', 300)
+        is_caching = bool(self.connection_id) and cache_seconds > 0 and \
+            not inspect(self).modified
+
+        cached = self._db_configs.get(self.connection_id) \
+            if is_caching else None
+        if cached is not None and \
+                cached[0] == (self.last_updated, self.version) and \
+                cached[1] > time.time():
+            return dict(cached[2])
+
+        db_config = self._generate_db_config()
+        if is_caching:
+            self._db_configs[self.connection_id] = (
+                (self.last_updated, self.version),
+                time.time() + cache_seconds,
+                dict(db_config)
+            )
+        return db_config
+
+    @classmethod
+    def forget_db_config(cls, connection_id):
+        """Drop the process' generated config of a Connection."""
+        cls._db_configs.pop(connection_id, None)
+
+    def _generate_db_config(self):
+        """Generate database config, decrypt and upgrade the password."""
         db_config = {
             'user': self.user_name,
             'host': self.host,
@@ -389,6 +435,9 @@ class QueryDataJob(Job):
         'polymorphic_identity': Constants.JOB_QUERY
     }
 
+    LIST_SORT_COLUMNS = ('name', 'connection_name',
+                         'user_email', 'last_updated')
+
     def __init__(self, name, query_string, user_id, **kwargs):
         """
         Constructor for QueryDataJob class.
@@ -423,6 +472,45 @@ class QueryDataJob(Job):
         """Check if the job is active or not."""
         return not not self.connection_id
 
+    @classmethod
+    def list_query(cls, sort_by='last_updated', descending=True):
+        """
+        Return the query of not deleted jobs for the Job listing.
+
+        Only the listed columns are loaded, the creator's email and the
+        connection's name are outer joined in the same query.
+
+        :param sort_by: One of LIST_SORT_COLUMNS.
+        :param descending: Sort in descending order.
+        :return: Query of rows with id, name, last_updated,
+                 connection_id, user_email and connection_name.
+        """
+        sort_column = {
+            'name': cls.name,
+            'connection_name': Connection.name,
+            'user_email': User.email,
+            'last_updated': cls.last_updated
+        }[sort_by]
+        order = (lambda column: column.desc()) if descending \
+            else (lambda column: column.asc())
+
+        return cls.query.with_entities(
+            cls.job_id.label('id'),
+            cls.name,
+            cls.last_updated,
+            cls.connection_id,
+            User.email.label('user_email'),
+            Connection.name.label('connection_name')
+        ).outerjoin(
+            User, cls.user_id == User.user_id
+        ).outerjoin(
+            Connection, cls.connection_id == Connection.connection_id
+        ).filter(
+            cls.is_deleted.is_(False)
+        ).order_by(
+            order(sort_column), order(cls.job_id)
+        )
+
 
 class Schedule(db.Model):
     """
@@ -435,6 +523,8 @@ class Schedule(db.Model):
             dayOfWeek: 0 - 6 as Monday to Sunday
         Monthly: use minuteOfHour, hourOfDay and dayOfMonth;
             dayOfMonth: 1-31
+        Cron: use cronExpression, its next occurrences are
+            materialized in schedule_occurrence table
         Run once: nextRun in the future
     """
 
@@ -456,6 +546,10 @@ class Schedule(db.Model):
                               default=Constants.SCHEDULE_ONCE,
                               nullable=False)
     next_run = db.Column('nextRun', db.DateTime, nullable=True)
+    second_offset = db.Column('secondOffset', db.SmallInteger,
+                              default=0, nullable=False)
+    cron_expression = db.Column('cronExpression', db.String(255),
+                                nullable=True)
     user_id = db.Column('userId', db.Integer,
                         db.ForeignKey('user.id'), nullable=False)
     created_on = db.Column('createdOn', db.DateTime,
@@ -468,6 +562,15 @@ class Schedule(db.Model):
                            default=False, nullable=False)
     version = db.Column(db.Integer, index=True, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_schedule_active_next_run',
+                 _is_active, is_deleted, next_run),
+    )
+
+    occurrences = db.relationship('ScheduleOccurrence',
+                                  order_by='ScheduleOccurrence.run_on',
+                                  cascade='all, delete-orphan')
+
     def __init__(self, job_id, start_time, user_id,
                  **kwargs):
         """
@@ -481,10 +584,14 @@ class Schedule(db.Model):
         :param kwargs:
             schedule_type: Schedule type, see in the class's docstring.
             is_active: This schedule is active or not.
+            cron_expression: Cron expression of cron schedules.
+            second_offset: Seconds after the run's minute to trigger.
         """
         self.job_id = job_id
         self.schedule_type = \
             kwargs.get('schedule_type', Constants.SCHEDULE_ONCE)
+        self.cron_expression = kwargs.get('cron_expression')
+        self.second_offset = kwargs.get('second_offset') or 0
         self._is_active = kwargs.get('is_active', False)
         interval = kwargs.get('interval', 60)
         self.update_start_time(start_time, interval=interval)
@@ -503,8 +610,8 @@ class Schedule(db.Model):
 
     @is_active.expression
     def is_active(self):
-        """Get Schedule's active status expression."""
-        return and_(self._is_active, not_(self.is_deleted))
+        """Get Schedule's active status expression, which can use indexes."""
+        return and_(self._is_active == true(), self.is_deleted == false())
 
     def validate(self):
         """
@@ -512,6 +619,9 @@ class Schedule(db.Model):
 
         :return: True if the schedule will be run on the feature else False.
         """
+        if not Helpers.validate_second_offset(self.second_offset or 0):
+            return False
+
         if self.schedule_type == Constants.SCHEDULE_ONCE:
             return self.next_run > datetime.datetime.now()
 
@@ -532,6 +642,13 @@ class Schedule(db.Model):
                 Helpers.validate_hour_of_day(self.hour_of_day) and \
                 Helpers.validate_day_of_month(self.day_of_month)
 
+        if self.schedule_type == Constants.SCHEDULE_CRON:
+            try:
+                Cron.compile_cron(self.cron_expression)
+            except Cron.CronExpressionError:
+                return False
+            return True
+
     def update_start_time(self, start_time, interval=60):
         """Update next run time on schedule updating."""
         if not isinstance(start_time, datetime.datetime):
@@ -543,10 +660,34 @@ class Schedule(db.Model):
         self.day_of_month = start_time.day
         self.next_run = start_time
 
-        if start_time < \
+        if self.schedule_type == Constants.SCHEDULE_CRON:
+            if not self.validate():
+                raise ValueError('Schedule is not valid!')
+            self.materialize_occurrences(
+                start_time - datetime.timedelta(minutes=1)
+            )
+            self.next_run = self.occurrences[0].run_on \
+                if self.occurrences else None
+        elif self.occurrences:
+            self.occurrences = []
+
+        if self.next_run is not None and start_time < \
                 datetime.datetime.now() + relativedelta(seconds=interval):
             self.update_next_run(validated=False)
 
+    def get_run_time(self, jitter_seconds=0):
+        """
+        Return the time the next run is triggered.
+
+        :param jitter_seconds:
+            Window the runs of different jobs are spread over.
+        :return: Next run plus second offset and the job's jitter.
+        """
+        return self.next_run + datetime.timedelta(
+            seconds=(self.second_offset or 0) +
+            Helpers.spread_seconds(self.job_id, jitter_seconds)
+        )
+
     def update_next_run(self, validated=False, interval=60):
         """Update the next time this job will be run."""
         if not validated:
@@ -558,47 +699,61 @@ class Schedule(db.Model):
         if self.schedule_type == Constants.SCHEDULE_ONCE:
             return
 
-        next_check = datetime.datetime.now() + relativedelta(seconds=interval)
-        if next_check <= self.next_run:
+        now = datetime.datetime.now()
+        next_check = now + relativedelta(seconds=interval)
+        if self.next_run is None or next_check <= self.next_run:
             return
 
-        next_run_time = datetime.datetime.now().replace(second=0)
-
-        if self.schedule_type == Constants.SCHEDULE_HOURLY:
-            next_run_time += relativedelta(
-                minute=self.minute_of_hour
+        if self.schedule_type == Constants.SCHEDULE_CRON:
+            next_run_time = self.next_cron_run(next_check)
+            if next_run_time is None:
+                return
+        else:
+            next_run_time = Helpers.next_run_time(
+                self.schedule_type, now, next_check,
+                minute_of_hour=self.minute_of_hour,
+                hour_of_day=self.hour_of_day,
+                day_of_week=self.day_of_week,
+                day_of_month=self.day_of_month
             )
 
-            while next_check >= next_run_time:
-                next_run_time += relativedelta(hours=1)
-
-        elif self.schedule_type == Constants.SCHEDULE_DAILY:
-            next_run_time += relativedelta(minute=self.minute_of_hour,
-                                           hour=self.hour_of_day)
+        if self.next_run < next_run_time:
+            self.next_run = next_run_time
 
-            while next_check >= next_run_time:
-                next_run_time += relativedelta(days=1)
+    def materialize_occurrences(self, after):
+        """
+        Replace the materialized occurrences of a cron schedule.
 
-        elif self.schedule_type == Constants.SCHEDULE_WEEKLY:
-            next_run_time += relativedelta(minute=self.minute_of_hour,
-                                           hour=self.hour_of_day,
-                                           weekday=self.day_of_week)
+        :param after: The occurrences are strictly after this time.
+        """
+        self.occurrences = [
+            ScheduleOccurrence(run_on)
+            for run_on in Cron.compile_cron(
+                self.cron_expression
+            ).next_occurrences(
+                after, config.get('SCHEDULE_CRON_OCCURRENCES', 20)
+            )
+        ]
 
-            while next_check >= next_run_time:
-                next_run_time += relativedelta(weeks=1)
+    def next_cron_run(self, next_check):
+        """
+        Return the first materialized occurrence after next_check.
 
-        elif self.schedule_type == Constants.SCHEDULE_MONTHLY:
-            next_run_time += relativedelta(minute=self.minute_of_hour,
-                                           hour=self.hour_of_day,
-                                           day=self.day_of_month)
+        Passed occurrences are removed, the occurrences are
+        materialized again when less than half of them are left.
+        :return: None if the cron expression never matches again.
+        """
+        remaining_occurrences = [occurrence
+                                 for occurrence in self.occurrences
+                                 if occurrence.run_on > next_check]
 
-            while next_check >= next_run_time:
-                next_run_time += relativedelta(months=1)
+        if len(remaining_occurrences) * 2 < \
+                config.get('SCHEDULE_CRON_OCCURRENCES', 20):
+            self.materialize_occurrences(next_check)
+        else:
+            self.occurrences = remaining_occurrences
 
-        if self.next_run < next_run_time:
-            self.next_run = next_run_time
-        # TODO: Better algorithm
-        # TODO: Move to Helpers
+        return self.occurrences[0].run_on if self.occurrences else None
 
     def __repr__(self):
         """Print the Schedule instance."""
@@ -607,6 +762,29 @@ class Schedule(db.Model):
         )
 
 
+class ScheduleOccurrence(db.Model):
+    """Materialized next run time of a cron schedule."""
+
+    schedule_id = db.Column('scheduleId', db.Integer,
+                            db.ForeignKey('schedule.id'),
+                            primary_key=True)
+    run_on = db.Column('runOn', db.DateTime, primary_key=True)
+
+    def __init__(self, run_on):
+        """
+        Docstring for ScheduleOccurrence Model constructor.
+
+        :param run_on: Time when the schedule will run.
+        """
+        self.run_on = run_on
+
+    def __repr__(self):
+        """Print the ScheduleOccurrence instance."""
+        return '<ScheduleOccurrence of Schedule Id {id} on {run_on}>'.format(
+            id=self.schedule_id, run_on=self.run_on
+        )
+
+
 class TrackJobRun(db.Model):
     """Track status whenever a job is running."""
 
@@ -623,9 +801,18 @@ class TrackJobRun(db.Model):
     status = db.Column(db.SmallInteger,
                        default=Constants.JOB_QUEUED, nullable=False)
     error_string = db.Column('errorString', db.Text, nullable=True)
+    result_location = db.Column('resultLocation', db.String(255),
+                                nullable=True)
+    fencing_token = db.Column('fencingToken', db.Integer, nullable=True)
     version = db.Column(db.Integer, index=True, nullable=False)
 
-    def __init__(self, job_id, schedule_id=None):
+    __table_args__ = (
+        db.Index('ix_track_job_run_job_ran_on', job_id, ran_on.desc()),
+        db.Index('ix_track_job_run_status_scheduled_on',
+                 status, scheduled_on),
+    )
+
+    def __init__(self, job_id, schedule_id=None, fencing_token=None):
         """
         Call when enqueue a job.
 
@@ -633,9 +820,12 @@ class TrackJobRun(db.Model):
             Running Job's Id.
         :param schedule_id:
             Running Schedule's Id.
+        :param fencing_token:
+            Token of the FrequencyTaskChecker leader which enqueued the job.
         """
         self.job_id = job_id
         self.schedule_id = schedule_id
+        self.fencing_token = fencing_token
         self.version = Constants.MODEL_TRACK_JOB_RUN_VERSION
 
     def start(self):
@@ -643,18 +833,22 @@ class TrackJobRun(db.Model):
         self.ran_on = datetime.datetime.now()
         self.status = Constants.JOB_RUNNING
 
-    def complete(self, is_success, run_duration, error_string=None):
+    def complete(self, is_success, run_duration, error_string=None,
+                 result_location=None):
         """
         Call whenever a job is completed.
 
         :param is_success: Is the job success.
         :param run_duration: Runtime in milliseconds.
         :param error_string: Error when the job is failed.
+        :param result_location: Where the result is stored, see
+            ResultStorage module.
         """
         self.status = Constants.JOB_RAN_SUCCESS \
             if is_success else Constants.JOB_RAN_FAILED
         self.duration = run_duration
         self.error_string = error_string
+        self.result_location = result_location
 
     def check_expiration(self):
         """
@@ -677,6 +871,10 @@ class TrackJobRun(db.Model):
             if time_delta > \
                     config.get('JOB_RESULT_VALID_SECONDS', 86400) * 1000:
                 self.status = Constants.JOB_RESULT_EXPIRED
+                if self.result_location is not None:
+                    ResultStorage.remove(self.result_location)
+                    self.result_location = None
+                ExportCache.remove(self.track_job_run_id)
                 return True
 
         else:
@@ -698,6 +896,164 @@ class TrackJobRun(db.Model):
         )
 
 
+class FencingToken(db.Model):
+    """Latest fencing token of a leader lock which wrote to the database."""
+
+    name = db.Column(db.String(255), primary_key=True)
+    token = db.Column(db.Integer, nullable=False)
+
+    def __init__(self, name, token):
+        """
+        Constructor for FencingToken class.
+
+        :param name: Name of the leader lock.
+        :param token: Fencing token of its leader.
+        """
+        self.name = name
+        self.token = token
+
+    @classmethod
+    def check(cls, name, token):
+        """
+        Record a leader's token if no newer leader wrote before.
+
+        Run it in the transaction of the leader's writes: the token's
+        row stays locked until the transaction ends, so an older leader
+        can not commit after a newer one recorded its token. The row
+        must have been inserted by `seed`, a leader is fenced otherwise.
+        Changes are not committed.
+        :param name: Name of the leader lock.
+        :param token: Fencing token of the leader.
+        :return: True if the leader may write.
+        """
+        return cls.query.filter(
+            cls.name == name,
+            cls.token <= token
+        ).update({cls.token: token}, synchronize_session=False) > 0
+
+    @classmethod
+    def seed(cls, name):
+        """
+        Insert the row of a leader lock if it does not exist yet.
+
+        The row is committed on its own connection, so leaders only
+        update it in their transactions and can not fail on inserting
+        it at the same time.
+        :param name: Name of the leader lock.
+        """
+        try:
+            db.engine.execute(cls.__table__.insert(), name=name, token=0)
+        except IntegrityError:
+            pass
+
+    def __repr__(self):
+        """Print the fencing token."""
+        return '<Fencing Token {name}: {token}>'.format(
+            name=self.name, token=self.token
+        )
+
+
+class TrackJobRunArchive(db.Model):
+    """Compact copy of a tracker which was removed after its retention."""
+
+    ERROR_SUMMARY_LENGTH = 255
+
+    track_job_run_id = db.Column('id', db.Integer,
+                                 primary_key=True, autoincrement=False)
+    job_id = db.Column('jobId', db.Integer, nullable=False)
+    schedule_id = db.Column('scheduleId', db.Integer, nullable=True)
+    scheduled_on = db.Column('scheduledOn', db.DateTime,
+                             index=True, nullable=False)
+    ran_on = db.Column('ranOn', db.DateTime, nullable=True)
+    duration = db.Column(db.Integer, default=0, nullable=False)
+    status = db.Column(db.SmallInteger, nullable=False)
+    error_summary = db.Column('errorSummary',
+                              db.String(ERROR_SUMMARY_LENGTH),
+                              nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_track_job_run_archive_job_scheduled_on',
+                 job_id, scheduled_on),
+    )
+
+    @classmethod
+    def row_of(cls, tracker):
+        """
+        Return the archive row of a tracker, for bulk inserts.
+
+        Only the beginning of the error is kept.
+        :param tracker: TrackJobRun Model object.
+        """
+        return {
+            'id': tracker.track_job_run_id,
+            'jobId': tracker.job_id,
+            'scheduleId': tracker.schedule_id,
+            'scheduledOn': tracker.scheduled_on,
+            'ranOn': tracker.ran_on,
+            'duration': tracker.duration,
+            'status': tracker.status,
+            'errorSummary': tracker.error_string[:cls.ERROR_SUMMARY_LENGTH]
+            if tracker.error_string else None
+        }
+
+    def __repr__(self):
+        """Print the archived tracker."""
+        return '<Archived Tracker {id}: Job Id {jobId}>'.format(
+            id=self.track_job_run_id, jobId=self.job_id
+        )
+
+
+class JobRunDaily(db.Model):
+    """Runs of a job on a day, rolled up from archived trackers."""
+
+    job_id = db.Column('jobId', db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    runs = db.Column(db.Integer, default=0, nullable=False)
+    succeeded = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    total_duration = db.Column('totalDuration', db.BigInteger,
+                               default=0, nullable=False)
+    max_duration = db.Column('maxDuration', db.Integer,
+                             default=0, nullable=False)
+
+    def __init__(self, job_id, day):
+        """
+        Docstring for JobRunDaily Model constructor.
+
+        :param job_id: Job's Id.
+        :param day: Day the runs were scheduled on.
+        """
+        self.job_id = job_id
+        self.day = day
+        self.runs = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.total_duration = 0
+        self.max_duration = 0
+
+    def add(self, tracker):
+        """
+        Count a tracker's run.
+
+        :param tracker: TrackJobRun Model object.
+        """
+        self.runs += 1
+        if tracker.status in [Constants.JOB_RAN_SUCCESS,
+                              Constants.JOB_RESULT_EXPIRED]:
+            self.succeeded += 1
+        elif tracker.status in [Constants.JOB_RAN_FAILED,
+                                Constants.JOB_DIED_IN_QUEUE]:
+            self.failed += 1
+        self.total_duration += tracker.duration or 0
+        self.max_duration = max(self.max_duration, tracker.duration or 0)
+
+    def __repr__(self):
+        """Print the daily runs."""
+        return '<Job Id {jobId} on {day}: {runs} runs>'.format(
+            jobId=self.job_id, day=self.day, runs=self.runs
+        )
+
+
 class JobMailTo(db.Model):
     """Emails which the result will be sent to."""
 
@@ -765,9 +1121,11 @@ class JobFeature(db.Model):
     @hybrid_property
     def feature_value(self):
         """Convert feature value to it's type and return."""
-        return Constants.JOB_FEATURE_DICT[self.feature_name]['py_type'](
-            self._feature_value
-        )
+        py_type = Constants.JOB_FEATURE_DICT[self.feature_name]['py_type']
+        if py_type is bool:
+            # bool('False') is True, compare with the saved string instead.
+            return self._feature_value == str(True)
+        return py_type(self._feature_value)
 
     @feature_value.setter
     def feature_value(self, feature_value):
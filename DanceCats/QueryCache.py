@@ -0,0 +1,240 @@
+"""
+Docstring for DanceCats.QueryCache module.
+
+This module caches queries' results in Redis so the same query run
+again on the same connection is served without hitting the database.
+Entries are keyed by the connection's id, a hash of the normalized
+query and its parameters. They expire after their own TTL and the least
+recently used ones are evicted when the cache grows over
+QUERY_CACHE_MAX_BYTES. Entries keep the time they were written so a
+reader with a shorter TTL than the writer does not get an older result.
+"""
+
+import hashlib
+import json
+import re
+import struct
+import time
+from DanceCats import config
+from .ResultStorage import encode_block, decode_block
+
+
+KEY_FORMAT = 'dancecats:query_cache:{connection_id}:{digest}'
+CONNECTION_KEYS_FORMAT = 'dancecats:query_cache:connection:{connection_id}'
+LRU_KEY = 'dancecats:query_cache:lru'
+SIZES_KEY = 'dancecats:query_cache:sizes'
+
+_LENGTH = struct.Struct('>I')
+_WRITTEN_AT = struct.Struct('>d')
+
+# String literals and quoted identifiers are kept as they are,
+# runs of white spaces and comments become one space. Literals may
+# escape quotes with a backslash or double them, PostgreSQL literals
+# may be dollar quoted. An unterminated literal is kept up to the end
+# of the query so nothing inside it is ever removed.
+_QUERY_TOKENS = re.compile(
+    r"""(?P<literal>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`[^`]*`"""
+    r"""|\$(?P<tag>\w*)\$.*?\$(?P=tag)\$|['"`].*|\$\w*\$.*)"""
+    r"""|(?P<space>(?:\s|--[^\n]*|/\*.*?\*/)+)""",
+    re.DOTALL
+)
+
+
+def normalize_query(query):
+    """
+    Return the query without comments and extra white spaces.
+
+    :param query: SQL query.
+    :return: Normalized query.
+    """
+    normalized_query = _QUERY_TOKENS.sub(
+        lambda match: match.group('literal') or ' ', query
+    ).strip()
+    return normalized_query.rstrip(';').rstrip()
+
+
+def cache_key(connection_id, query, params=None):
+    """
+    Return the key of a query's result in the cache.
+
+    :param connection_id: Id of the Connection which runs the query.
+    :param query: SQL query.
+    :param params: Parameters which change the result, JSON serializable.
+    """
+    digest = hashlib.sha1(normalize_query(query).encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return KEY_FORMAT.format(connection_id=connection_id,
+                             digest=digest.hexdigest())
+
+
+def get(connection, key, max_age=None):
+    """
+    Return a cached result and mark it as recently used.
+
+    :param connection: Redis connection.
+    :param key: Key returned by `cache_key`.
+    :param max_age: Seconds the result may have been cached for,
+        no limit if None.
+    :return: (header, list of rows batches) or None if not cached.
+    """
+    value = connection.get(key)
+    if value is None:
+        forget(connection, key)
+        return None
+    written_at, = _WRITTEN_AT.unpack_from(value, 0)
+    if max_age is not None and time.time() - written_at > max_age:
+        return None
+    connection.zadd(LRU_KEY, time.time(), key)
+
+    blocks = []
+    position = _WRITTEN_AT.size
+    while position < len(value):
+        length, = _LENGTH.unpack_from(value, position)
+        position += _LENGTH.size
+        blocks.append(decode_block(value[position:position + length]))
+        position += length
+    return blocks[0], blocks[1:]
+
+
+def open_writer(key, ttl):
+    """
+    Return a writer which stores a result in the cache when closed.
+
+    :param key: Key returned by `cache_key`, None to not cache.
+    :param ttl: Seconds the result is kept, 0 to not cache.
+    """
+    return CacheWriter(key, ttl if key is not None else 0)
+
+
+def forget(connection, key):
+    """Remove a cached result and its bookkeeping."""
+    connection_id = key.split(':')[2]
+    with connection.pipeline() as pipeline:
+        pipeline.delete(key)
+        pipeline.zrem(LRU_KEY, key)
+        pipeline.hdel(SIZES_KEY, key)
+        pipeline.srem(
+            CONNECTION_KEYS_FORMAT.format(connection_id=connection_id), key
+        )
+        pipeline.execute()
+
+
+def invalidate(connection, connection_id, query=None, params=None):
+    """
+    Remove cached results of a connection.
+
+    :param connection: Redis connection.
+    :param connection_id: Id of the Connection.
+    :param query: Only remove this query's result if given.
+    :param params: Parameters of the query.
+    """
+    if query is not None:
+        keys = [cache_key(connection_id, query, params)]
+    else:
+        keys = connection.smembers(
+            CONNECTION_KEYS_FORMAT.format(connection_id=connection_id)
+        )
+    for key in keys:
+        forget(connection, key)
+
+
+def evict(connection):
+    """
+    Remove the least recently used results over QUERY_CACHE_MAX_BYTES.
+
+    Bookkeeping of results which expired is removed first so they do not
+    count in the cache's size.
+    """
+    max_bytes = config.get('QUERY_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    sizes = connection.hgetall(SIZES_KEY)
+    keys = list(sizes)
+    with connection.pipeline(transaction=False) as pipeline:
+        for key in keys:
+            pipeline.exists(key)
+        is_cached = pipeline.execute()
+    for key, exists in zip(keys, is_cached):
+        if not exists:
+            forget(connection, key)
+            del sizes[key]
+    total_bytes = sum(int(size) for size in sizes.values())
+
+    for key in connection.zrange(LRU_KEY, 0, -1):
+        if total_bytes <= max_bytes:
+            break
+        total_bytes -= int(sizes.get(key, 0))
+        forget(connection, key)
+
+
+class CacheWriter(object):
+    """
+    CacheWriter class.
+
+    Collect a result batch by batch while it is written to the result
+    storage. Results larger than QUERY_CACHE_MAX_ENTRY_BYTES are not
+    cached.
+    """
+
+    def __init__(self, key, ttl):
+        """
+        Constructor for CacheWriter class.
+
+        :param key: Key returned by `cache_key`.
+        :param ttl: Seconds the result is kept, 0 to not cache.
+        """
+        self.key = key
+        self.ttl = int(ttl or 0)
+        self.max_bytes = config.get('QUERY_CACHE_MAX_ENTRY_BYTES',
+                                    8 * 1024 * 1024)
+        self._frames = []
+        self._size = 0
+
+    @property
+    def is_caching(self):
+        """Check if the result will be cached."""
+        return self.ttl > 0
+
+    def _add(self, obj):
+        """Encode and keep a block, stop caching when it is too large."""
+        if not self.is_caching:
+            return
+        block = encode_block(obj)
+        self._size += _LENGTH.size + len(block)
+        if self._size > self.max_bytes:
+            self.ttl = 0
+            self._frames = []
+            return
+        self._frames.append(_LENGTH.pack(len(block)) + block)
+
+    def write_header(self, header):
+        """Keep the result's header."""
+        self._add(tuple(header))
+
+    def write_rows(self, rows):
+        """Keep a batch of rows."""
+        self._add(list(rows))
+
+    def close(self, connection):
+        """
+        Store the collected result.
+
+        :param connection: Redis connection.
+        :return: True if the result was cached.
+        """
+        if not self.is_caching or not self._frames:
+            return False
+
+        value = _WRITTEN_AT.pack(time.time()) + b''.join(self._frames)
+        self._frames = []
+        with connection.pipeline() as pipeline:
+            pipeline.setex(self.key, self.ttl, value)
+            pipeline.zadd(LRU_KEY, time.time(), self.key)
+            pipeline.hset(SIZES_KEY, self.key, len(value))
+            pipeline.sadd(
+                CONNECTION_KEYS_FORMAT.format(
+                    connection_id=self.key.split(':')[2]
+                ),
+                self.key
+            )
+            pipeline.execute()
+        evict(connection)
+        return True
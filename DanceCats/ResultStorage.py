@@ -0,0 +1,497 @@
+"""
+Docstring for DanceCats.ResultStorage module.
+
+This module contains the writers and readers of jobs' results.
+Results are stored outside of the RQ job in a columnar format:
+rows are written in fixed size chunks, each column of a chunk is
+pickled and compressed on its own so readers can load only the
+columns they need.
+"""
+
+import abc
+import os
+import struct
+import tempfile
+import zlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+from flask import has_app_context
+from DanceCats import config
+
+
+STORAGE_FILE = 'file'
+STORAGE_REDIS = 'redis'
+
+FILE_LOCATION_PREFIX = 'file:'
+FILE_MAGIC = b'DCR1'
+REDIS_LOCATION_PREFIX = 'redis:'
+REDIS_KEY_FORMAT = 'dancecats:result:{tracker_id}'
+REDIS_READ_CHUNKS = 16
+
+_LENGTH = struct.Struct('>I')
+
+
+def encode_block(obj):
+    """Pickle and compress an object."""
+    return zlib.compress(pickle.dumps(obj, 2))
+
+
+def decode_block(block):
+    """Decompress and unpickle a block created by `encode_block`."""
+    return pickle.loads(zlib.decompress(block))
+
+
+def encode_row_group(rows):
+    """
+    Encode rows into column blocks.
+
+    :param rows: List of row tuples.
+    :return: List of encoded column blocks.
+    """
+    return [encode_block(list(column)) for column in zip(*rows)]
+
+
+def decode_row_group(column_blocks, row_count):
+    """
+    Decode column blocks back into rows.
+
+    :param column_blocks: Encoded blocks of the wanted columns.
+    :param row_count: Number of rows of the group.
+    :return: List of row tuples.
+    """
+    if not column_blocks:
+        return [()] * row_count
+    return list(zip(*[decode_block(block) for block in column_blocks]))
+
+
+def order_columns(column_blocks, columns):
+    """
+    Order blocks read in storage order by the wanted columns' order.
+
+    :param column_blocks: Blocks of the wanted columns in storage order.
+    :param columns: Positions of the wanted columns, None for all.
+    """
+    if columns is None:
+        return column_blocks
+    wanted = sorted(set(columns))
+    return [column_blocks[wanted.index(i)] for i in columns]
+
+
+def result_folder():
+    """Return the folder where result files are written."""
+    folder = config.get(
+        'JOB_RESULT_FOLDER',
+        os.path.join(tempfile.gettempdir(), 'dancecats_results')
+    )
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    return folder
+
+
+def redis_connection():
+    """
+    Return the application's Redis connection.
+
+    The current application context is used if there is one, so its
+    database session is not removed.
+    """
+    from DanceCats import app, rdb
+    if has_app_context():
+        return rdb.connection
+    with app.app_context():
+        return rdb.connection
+
+
+def open_writer(tracker_id):
+    """
+    Return a writer for a tracker's result.
+
+    The storage is chosen by JOB_RESULT_STORAGE config.
+
+    :param tracker_id: Job tracker id of tracking object.
+    """
+    if config.get('JOB_RESULT_STORAGE', STORAGE_REDIS) == STORAGE_FILE:
+        return FileResultWriter(tracker_id)
+    return RedisResultWriter(tracker_id)
+
+
+def open_reader(location):
+    """
+    Return a reader of a stored result.
+
+    :param location: Location returned by the writer's `close` method.
+    :return: None if the result does not exist anymore.
+    """
+    if location.startswith(FILE_LOCATION_PREFIX):
+        path = location[len(FILE_LOCATION_PREFIX):]
+        if os.path.exists(path):
+            return FileResultReader(path)
+
+    elif location.startswith(REDIS_LOCATION_PREFIX):
+        key = location[len(REDIS_LOCATION_PREFIX):]
+        if redis_connection().exists(key):
+            return RedisResultReader(key)
+
+    return None
+
+
+def open_tracker_reader(tracker):
+    """
+    Return the reader of a tracker's result.
+
+    Need an application context for results which were
+    returned to RQ before they were stored outside of it.
+
+    :param tracker: TrackJobRun Model object.
+    :return: None if the result does not exist anymore.
+    """
+    if tracker.result_location is not None:
+        return open_reader(tracker.result_location)
+
+    from DanceCats import rdb
+    rq_job = rdb.queue['default'].fetch_job(str(tracker.track_job_run_id))
+    if rq_job is None or not rq_job.result:
+        return None
+    return RowsResultReader(rq_job.result['header'], rq_job.result['rows'])
+
+
+def remove(location):
+    """Remove a stored result."""
+    if location.startswith(FILE_LOCATION_PREFIX):
+        path = location[len(FILE_LOCATION_PREFIX):]
+        if os.path.exists(path):
+            os.remove(path)
+
+    elif location.startswith(REDIS_LOCATION_PREFIX):
+        redis_connection().delete(location[len(REDIS_LOCATION_PREFIX):])
+
+
+class ResultWriter(object):
+    """
+    Base class for results' writers.
+
+    Rows are buffered and handed to `_write_chunk` in chunks of
+    JOB_RESULT_CHUNK_ROWS rows, whatever the size of the written batches.
+    Storages implement `discard` and the underscored methods.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, tracker_id):
+        """
+        Constructor for ResultWriter class.
+
+        :param tracker_id: Job tracker id of tracking object.
+        """
+        self.tracker_id = tracker_id
+        self.chunk_rows = config.get('JOB_RESULT_CHUNK_ROWS', 1000)
+        self.row_count = 0
+        self._buffer = []
+
+    def write_header(self, header):
+        """Write the columns' name, must be called first."""
+        self._write_header_block(encode_block(tuple(header)))
+
+    def write_rows(self, rows):
+        """Write rows, full chunks are written right away."""
+        self._buffer.extend(rows)
+        self.row_count += len(rows)
+        while len(self._buffer) >= self.chunk_rows:
+            chunk = self._buffer[:self.chunk_rows]
+            self._buffer = self._buffer[self.chunk_rows:]
+            self._write_chunk(chunk)
+
+    def close(self):
+        """
+        Write the remaining rows and finish writing.
+
+        :return: Location of the result, used to open its reader.
+        """
+        if self._buffer:
+            self._write_chunk(self._buffer)
+            self._buffer = []
+        return self._finish()
+
+    @abc.abstractmethod
+    def discard(self):
+        """Stop writing and remove the partial result."""
+
+    @abc.abstractmethod
+    def _write_header_block(self, block):
+        """Store the encoded header."""
+
+    @abc.abstractmethod
+    def _write_chunk(self, rows):
+        """Store a chunk of rows."""
+
+    @abc.abstractmethod
+    def _finish(self):
+        """Finish writing and return the location."""
+
+
+class ResultReader(object):
+    """
+    Base class for results' readers.
+
+    Subclasses implement `iter_chunks`, this class provides the
+    row by row access on top of it.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    header = ()
+
+    @abc.abstractmethod
+    def iter_chunks(self, columns=None):
+        """
+        Iterate over the result in chunks of rows.
+
+        :param columns:
+            Positions of the columns to be read, all columns if None.
+        :return: Generator of lists of row tuples.
+        """
+
+    def iter_rows(self, columns=None):
+        """
+        Iterate over the result row by row.
+
+        :param columns:
+            Positions of the columns to be read, all columns if None.
+        :return: Generator of row tuples.
+        """
+        for rows in self.iter_chunks(columns):
+            for row in rows:
+                yield row
+
+
+class RowsResultReader(ResultReader):
+    """Reader for results which are already loaded in memory."""
+
+    def __init__(self, header, rows):
+        """
+        Constructor for RowsResultReader class.
+
+        :param header: Columns' name.
+        :param rows: List of row tuples.
+        """
+        self.header = tuple(header)
+        self.rows = rows
+
+    def iter_chunks(self, columns=None):
+        """Yield all the rows as one chunk."""
+        if columns is None:
+            yield [tuple(row) for row in self.rows]
+        else:
+            yield [tuple(row[i] for i in columns) for row in self.rows]
+
+
+class FileResultWriter(ResultWriter):
+    """
+    Write a result into a file.
+
+    The file is a sequence of length prefixed frames: the header,
+    then for every chunk a frame of its row count and columns'
+    block lengths followed by one frame per column block.
+    """
+
+    def __init__(self, tracker_id):
+        """
+        Constructor for FileResultWriter class.
+
+        :param tracker_id: Job tracker id of tracking object.
+        """
+        super(FileResultWriter, self).__init__(tracker_id)
+        self.path = os.path.join(
+            result_folder(),
+            'result_tid_{tracker_id}.dcr'.format(tracker_id=tracker_id)
+        )
+        self._file = open(self.path, 'wb')
+        self._file.write(FILE_MAGIC)
+
+    def _write_frame(self, frame):
+        """Write a length prefixed frame."""
+        self._file.write(_LENGTH.pack(len(frame)))
+        self._file.write(frame)
+
+    def _write_header_block(self, block):
+        """Write the header frame."""
+        self._write_frame(block)
+
+    def _write_chunk(self, rows):
+        """Write the chunk's frames."""
+        column_blocks = encode_row_group(rows)
+        self._write_frame(encode_block(
+            (len(rows), [len(block) for block in column_blocks])
+        ))
+        for block in column_blocks:
+            self._write_frame(block)
+
+    def _finish(self):
+        """Close the file."""
+        self._file.close()
+        return FILE_LOCATION_PREFIX + self.path
+
+    def discard(self):
+        """Close and remove the file."""
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class FileResultReader(ResultReader):
+    """Read a result written by FileResultWriter."""
+
+    def __init__(self, path):
+        """
+        Constructor for FileResultReader class.
+
+        :param path: Path of the result file.
+        """
+        self.path = path
+        with open(self.path, 'rb') as result_file:
+            if result_file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(
+                    'Not a result file: {path}'.format(path=path)
+                )
+            self.header = decode_block(self._read_frame(result_file))
+
+    @staticmethod
+    def _read_frame(result_file, skip=False):
+        """Read the next frame, seek over its data if skip is True."""
+        length_bytes = result_file.read(_LENGTH.size)
+        if len(length_bytes) < _LENGTH.size:
+            return None
+        length = _LENGTH.unpack(length_bytes)[0]
+        if skip:
+            result_file.seek(length, os.SEEK_CUR)
+            return b''
+        return result_file.read(length)
+
+    def iter_chunks(self, columns=None):
+        """Yield the chunks, only read and decode the wanted columns."""
+        with open(self.path, 'rb') as result_file:
+            result_file.seek(len(FILE_MAGIC))
+            self._read_frame(result_file, skip=True)
+
+            while True:
+                chunk_frame = self._read_frame(result_file)
+                if chunk_frame is None:
+                    break
+                row_count, block_lengths = decode_block(chunk_frame)
+
+                column_blocks = []
+                for i in range(0, len(block_lengths)):
+                    if columns is None or i in columns:
+                        column_blocks.append(self._read_frame(result_file))
+                    else:
+                        self._read_frame(result_file, skip=True)
+
+                yield decode_row_group(
+                    order_columns(column_blocks, columns), row_count
+                )
+
+
+class RedisResultWriter(ResultWriter):
+    """
+    Write a result into a Redis list.
+
+    The first item is the header, every following item is a chunk:
+    a length prefixed frame of its row count and columns' block lengths
+    followed by the column blocks. The list expires with the result.
+    """
+
+    def __init__(self, tracker_id):
+        """
+        Constructor for RedisResultWriter class.
+
+        :param tracker_id: Job tracker id of tracking object.
+        """
+        super(RedisResultWriter, self).__init__(tracker_id)
+        self.key = REDIS_KEY_FORMAT.format(tracker_id=tracker_id)
+        self.ttl = config.get('JOB_RESULT_VALID_SECONDS', 86400)
+        self._redis = redis_connection()
+        self._redis.delete(self.key)
+
+    def _push(self, item):
+        """Append an item to the list and refresh its expiration."""
+        pipeline = self._redis.pipeline()
+        pipeline.rpush(self.key, item)
+        pipeline.expire(self.key, self.ttl)
+        pipeline.execute()
+
+    def _write_header_block(self, block):
+        """Push the header."""
+        self._push(block)
+
+    def _write_chunk(self, rows):
+        """Push the chunk."""
+        column_blocks = encode_row_group(rows)
+        meta = encode_block(
+            (len(rows), [len(block) for block in column_blocks])
+        )
+        self._push(_LENGTH.pack(len(meta)) + meta + b''.join(column_blocks))
+
+    def _finish(self):
+        """Nothing to close, every chunk has been pushed."""
+        return REDIS_LOCATION_PREFIX + self.key
+
+    def discard(self):
+        """Delete the list."""
+        self._redis.delete(self.key)
+
+
+class RedisResultReader(ResultReader):
+    """
+    Read a result written by RedisResultWriter.
+
+    Chunks are fetched REDIS_READ_CHUNKS at a time, the first ones
+    together with the header.
+    """
+
+    def __init__(self, key):
+        """
+        Constructor for RedisResultReader class.
+
+        :param key: Key of the result's list.
+        """
+        self.key = key
+        self._redis = redis_connection()
+        self._first_items = self._redis.lrange(self.key, 0, REDIS_READ_CHUNKS)
+        self.header = decode_block(self._first_items[0])
+
+    def iter_chunks(self, columns=None):
+        """Yield the chunks, only decode the wanted columns."""
+        chunks = self._first_items[1:]
+        start = len(self._first_items)
+        while chunks:
+            for chunk in chunks:
+                yield self._decode_chunk(chunk, columns)
+            if len(chunks) < REDIS_READ_CHUNKS:
+                break
+
+            chunks = self._redis.lrange(
+                self.key, start, start + REDIS_READ_CHUNKS - 1
+            )
+            start += len(chunks)
+
+    @staticmethod
+    def _decode_chunk(chunk, columns):
+        """Decode the wanted columns of a chunk."""
+        meta_length = _LENGTH.unpack(chunk[:_LENGTH.size])[0]
+        offset = _LENGTH.size + meta_length
+        row_count, block_lengths = \
+            decode_block(chunk[_LENGTH.size:offset])
+
+        column_blocks = []
+        for i in range(0, len(block_lengths)):
+            if columns is None or i in columns:
+                column_blocks.append(
+                    chunk[offset:offset + block_lengths[i]]
+                )
+            offset += block_lengths[i]
+
+        return decode_row_group(
+            order_columns(column_blocks, columns), row_count
+        )
@@ -0,0 +1,120 @@
+"""
+Docstring for DanceCats.Retention module.
+
+This module keeps the trackers' table small. Trackers scheduled more
+than TRACKER_RETENTION_DAYS days ago are moved into a compact archive
+table and counted into per-job daily aggregates. Archived trackers
+are removed after TRACKER_ARCHIVE_RETENTION_DAYS days, the aggregates
+are kept.
+"""
+
+from __future__ import print_function
+import datetime
+from DanceCats import db, config
+from .Models import TrackJobRun, TrackJobRunArchive, JobRunDaily
+from . import Constants
+from . import ResultStorage
+from . import ExportCache
+
+
+def compact_trackers(now=None):
+    """
+    Archive trackers over their retention and prune the archive.
+
+    Trackers are moved in batches of TRACKER_COMPACT_BATCH_SIZE, each
+    batch in its own transaction. Results and exports still kept for
+    the moved trackers are removed.
+    Need an application context.
+    :param now: Time the retention windows end on, default is now.
+    :return: (Number of archived trackers, number of pruned archives).
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    retention_days = config.get('TRACKER_RETENTION_DAYS', 30)
+    archive_retention_days = config.get('TRACKER_ARCHIVE_RETENTION_DAYS', 365)
+    batch_size = config.get('TRACKER_COMPACT_BATCH_SIZE', 1000)
+
+    archived_count = 0
+    if retention_days > 0:
+        cutoff = now - datetime.timedelta(days=retention_days)
+        while True:
+            # Every status is listed so the (status, scheduledOn) index
+            # serves the range.
+            trackers = TrackJobRun.query.filter(
+                TrackJobRun.status.in_(
+                    list(Constants.JOB_TRACKING_STATUSES_DICT)
+                ),
+                TrackJobRun.scheduled_on < cutoff
+            ).limit(batch_size).all()
+            if not trackers:
+                break
+
+            stored_results = [
+                (tracker.track_job_run_id, tracker.result_location)
+                for tracker in trackers
+            ]
+            archive_trackers(trackers)
+            db.session.commit()
+            remove_results(stored_results)
+
+            archived_count += len(trackers)
+            if len(trackers) < batch_size:
+                break
+
+    pruned_count = 0
+    if archive_retention_days > 0:
+        pruned_count = TrackJobRunArchive.query.filter(
+            TrackJobRunArchive.scheduled_on <
+            now - datetime.timedelta(days=archive_retention_days)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    return archived_count, pruned_count
+
+
+def archive_trackers(trackers):
+    """
+    Move trackers into the archive and count them by job and day.
+
+    Changes are not committed.
+    :param trackers: List of TrackJobRun Model objects.
+    """
+    db.session.execute(
+        TrackJobRunArchive.__table__.insert(),
+        [TrackJobRunArchive.row_of(tracker) for tracker in trackers]
+    )
+
+    days = [tracker.scheduled_on.date() for tracker in trackers]
+    daily_runs = dict(
+        ((daily.job_id, daily.day), daily)
+        for daily in JobRunDaily.query.filter(
+            JobRunDaily.job_id.in_(
+                set(tracker.job_id for tracker in trackers)
+            ),
+            JobRunDaily.day.between(min(days), max(days))
+        )
+    )
+    for tracker, day in zip(trackers, days):
+        key = (tracker.job_id, day)
+        if key not in daily_runs:
+            daily_runs[key] = JobRunDaily(tracker.job_id, day)
+            db.session.add(daily_runs[key])
+        daily_runs[key].add(tracker)
+
+    TrackJobRun.query.filter(
+        TrackJobRun.track_job_run_id.in_(
+            [tracker.track_job_run_id for tracker in trackers]
+        )
+    ).delete(synchronize_session=False)
+
+
+def remove_results(stored_results):
+    """
+    Remove results and exports of removed trackers.
+
+    :param stored_results: List of (tracker id, result location).
+    """
+    for tracker_id, result_location in stored_results:
+        if result_location is not None:
+            ResultStorage.remove(result_location)
+        ExportCache.remove(tracker_id)
@@ -0,0 +1,67 @@
+"""
+Docstring for DanceCats.Semaphore module.
+
+This module contains Semaphore class, a counting semaphore in Redis
+which bounds how many processes use a resource at the same time.
+"""
+
+import time
+
+
+ACQUIRE_SCRIPT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+if redis.call('zscore', KEYS[1], ARGV[3]) or
+        redis.call('zcard', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('zadd', KEYS[1], ARGV[2], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class Semaphore(object):
+    """
+    Semaphore class.
+
+    Holders are kept in a sorted set scored by the time their lease
+    ends, so slots of holders which died without releasing them are
+    freed when their lease ends.
+    """
+
+    KEY_FORMAT = 'dancecats:semaphore:{name}'
+
+    def __init__(self, name, limit, lease_seconds=3600):
+        """
+        Constructor for Semaphore class.
+
+        :param name: Name of the semaphore.
+        :param limit: Number of holders at the same time, 0 is no limit.
+        :param lease_seconds: Seconds a holder keeps its slot.
+        """
+        self.key = self.KEY_FORMAT.format(name=name)
+        self.limit = limit
+        self.lease_seconds = lease_seconds
+
+    def acquire(self, connection, holder):
+        """
+        Take a slot for a holder, or renew its lease if it has one.
+
+        :param connection: Redis connection.
+        :param holder: Unique name of the holder.
+        :return: True if the holder has a slot else False.
+        """
+        if not self.limit:
+            return True
+
+        now = time.time()
+        return bool(connection.eval(ACQUIRE_SCRIPT, 1, self.key,
+                                    now, now + self.lease_seconds,
+                                    holder, self.limit))
+
+    def release(self, connection, holder):
+        """Give back the slot of a holder."""
+        connection.zrem(self.key, holder)
+
+    def count(self, connection):
+        """Return the number of holders whose lease did not end."""
+        return connection.zcount(self.key, time.time(), '+inf')
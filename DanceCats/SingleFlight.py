@@ -0,0 +1,104 @@
+"""
+Docstring for DanceCats.SingleFlight module.
+
+This module contains SingleFlight class, which coalesces concurrent runs
+of the same work in Redis: the first member runs it, members joining
+while it is in flight are handed its outcome instead of running again.
+"""
+
+
+JOIN_SCRIPT = """
+local leader = redis.call('get', KEYS[1])
+if leader then
+    redis.call('rpush', KEYS[2], ARGV[1])
+    redis.call('expire', KEYS[2], ARGV[2])
+    return leader
+end
+redis.call('setex', KEYS[1], ARGV[2], ARGV[1])
+return false
+"""
+
+LAND_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local followers = redis.call('lrange', KEYS[2], 0, -1)
+redis.call('del', KEYS[1], KEYS[2])
+return followers
+"""
+
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('expire', KEYS[1], ARGV[2])
+if redis.call('exists', KEYS[2]) == 1 then
+    redis.call('expire', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+class SingleFlight(object):
+    """
+    SingleFlight class.
+
+    The leader of a flight is kept in a key which expires after its
+    lease, so a leader which died without landing does not hold
+    the flight forever. Followers are kept in a list.
+    """
+
+    KEY_FORMAT = 'dancecats:single_flight:{name}'
+
+    def __init__(self, name, lease_seconds=3600):
+        """
+        Constructor for SingleFlight class.
+
+        :param name: Name of the work.
+        :param lease_seconds: Seconds a flight lasts without landing.
+        """
+        self.key = self.KEY_FORMAT.format(name=name)
+        self.followers_key = self.key + ':followers'
+        self.lease_seconds = lease_seconds
+
+    def join(self, connection, member):
+        """
+        Lead the flight or follow its leader.
+
+        :param connection: Redis connection or pipeline.
+        :param member: Unique name of the member.
+        :return: Leader's name if the member follows,
+                 None if the member leads and must do the work.
+        """
+        return connection.eval(JOIN_SCRIPT, 2, self.key, self.followers_key,
+                               member, int(self.lease_seconds))
+
+    def land(self, connection, leader):
+        """
+        End the flight of a leader.
+
+        :param connection: Redis connection.
+        :param leader: Name of the leading member.
+        :return: List of followers' names, empty if the member
+                 does not lead the flight.
+        """
+        return connection.eval(LAND_SCRIPT, 2, self.key, self.followers_key,
+                               leader)
+
+    def renew(self, connection, leader, lease_seconds):
+        """
+        Set how long the flight of a leader lasts from now.
+
+        :param connection: Redis connection.
+        :param leader: Name of the leading member.
+        :param lease_seconds: Seconds the flight lasts without landing.
+        :return: True if the member leads the flight.
+        """
+        return bool(connection.eval(RENEW_SCRIPT, 2, self.key,
+                                    self.followers_key, leader,
+                                    int(lease_seconds)))
+
+    def leader(self, connection):
+        """Return the name of the flight's leader, None if not in flight."""
+        return connection.get(self.key)
@@ -10,11 +10,12 @@ import functools
 from flask import url_for
 from flask_login import current_user
 from flask_socketio import disconnect, emit
-from DanceCats import socket_io, config, db
-from DanceCats.DatabaseConnector \
-    import DatabaseConnector, DatabaseConnectorException
+from DanceCats import socket_io, config, db, rdb
+from DanceCats.DatabaseConnector import DatabaseConnectorException
+from DanceCats.ConnectionPool import connection_pool
 from DanceCats.Models import Connection, Job, TrackJobRun
 from . import Helpers
+from . import QueryCache
 from . import Constants
 
 
@@ -37,6 +38,8 @@ def run_query(received_data):
     """
     Used to run/test the query input from job's form.
 
+    Previews are cached for QUERY_CACHE_PREVIEW_SECONDS seconds.
+
     :param received_data: Dictionary with connection id and query.
     :type received_data: dict.
     """
@@ -54,26 +57,41 @@ def run_query(received_data):
 
         running_connection = Connection.query.get(connection_id)
         if running_connection is not None:
+            preview_size = config.get('QUERY_TEST_LIMIT', 10)
+            cache_writer = QueryCache.open_writer(
+                QueryCache.cache_key(running_connection.connection_id,
+                                     query, {'preview': preview_size}),
+                config.get('QUERY_CACHE_PREVIEW_SECONDS', 0)
+            )
+            cached_result = QueryCache.get(
+                rdb.connection, cache_writer.key, cache_writer.ttl
+            ) if cache_writer.is_caching else None
+            if cached_result is not None:
+                ret_header, batches = cached_result
+                return emit(Constants.WS_QUERY_SEND, {
+                    'status': 0,
+                    'data': batches[0],
+                    'header': ret_header,
+                    'seq': runtime
+                })
+
             try:
-                connector = DatabaseConnector(running_connection.type,
-                                              running_connection.
-                                              db_config_generator(),
-                                              sql_data_style=True,
-                                              dict_format=True,
-                                              timeout=config.get(
-                                                  'DB_TIMEOUT', 60
-                                              ))
-                connector.connection_test(10)
-                connector.connect()
-                connector.execute(query)
-                ret_data = connector.fetch_many(
-                    size=config.get('QUERY_TEST_LIMIT', 10)
-                )
-                connector.close()
+                with connection_pool.connector(running_connection,
+                                               sql_data_style=True,
+                                               dict_format=True,
+                                               timeout=config.get(
+                                                   'DB_TIMEOUT', 60
+                                               )) as connector:
+                    connector.execute(query)
+                    ret_data = connector.fetch_many(size=preview_size)
+                    ret_header = connector.columns_name
+                cache_writer.write_header(ret_header)
+                cache_writer.write_rows(ret_data)
+                cache_writer.close(rdb.connection)
                 return emit(Constants.WS_QUERY_SEND, {
                     'status': 0,
                     'data': ret_data,
-                    'header': connector.columns_name,
+                    'header': ret_header,
                     'seq': runtime
                 })
             except DatabaseConnectorException as exception:
@@ -107,7 +125,15 @@ def get_trackers():
     """Get the trackers of ran jobs."""
     runtime = Helpers.generate_runtime()
 
-    query = db.session.query(TrackJobRun, Job).join(Job)
+    query = db.session.query(
+        TrackJobRun,
+        Job.name.label('job_name'),
+        Connection.database.label('database')
+    ).join(
+        Job, TrackJobRun.job_id == Job.job_id
+    ).outerjoin(
+        Connection, Job.connection_id == Connection.connection_id
+    )
     trackers = query.order_by(
         TrackJobRun.track_job_run_id.desc()
     ).limit(20).all()
@@ -118,9 +144,9 @@ def get_trackers():
             db.session.commit()
         trackers_list.append({
             'id': tracker.TrackJobRun.track_job_run_id,
-            'jobName': tracker.Job.name,
-            'database': tracker.Job.Connection.database
-            if tracker.Job.Connection is not None
+            'jobName': tracker.job_name,
+            'database': tracker.database
+            if tracker.database is not None
             else "Connection Deleted",
             'status': Constants.
             JOB_TRACKING_STATUSES_DICT[tracker.TrackJobRun.status]['name'],
@@ -6,20 +6,25 @@ whenever the application receive the right url request.
 """
 
 from __future__ import print_function
+import os
 import datetime
 from flask \
     import render_template, request, redirect, \
-    url_for, flash, jsonify, abort
+    url_for, flash, jsonify, abort, json, \
+    Response, stream_with_context, send_file
 from flask_login import login_user, logout_user, login_required, current_user
-import flask_excel as excel
 from DanceCats import app, db, lm, rdb
 from DanceCats.Models import User, AllowedEmail, Connection, \
     QueryDataJob, TrackJobRun, JobMailTo, Job, Schedule
 from DanceCats.Forms import RegisterForm, ConnectionForm, QueryJobForm
 from DanceCats.DatabaseConnector \
     import DatabaseConnector, DatabaseConnectorException
-from .JobWorker import job_worker_query
+from DanceCats.ConnectionPool import connection_pool
+from .JobWorker import enqueue_query_jobs
 from . import Helpers
+from . import ResultStorage
+from . import ExportCache
+from . import QueryCache
 from . import Constants
 
 
@@ -39,23 +44,35 @@ def index():
 @app.route('/job')
 @login_required
 def job():
-    """Render and return Job Listing Page."""
-    jobs = QueryDataJob.query.filter_by(is_deleted=False).all()
+    """Render and return Job Listing Page, one page at a time."""
+    sort_by = request.args.get('sort', 'last_updated')
+    if sort_by not in QueryDataJob.LIST_SORT_COLUMNS:
+        sort_by = 'last_updated'
+    descending = request.args.get('order', 'desc') != 'asc'
+
+    pagination = QueryDataJob.list_query(sort_by, descending).paginate(
+        request.args.get('page', 1, type=int),
+        app.config.get('JOB_LIST_PAGE_SIZE', 50),
+        error_out=False
+    )
     job_lists = []
-    for job_object in jobs:
+    for job_row in pagination.items:
         job_lists.append({
-            'id': job_object.job_id,
-            'name': job_object.name,
-            'last_updated': job_object.last_updated,
-            'user_email': job_object.User.email,
-            'connection_name': job_object.Connection.name
-            if job_object.Connection is not None
+            'id': job_row.id,
+            'name': job_row.name,
+            'last_updated': job_row.last_updated,
+            'user_email': job_row.user_email,
+            'connection_name': job_row.connection_name
+            if job_row.connection_name is not None
             else "Connection Deleted",
-            'is_active': job_object.is_active
+            'is_active': job_row.connection_id is not None
         })
     return render_template('query_job/list.html',
                            title=Constants.PROJECT_NAME,
                            jobs=job_lists,
+                           pagination=pagination,
+                           sort_by=sort_by,
+                           descending=descending,
                            trigger_url=url_for('job_run'))
 
 
@@ -86,6 +103,10 @@ def job_create():
                                    user_id=current_user.user_id)
             new_job[Constants.JOB_FEATURE_QUERY_TIME_OUT] = \
                 int(request.form['query_time_out'])
+            new_job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] = \
+                form.server_side_cursor.data
+            new_job[Constants.JOB_FEATURE_RESULT_CACHE_SECONDS] = \
+                form.result_cache_seconds.data or 0
             db.session.add(new_job)
             db.session.commit()
 
@@ -109,6 +130,10 @@ def job_create():
                         schedule_type=schedule.schedule_type.data,
                         user_id=current_user.user_id,
                         is_active=schedule.is_active.data,
+                        cron_expression=Helpers.null_handler(
+                            schedule.cron_expression.data
+                        ),
+                        second_offset=schedule.second_offset.data,
                         start_time=start_dt,
                         interval=app.config.get(
                             'FREQUENCY_INTERVAL_SECONDS', 60
@@ -143,6 +168,14 @@ def job_edit(job_id):
     if Constants.JOB_FEATURE_QUERY_TIME_OUT in editing_job:
         form.query_time_out.data = \
             editing_job[Constants.JOB_FEATURE_QUERY_TIME_OUT]
+    if request.method == 'GET' and \
+            Constants.JOB_FEATURE_SERVER_SIDE_CURSOR in editing_job:
+        form.server_side_cursor.data = \
+            editing_job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR]
+    if request.method == 'GET' and \
+            Constants.JOB_FEATURE_RESULT_CACHE_SECONDS in editing_job:
+        form.result_cache_seconds.data = \
+            editing_job[Constants.JOB_FEATURE_RESULT_CACHE_SECONDS]
 
     if request.method == 'POST':
         if 'add-email' in request.form:
@@ -155,6 +188,10 @@ def job_edit(job_id):
             form.populate_obj(editing_job)
             editing_job[Constants.JOB_FEATURE_QUERY_TIME_OUT] = \
                 int(request.form['query_time_out'])
+            editing_job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] = \
+                form.server_side_cursor.data
+            editing_job[Constants.JOB_FEATURE_RESULT_CACHE_SECONDS] = \
+                form.result_cache_seconds.data or 0
             db.session.commit()
 
             db.session.query(JobMailTo). \
@@ -205,6 +242,10 @@ def job_edit(job_id):
                             schedule_type=schedule.schedule_type.data,
                             user_id=current_user.user_id,
                             is_active=schedule.is_active.data,
+                            cron_expression=Helpers.null_handler(
+                                schedule.cron_expression.data
+                            ),
+                            second_offset=schedule.second_offset.data,
                             start_time=start_dt,
                             interval=app.config.get(
                                 'FREQUENCY_INTERVAL_SECONDS', 60
@@ -217,6 +258,12 @@ def job_edit(job_id):
                         existing_schedule.schedule_type = \
                             schedule.schedule_type.data
                         existing_schedule.is_active = schedule.is_active.data
+                        existing_schedule.cron_expression = \
+                            Helpers.null_handler(
+                                schedule.cron_expression.data
+                            )
+                        existing_schedule.second_offset = \
+                            schedule.second_offset.data or 0
                         existing_schedule.update_start_time(
                             start_time=start_dt,
                             interval=app.config.get(
@@ -267,44 +314,82 @@ def job_run():
     tracker = TrackJobRun(triggered_job.job_id)
     db.session.add(tracker)
     db.session.commit()
-    queue = rdb.queue['default']
-    queue.enqueue(
-        f=job_worker_query, kwargs={
-            'job_id': triggered_job.job_id,
-            'tracker_id': tracker.track_job_run_id
-        },
-        timeout=app.config.get('JOB_WORKER_EXECUTE_TIMEOUT', 3600),
-        ttl=app.config.get('JOB_WORKER_ENQUEUE_TIMEOUT', 1800),
-        result_ttl=app.config.get('JOB_RESULT_VALID_SECONDS', 86400),
-        job_id="{tracker_id}".format(tracker_id=tracker.track_job_run_id)
-    )
+    enqueue_query_jobs([tracker])
     return jsonify({'ack': True, 'tracker_id': tracker.track_job_run_id})
 
 
-@app.route('/job/result/<tracker_id>/<result_type>')
-@login_required
-def job_result(tracker_id, result_type):
-    """Download Job's result."""
-    queue = rdb.queue['default']
-    result = queue.fetch_job(tracker_id).result
-    if result_type in ['csv', 'xls', 'xlsx', 'ods']:
-        result_array = [list(result['header'])]
-        for row in result['rows']:
-            result_array.append(list(row))
-        return excel.make_response_from_array(
-            result_array,
-            result_type,
-            file_name="Result_tid_{tid}.{ext}".format(
-                tid=tracker_id,
-                ext=result_type
-            )
+def make_result_response(tracker, result_type):
+    """
+    Make the response of a tracker's result.
+
+    :param tracker: TrackJobRun Model object.
+    :param result_type: csv, xls, xlsx, ods or raw.
+    """
+    if result_type in ExportCache.EXPORT_TYPES:
+        export_path = ExportCache.get_export(tracker, result_type)
+        if export_path is None:
+            abort(404)
+        return send_file(
+            export_path,
+            as_attachment=True,
+            attachment_filename=os.path.basename(export_path),
+            conditional=True
+        )
+
+    result = ResultStorage.open_tracker_reader(tracker)
+    if result is None:
+        abort(404)
+
+    if result_type == 'csv':
+        return make_stream_response(
+            Helpers.iter_csv(result.header, result.iter_chunks()),
+            'text/csv',
+            "Result_tid_{tid}.csv".format(tid=tracker.track_job_run_id)
         )
     elif result_type == 'raw':
-        return jsonify(result)
+        return make_stream_response(
+            Helpers.iter_json(result.header, result.iter_chunks(),
+                              json.dumps),
+            'application/json'
+        )
     else:
         abort(404)
 
 
+def make_stream_response(pieces, mimetype, file_name=None):
+    """
+    Make a response which sends pieces of a result as they are generated.
+
+    The pieces are gzipped on the fly if the client accepts it.
+
+    :param pieces: Iterable of byte strings.
+    :param mimetype: Mimetype of the response.
+    :param file_name: Name of the downloaded file, None to show inline.
+    """
+    headers = {'Vary': 'Accept-Encoding'}
+    if file_name is not None:
+        headers['Content-Disposition'] = \
+            'attachment; filename={0}'.format(file_name)
+
+    if 'gzip' in request.headers.get('Accept-Encoding', '').lower():
+        pieces = Helpers.iter_gzip(
+            pieces, app.config.get('COMPRESS_LEVEL', 6)
+        )
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(pieces),
+                    mimetype=mimetype,
+                    headers=headers)
+
+
+@app.route('/job/result/<tracker_id>/<result_type>')
+@login_required
+def job_result(tracker_id, result_type):
+    """Download Job's result."""
+    tracker = TrackJobRun.query.get_or_404(tracker_id)
+    return make_result_response(tracker, result_type)
+
+
 @app.route('/job/latest-result/<job_id>/<result_type>')
 @login_required
 def job_latest_result(job_id, result_type):
@@ -314,22 +399,7 @@ def job_latest_result(job_id, result_type):
         job_id=fetching_result_job.job_id
     ).order_by(TrackJobRun.ran_on.desc()).first()
     if last_tracker is not None:
-        queue = rdb.queue['default']
-        result = queue.fetch_job(str(last_tracker.track_job_run_id)).result
-        if result_type in ['csv', 'xls', 'xlsx', 'ods']:
-            result_array = [list(result['header'])]
-            for row in result['rows']:
-                result_array.append(list(row))
-            return excel.make_response_from_array(
-                result_array,
-                result_type,
-                file_name="Result_tid_{tid}.{ext}".format(
-                    tid=last_tracker.track_job_run_id,
-                    ext=result_type
-                )
-            )
-        elif result_type == 'raw':
-            return jsonify(result)
+        return make_result_response(last_tracker, result_type)
 
     abort(404)
 
@@ -372,6 +442,8 @@ def connection_create():
                                     user_name=request.form['user_name'],
                                     password=Helpers.null_handler
                                     (request.form['password']),
+                                    max_concurrent_jobs=form.
+                                    max_concurrent_jobs.data,
                                     creator_user_id=current_user.user_id
                                     )
         db.session.add(new_connection)
@@ -414,6 +486,8 @@ def connection_edit(connection_id):
                 form.populate_obj(editing_connection)
                 editing_connection.password = old_password
             db.session.commit()
+            Connection.forget_db_config(connection_id)
+            QueryCache.invalidate(rdb.connection, connection_id)
         return redirect(url_for('connection'))
 
 
@@ -425,6 +499,7 @@ def connection_delete():
     if deleting_connection is not None:
         db.session.delete(deleting_connection)
         db.session.commit()
+        Connection.forget_db_config(deleting_connection.connection_id)
 
         return jsonify({
             'deleted': True
@@ -465,6 +540,7 @@ def connection_test(connection_id):
     """Test the connection."""
     form = ConnectionForm(obj=request.form)
     if form.validate_on_submit():
+        testing_connection = None
         if connection_id == 0:
             new_connection = Connection(name=request.form['name'],
                                         db_type=int(request.form['type']),
@@ -489,12 +565,19 @@ def connection_test(connection_id):
                 testing_connection.password = old_password
             testing_config = testing_connection.db_config_generator()
 
-        db_connect = DatabaseConnector(
-            int(request.form['type']),
-            testing_config
-        )
         try:
-            db_connect.connection_test(10)
+            if testing_connection is not None and \
+                    not db.session.is_modified(testing_connection):
+                # Unchanged saved connection, borrowing from the pool
+                # checks the connection without a new handshake.
+                with connection_pool.connector(testing_connection):
+                    pass
+            else:
+                db_connect = DatabaseConnector(
+                    int(request.form['type']),
+                    testing_config
+                )
+                db_connect.connection_test(10)
             return jsonify({
                 'connected': True
             })
@@ -15,8 +15,6 @@ __version__ = '0.1.3'
 # pylint: disable=C0103
 app = Flask(__name__)
 
-Compress(app)
-
 config = app.config
 app.config.update({
     'SQLALCHEMY_TRACK_MODIFICATIONS': False
@@ -28,14 +26,71 @@ rdb = FlaskRedis(app,
                  rq=True, rq_queues=['default', 'mailer'])
 
 lm = LoginManager()
-lm.init_app(app)
 lm.login_view = 'login'
 lm.session_protection = "strong"
 lm.login_message = "Please log in to continue!"
 lm.login_message_category = "alert-danger"
 
-mail = Mail(app)
+mail = Mail()
 
-socket_io = SocketIO(app)
+socket_io = SocketIO()
 
+_initialized_extensions = set()
 # pylint: enable=C0103
+
+ROLES = {
+    'web': ('compress', 'login', 'mail', 'socket_io'),
+    'worker': ('mail',),
+    'ftc': (),
+    'console': ()
+}
+
+
+def _init_compress(flask_app):
+    """Compress the web responses."""
+    Compress(flask_app)
+
+
+def _init_login(flask_app):
+    """Manage the users' logins."""
+    lm.init_app(flask_app)
+
+
+def _init_mail(flask_app):
+    """Send emails."""
+    mail.init_app(flask_app)
+
+
+def _init_socket_io(flask_app):
+    """Serve Socket.IO, which picks and loads its async mode."""
+    socket_io.init_app(flask_app)
+
+
+EXTENSION_INITIALIZERS = {
+    'compress': _init_compress,
+    'login': _init_login,
+    'mail': _init_mail,
+    'socket_io': _init_socket_io
+}
+
+
+def create_app(role='web'):
+    """
+    Initialize the extensions which a role of process uses.
+
+    The database and Redis are always set up, Redis connects on first
+    use. Other extensions are initialized once, by the first role
+    which needs them, so workers, the frequency task checker and
+    console commands do not set up the web stack.
+
+    :param role: web, worker, ftc or console.
+    :return: The Flask application.
+    """
+    if role not in ROLES:
+        raise ValueError("Unknown role {role}.".format(role=role))
+
+    for extension in ROLES[role]:
+        if extension not in _initialized_extensions:
+            EXTENSION_INITIALIZERS[extension](app)
+            _initialized_extensions.add(extension)
+    return app
@@ -0,0 +1,72 @@
+"""
+Benchmark of DanceCats' import time.
+
+Every sample imports the modules in a new interpreter, so nothing is
+cached between samples. The modules are imported once as they are,
+with the drivers loaded on first use, and once after importing all the
+drivers like DatabaseConnector used to at module load.
+
+Run from the repository's root:
+    python benchmarks/import_time.py [--repeat 10]
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+MODULES = 'DanceCats.Views, DanceCats.Socket, DanceCats.JobWorker'
+DRIVERS = 'pymssql, psycopg2, mysql.connector'
+
+SAMPLE_SCRIPT = """
+import sys
+import time
+started_on = time.time()
+{imports}
+sys.stdout.write(repr(time.time() - started_on))
+"""
+
+
+def sample(imports):
+    """Return seconds spent on the imports in a new interpreter."""
+    return float(subprocess.check_output(
+        [sys.executable, '-c', SAMPLE_SCRIPT.format(imports=imports)],
+        cwd=ROOT_PATH
+    ))
+
+
+def median(values):
+    """Return the median of values."""
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main():
+    """Print the median import time of each case."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of samples of each case.')
+    args = parser.parse_args()
+
+    cases = [
+        ('drivers only', 'import ' + DRIVERS),
+        ('lazy drivers', 'import ' + MODULES),
+        ('eager drivers', 'import {0}\nimport {1}'.format(DRIVERS, MODULES))
+    ]
+    for name, imports in cases:
+        samples = [sample(imports) for _ in range(0, args.repeat)]
+        print('{name:<15} median {median:8.1f} ms, min {min:8.1f} ms'.format(
+            name=name,
+            median=median(samples) * 1000,
+            min=min(samples) * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main()
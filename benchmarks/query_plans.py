@@ -0,0 +1,171 @@
+"""
+Benchmark of the schedule and tracker hot queries.
+
+Seeds a SQLite database with many schedules and trackers, then prints
+the query plan and the median time of each query and checks the plans
+use the expected indexes. Exits with an error when one does not.
+
+Run from the repository's root:
+    python benchmarks/query_plans.py [--schedules 100000] [--trackers 1000000]
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__)
+)))
+
+# pylint: disable=C0413
+from DanceCats import app, db, Constants  # noqa: E402
+from DanceCats.Models import Schedule, TrackJobRun, Job, \
+    Connection  # noqa: E402
+
+
+def seed(schedule_count, tracker_count, job_count=1000):
+    """Insert users, jobs, schedules and trackers in bulk."""
+    now = datetime.datetime.now()
+    db.engine.execute(
+        "INSERT INTO user (id, email, password, isActive, version) "
+        "VALUES (1, 'bench@dancecats.local', '', 1, 1)"
+    )
+    db.engine.execute(Job.__table__.insert(), [
+        {'id': job_id, 'name': 'job', 'commands': 'select 1', 'userId': 1,
+         'noOfExecuted': 0, 'jobType': Constants.JOB_QUERY,
+         'isDeleted': False, 'version': 1}
+        for job_id in range(1, job_count + 1)
+    ])
+
+    db.engine.execute(Schedule.__table__.insert(), [
+        {'jobId': random.randint(1, job_count),
+         'isActive': random.random() < 0.2,
+         'isDeleted': random.random() < 0.1,
+         'scheduleType': Constants.SCHEDULE_DAILY,
+         'nextRun': now + datetime.timedelta(
+             minutes=random.randint(-60, 60 * 24)
+         ),
+         'secondOffset': 0, 'userId': 1, 'version': 1}
+        for _ in range(0, schedule_count)
+    ])
+
+    batch_size = 50000
+    for start in range(0, tracker_count, batch_size):
+        rows = []
+        for _ in range(start, min(start + batch_size, tracker_count)):
+            scheduled_on = now - datetime.timedelta(
+                seconds=random.randint(0, 86400 * 90)
+            )
+            status = Constants.JOB_QUEUED if random.random() < 0.01 \
+                else Constants.JOB_RAN_SUCCESS
+            rows.append({
+                'jobId': random.randint(1, job_count),
+                'scheduledOn': scheduled_on,
+                'ranOn': None if status == Constants.JOB_QUEUED
+                else scheduled_on,
+                'duration': 0, 'status': status, 'version': 1
+            })
+        db.engine.execute(TrackJobRun.__table__.insert(), rows)
+    db.engine.execute('ANALYZE')
+
+
+def hot_queries():
+    """Return (name, query, expected index) of the hot queries."""
+    now = datetime.datetime.now()
+    return [
+        ('outdated schedules',
+         Schedule.query.filter(Schedule.is_active,
+                               Schedule.next_run <= now),
+         'ix_schedule_active_next_run'),
+        ('latest tracker of a job',
+         TrackJobRun.query.filter_by(job_id=7).order_by(
+             TrackJobRun.ran_on.desc()
+         ).limit(1),
+         'ix_track_job_run_job_ran_on'),
+        ('queued trackers',
+         TrackJobRun.query.filter(
+             TrackJobRun.status == Constants.JOB_QUEUED,
+             TrackJobRun.scheduled_on < now - datetime.timedelta(hours=1)
+         ),
+         'ix_track_job_run_status_scheduled_on'),
+        ('recent trackers',
+         db.session.query(
+             TrackJobRun, Job.name, Connection.database
+         ).join(
+             Job, TrackJobRun.job_id == Job.job_id
+         ).outerjoin(
+             Connection, Job.connection_id == Connection.connection_id
+         ).order_by(
+             TrackJobRun.track_job_run_id.desc()
+         ).limit(20),
+         None)
+    ]
+
+
+def explain(query):
+    """Return the SQLite query plan of a query, one step per line."""
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    return [list(row)[-1] for row in db.engine.execute(
+        'EXPLAIN QUERY PLAN ' + str(compiled), params
+    )]
+
+
+def median_seconds(query, repeat):
+    """Return the median time of running a query."""
+    samples = []
+    for _ in range(0, repeat):
+        started_on = time.time()
+        query.all()
+        samples.append(time.time() - started_on)
+    return sorted(samples)[len(samples) // 2]
+
+
+def main():
+    """Seed the database, print and check the plans."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--schedules', type=int, default=100000)
+    parser.add_argument('--trackers', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = tempfile.mktemp(suffix='.db')
+    app.config.update({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        'DB_ENCRYPT_KEY': 'benchmark'
+    })
+    failures = []
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.schedules, args.trackers)
+
+            for name, query, index_name in hot_queries():
+                plan = explain(query)
+                print('{name}: {ms:.2f} ms'.format(
+                    name=name,
+                    ms=median_seconds(query, args.repeat) * 1000
+                ))
+                for step in plan:
+                    print('    ' + step)
+                if index_name is not None and \
+                        not any(index_name in step for step in plan):
+                    failures.append(name)
+                if any('TEMP B-TREE' in step for step in plan):
+                    failures.append(name)
+            db.session.remove()
+    finally:
+        os.remove(db_path)
+
+    if failures:
+        print('Not using indexes: ' + ', '.join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
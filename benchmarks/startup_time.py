@@ -0,0 +1,80 @@
+"""
+Benchmark of DanceCats' startup time by role.
+
+Every sample starts a new interpreter, imports the modules a role of
+process loads and calls create_app with the role. The "eager" case
+initializes every extension, like importing DanceCats used to do.
+
+Run from the repository's root:
+    python benchmarks/startup_time.py [--repeat 10]
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+ROLE_MODULES = {
+    'web': 'DanceCats.Views, DanceCats.ErrorViews, DanceCats.Socket',
+    'worker': 'DanceCats.JobWorker',
+    'ftc': 'DanceCats.FrequencyTaskChecker',
+    'console': 'DanceCats.Console'
+}
+
+SAMPLE_SCRIPT = """
+import sys
+import time
+started_on = time.time()
+import DanceCats
+import {modules}
+for role in {roles!r}:
+    DanceCats.create_app(role)
+sys.stdout.write(repr(time.time() - started_on))
+"""
+
+
+def sample(modules, roles):
+    """Return seconds spent starting up in a new interpreter."""
+    return float(subprocess.check_output(
+        [sys.executable, '-c',
+         SAMPLE_SCRIPT.format(modules=modules, roles=roles)],
+        cwd=ROOT_PATH
+    ))
+
+
+def median(values):
+    """Return the median of values."""
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main():
+    """Print the median startup time of each role."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Number of samples of each role.')
+    args = parser.parse_args()
+
+    for role in ['web', 'worker', 'ftc', 'console']:
+        for case, roles in [('lazy', [role]), ('eager', ['web', role])]:
+            samples = [sample(ROLE_MODULES[role], roles)
+                       for _ in range(0, args.repeat)]
+            print(
+                '{role:<8} {case:<6} median {median:8.1f} ms, '
+                'min {min:8.1f} ms'.format(
+                    role=role,
+                    case=case,
+                    median=median(samples) * 1000,
+                    min=min(samples) * 1000
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
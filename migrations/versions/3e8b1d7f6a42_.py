@@ -0,0 +1,24 @@
+"""Add second offset to schedules.
+
+Revision ID: 3e8b1d7f6a42
+Revises: 9a6f2c4e8d13
+Create Date: 2026-10-18 00:41:27.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8b1d7f6a42'
+down_revision = '9a6f2c4e8d13'
+
+
+def upgrade():
+    """Add secondOffset to Schedule."""
+    op.add_column('schedule', sa.Column('secondOffset', sa.SmallInteger(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    """Remove secondOffset from Schedule."""
+    op.drop_column('schedule', 'secondOffset')
@@ -0,0 +1,24 @@
+"""Add resultLocation to TrackJobRun.
+
+Revision ID: 4c2d0f9e7a1b
+Revises: 821afc6cf29b
+Create Date: 2026-10-17 21:40:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2d0f9e7a1b'
+down_revision = '821afc6cf29b'
+
+
+def upgrade():
+    """Add resultLocation to TrackJobRun."""
+    op.add_column('track_job_run', sa.Column('resultLocation', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    """Remove resultLocation from TrackJobRun."""
+    op.drop_column('track_job_run', 'resultLocation')
@@ -0,0 +1,24 @@
+"""Add concurrent jobs limit to connections.
+
+Revision ID: 5c4a9e2b7d61
+Revises: 3e8b1d7f6a42
+Create Date: 2026-10-18 01:12:53.274018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c4a9e2b7d61'
+down_revision = '3e8b1d7f6a42'
+
+
+def upgrade():
+    """Add maxConcurrentJobs to Connection."""
+    op.add_column('connection', sa.Column('maxConcurrentJobs', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    """Remove maxConcurrentJobs from Connection."""
+    op.drop_column('connection', 'maxConcurrentJobs')
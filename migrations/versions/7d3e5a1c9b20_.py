@@ -0,0 +1,24 @@
+"""Add fencingToken to TrackJobRun.
+
+Revision ID: 7d3e5a1c9b20
+Revises: 4c2d0f9e7a1b
+Create Date: 2026-10-17 23:05:41.527310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e5a1c9b20'
+down_revision = '4c2d0f9e7a1b'
+
+
+def upgrade():
+    """Add fencingToken to TrackJobRun."""
+    op.add_column('track_job_run', sa.Column('fencingToken', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    """Remove fencingToken from TrackJobRun."""
+    op.drop_column('track_job_run', 'fencingToken')
@@ -0,0 +1,31 @@
+"""Add cron schedules.
+
+Revision ID: 9a6f2c4e8d13
+Revises: 7d3e5a1c9b20
+Create Date: 2026-10-17 23:48:09.104622
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6f2c4e8d13'
+down_revision = '7d3e5a1c9b20'
+
+
+def upgrade():
+    """Add cronExpression to Schedule and ScheduleOccurrence table."""
+    op.add_column('schedule', sa.Column('cronExpression', sa.String(length=255), nullable=True))
+    op.create_table('schedule_occurrence',
+                    sa.Column('scheduleId', sa.Integer(), nullable=False),
+                    sa.Column('runOn', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['scheduleId'], ['schedule.id'], ),
+                    sa.PrimaryKeyConstraint('scheduleId', 'runOn')
+    )
+
+
+def downgrade():
+    """Remove ScheduleOccurrence table and cronExpression from Schedule."""
+    op.drop_table('schedule_occurrence')
+    op.drop_column('schedule', 'cronExpression')
@@ -0,0 +1,29 @@
+"""Add indexes for schedule and tracker lookups.
+
+Revision ID: d4b7e1a9c3f5
+Revises: 5c4a9e2b7d61
+Create Date: 2026-10-18 03:26:41.608315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b7e1a9c3f5'
+down_revision = '5c4a9e2b7d61'
+
+
+def upgrade():
+    """Index active schedules by next run and trackers by job and status."""
+    ran_on = op.get_bind().dialect.identifier_preparer.quote('ranOn')
+    op.create_index('ix_schedule_active_next_run', 'schedule', ['isActive', 'isDeleted', 'nextRun'], unique=False)
+    op.create_index('ix_track_job_run_job_ran_on', 'track_job_run', ['jobId', sa.text(ran_on + ' DESC')], unique=False)
+    op.create_index('ix_track_job_run_status_scheduled_on', 'track_job_run', ['status', 'scheduledOn'], unique=False)
+
+
+def downgrade():
+    """Remove the indexes of schedule and tracker lookups."""
+    op.drop_index('ix_track_job_run_status_scheduled_on', table_name='track_job_run')
+    op.drop_index('ix_track_job_run_job_ran_on', table_name='track_job_run')
+    op.drop_index('ix_schedule_active_next_run', table_name='schedule')
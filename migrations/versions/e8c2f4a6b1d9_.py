@@ -0,0 +1,49 @@
+"""Add archive and daily aggregates of trackers.
+
+Revision ID: e8c2f4a6b1d9
+Revises: d4b7e1a9c3f5
+Create Date: 2026-10-18 05:12:09.274851
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c2f4a6b1d9'
+down_revision = 'd4b7e1a9c3f5'
+
+
+def upgrade():
+    """Create tables of archived trackers and daily runs."""
+    op.create_table('track_job_run_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('jobId', sa.Integer(), nullable=False),
+    sa.Column('scheduleId', sa.Integer(), nullable=True),
+    sa.Column('scheduledOn', sa.DateTime(), nullable=False),
+    sa.Column('ranOn', sa.DateTime(), nullable=True),
+    sa.Column('duration', sa.Integer(), nullable=False),
+    sa.Column('status', sa.SmallInteger(), nullable=False),
+    sa.Column('errorSummary', sa.String(length=255), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_track_job_run_archive_scheduledOn'), 'track_job_run_archive', ['scheduledOn'], unique=False)
+    op.create_index('ix_track_job_run_archive_job_scheduled_on', 'track_job_run_archive', ['jobId', 'scheduledOn'], unique=False)
+    op.create_table('job_run_daily',
+    sa.Column('jobId', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('runs', sa.Integer(), nullable=False),
+    sa.Column('succeeded', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('totalDuration', sa.BigInteger(), nullable=False),
+    sa.Column('maxDuration', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('jobId', 'day')
+    )
+
+
+def downgrade():
+    """Remove tables of archived trackers and daily runs."""
+    op.drop_table('job_run_daily')
+    op.drop_index('ix_track_job_run_archive_job_scheduled_on', table_name='track_job_run_archive')
+    op.drop_index(op.f('ix_track_job_run_archive_scheduledOn'), table_name='track_job_run_archive')
+    op.drop_table('track_job_run_archive')
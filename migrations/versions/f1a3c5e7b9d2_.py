@@ -0,0 +1,28 @@
+"""Add fencing tokens of leader locks.
+
+Revision ID: f1a3c5e7b9d2
+Revises: e8c2f4a6b1d9
+Create Date: 2026-10-18 09:41:27.516304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c5e7b9d2'
+down_revision = 'e8c2f4a6b1d9'
+
+
+def upgrade():
+    """Create the table of leader locks' fencing tokens."""
+    op.create_table('fencing_token',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('token', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    """Remove the table of leader locks' fencing tokens."""
+    op.drop_table('fencing_token')
@@ -3,14 +3,15 @@
 import os
 import datetime
 import pytest
-from DanceCats import app as dancecats_app
-from DanceCats import db, Constants, Models
+from DanceCats import create_app
+from DanceCats import db, rdb, Constants, Models
 
 
 db_dir_path = os.path.dirname(os.path.realpath(__file__)) + '/.unittest'
 if not os.path.exists(db_dir_path):
     os.mkdir(db_dir_path)
 db_file_path = db_dir_path + '/test_db.db'
+redis_file_path = db_dir_path + '/test_redis.db'
 
 
 @pytest.fixture
@@ -19,10 +20,12 @@ def app():
     if db.session:
         db.session.remove()
 
+    dancecats_app = create_app('web')
     dancecats_app.config.update({
         'SQLALCHEMY_DATABASE_URI': ('sqlite:///' + db_file_path),
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
-        'DB_ENCRYPT_KEY': 'easy to guess!\\'
+        'DB_ENCRYPT_KEY': 'easy to guess!\\',
+        'REDISLITE_PATH': redis_file_path
     })
 
     try:
@@ -34,6 +37,13 @@ def app():
     return dancecats_app
 
 
+@pytest.fixture
+def connection(app):
+    """Return Redis connection."""
+    with app.app_context():
+        return rdb.connection
+
+
 @pytest.fixture
 def user_email():
     """Return test email."""
@@ -0,0 +1,53 @@
+"""Unit tests for DanceCats' application factory."""
+
+from __future__ import print_function
+import sys
+import subprocess
+import DanceCats
+import pytest
+
+
+def test_worker_role_skip_web_stack():
+    """Test the worker role does not set up Socket.IO."""
+    loaded = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys\n'
+        'import DanceCats, DanceCats.JobWorker\n'
+        'app = DanceCats.create_app("worker")\n'
+        'print(",".join(sorted(app.extensions)))\n'
+        'print(DanceCats.socket_io.server is None)\n'
+        'print("eventlet" in sys.modules)'
+    ]).split()
+    assert loaded[1:] == ['True', 'False']
+    assert 'mail' in loaded[0].split(',')
+    assert 'socketio' not in loaded[0].split(',')
+
+
+def test_frequency_checker_skip_web_stack():
+    """Test the frequency task checker does not set up the web stack."""
+    loaded = subprocess.check_output([
+        sys.executable, '-c',
+        'import DanceCats\n'
+        'from DanceCats import Console\n'
+        'Console.FrequencyTaskChecker.daemonize = lambda self: None\n'
+        'Console.frequency_checker()\n'
+        'print(",".join(sorted(DanceCats.app.extensions)) or "-")\n'
+        'print(DanceCats.socket_io.server is None)'
+    ]).split()
+    assert loaded[1] == 'True'
+    assert 'socketio' not in loaded[0].split(',')
+    assert 'mail' not in loaded[0].split(',')
+
+
+def test_create_app(app):
+    """Test extensions are initialized once by the roles needing them."""
+    assert DanceCats.create_app('web') is app
+    assert DanceCats.socket_io.server is not None
+    server = DanceCats.socket_io.server
+
+    assert DanceCats.create_app('worker') is app
+    assert DanceCats.create_app('web') is app
+    assert DanceCats.socket_io.server is server
+
+    with pytest.raises(ValueError):
+        DanceCats.create_app('unknown')
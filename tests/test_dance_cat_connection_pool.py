@@ -0,0 +1,179 @@
+"""Unit tests for DanceCats.ConnectionPool module."""
+
+from __future__ import print_function
+import datetime
+from DanceCats import Constants
+from DanceCats.ConnectionPool import ConnectionPool
+from DanceCats.DatabaseConnector import DatabaseConnector
+import pytest
+
+
+class FakeDriverConnection(object):
+    """Driver connection which records how it was used."""
+
+    def __init__(self):
+        """Start as a healthy connection."""
+        self.is_alive = True
+        self.is_closed = False
+
+    def cursor(self, *args, **kwargs):
+        """Return self as cursor, fail if the connection is dead."""
+        if not self.is_alive:
+            raise IOError('Connection is dead.')
+        return self
+
+    def execute(self, query):
+        """Do nothing."""
+        return None
+
+    def fetchall(self):
+        """Return a single row."""
+        return [(1,)]
+
+    def rollback(self):
+        """Do nothing."""
+        return None
+
+    def close(self):
+        """Mark as closed."""
+        self.is_closed = True
+
+
+class FakeMySQLConnection(FakeDriverConnection):
+    """Connection whose cursors refuse to close with unread rows."""
+
+    column_names = ('id',)
+
+    def __init__(self):
+        """Start without result."""
+        super(FakeMySQLConnection, self).__init__()
+        self.unread_result = False
+
+    def execute(self, query):
+        """Leave a result to be read."""
+        self.unread_result = True
+
+    def fetchmany(self, size=1):
+        """Return the first rows of a larger result."""
+        return [(1,)] * size
+
+    def fetchall(self):
+        """Read the rest of the result."""
+        self.unread_result = False
+        return [(1,)]
+
+    def consume_results(self):
+        """Read the rest of the result."""
+        self.unread_result = False
+
+    def close(self):
+        """Fail as mysql.connector does when rows are left unread."""
+        if self.unread_result:
+            raise IOError('Unread result found')
+        super(FakeMySQLConnection, self).close()
+
+
+class FakeConnectionModel(object):
+    """Minimal Connection Model object."""
+
+    def __init__(self, connection_id, last_updated,
+                 connection_type=Constants.DB_POSTGRESQL):
+        """Set the pool key's attributes."""
+        self.connection_id = connection_id
+        self.last_updated = last_updated
+        self.type = connection_type
+
+    @staticmethod
+    def db_config_generator():
+        """Return an empty config."""
+        return {}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Return a pool whose connectors connect to fake connections."""
+    def fake_connect(self, timeout=None):
+        self.connection = FakeMySQLConnection() \
+            if self.type == Constants.DB_MYSQL else FakeDriverConnection()
+
+    monkeypatch.setattr(DatabaseConnector, 'connect', fake_connect)
+    return ConnectionPool({
+        'CONNECTION_POOL_MAX_SIZE': 1,
+        'CONNECTION_POOL_IDLE_SECONDS': 300
+    })
+
+
+def test_reuse_released_connector(pool):
+    """Test the same Connection reuses the released connector."""
+    connection = FakeConnectionModel(1, datetime.datetime(2016, 9, 1))
+
+    with pool.connector(connection, dict_format=True) as first_connector:
+        assert first_connector.is_return_dict
+
+    with pool.connector(connection) as second_connector:
+        assert second_connector is first_connector
+        assert not second_connector.is_return_dict
+
+
+def test_reuse_partially_fetched_connector(pool):
+    """Test rows left unread are discarded before reusing a connector."""
+    connection = FakeConnectionModel(1, datetime.datetime(2016, 9, 1),
+                                     Constants.DB_MYSQL)
+
+    with pool.connector(connection) as first_connector:
+        first_connector.execute('select * from large_table')
+        assert first_connector.fetch_many(2) == [(1,), (1,)]
+
+    with pool.connector(connection) as second_connector:
+        assert second_connector is first_connector
+
+
+def test_do_not_reuse_edited_connection(pool):
+    """Test editing a Connection closes connectors of the old version."""
+    connection = FakeConnectionModel(1, datetime.datetime(2016, 9, 1))
+    with pool.connector(connection) as old_connector:
+        pass
+
+    connection.last_updated = datetime.datetime(2016, 9, 2)
+    with pool.connector(connection) as new_connector:
+        assert new_connector is not old_connector
+    assert old_connector.connection.is_closed
+
+
+def test_close_dead_and_failed_connectors(pool):
+    """Test dead idle connectors and failed blocks are not reused."""
+    connection = FakeConnectionModel(1, datetime.datetime(2016, 9, 1))
+    with pool.connector(connection) as dead_connector:
+        pass
+    dead_connector.connection.is_alive = False
+
+    with pytest.raises(ValueError):
+        with pool.connector(connection) as failed_connector:
+            assert failed_connector is not dead_connector
+            raise ValueError('Query failed.')
+    assert failed_connector.connection.is_closed
+
+    with pool.connector(connection) as connector:
+        assert connector is not failed_connector
+
+
+def test_evict_idle_and_exceeded_connectors(pool):
+    """Test pool size limit and idle eviction."""
+    connection = FakeConnectionModel(1, datetime.datetime(2016, 9, 1))
+    first_connector = pool.borrow(connection)
+    second_connector = pool.borrow(connection)
+    pool.release(first_connector)
+    pool.release(second_connector)
+    assert second_connector.connection.is_closed
+
+    pool.config['CONNECTION_POOL_IDLE_SECONDS'] = -1
+    pool.borrow(FakeConnectionModel(2, datetime.datetime(2016, 9, 1)))
+    assert first_connector.connection.is_closed
+
+
+def test_do_not_pool_unsaved_connection(pool):
+    """Test connectors of unsaved Connections are closed on release."""
+    connection = FakeConnectionModel(None, None)
+    with pool.connector(connection) as connector:
+        pass
+    assert connector.connection.is_closed
@@ -142,3 +142,53 @@ def test_connection_upgrade(app, user_email):
         updated_connection.password,
         app.config.get('DB_ENCRYPT_KEY')
     ) == connection_password
+
+
+def test_schedule_update_enqueue_missed(app_setup_to_add_job, monkeypatch):
+    """Test schedule_update enqueues one missed run per schedule."""
+    job_id = app_setup_to_add_job['job_id']
+    Models.QueryDataJob.query.get(job_id).connection_id = \
+        Models.Connection.query.first().connection_id
+    inactive_job = Models.QueryDataJob('inactive job', 'select 1',
+                                       app_setup_to_add_job['user_id'])
+    db.session.add(inactive_job)
+    db.session.commit()
+
+    schedule_ids = []
+    for schedule_job_id, schedule_type, kwargs in [
+        (job_id, Constants.SCHEDULE_HOURLY, {}),
+        (job_id, Constants.SCHEDULE_MONTHLY, {}),
+        (job_id, Constants.SCHEDULE_CRON, {'cron_expression': '5 * * * *'}),
+        (inactive_job.job_id, Constants.SCHEDULE_DAILY, {})
+    ]:
+        schedule = Models.Schedule(
+            job_id=schedule_job_id,
+            start_time=datetime.datetime.now() - relativedelta(days=40),
+            user_id=app_setup_to_add_job['user_id'],
+            is_active=True,
+            schedule_type=schedule_type,
+            **kwargs
+        )
+        db.session.add(schedule)
+        db.session.commit()
+        schedule.next_run = datetime.datetime.now() - relativedelta(days=3)
+        db.session.commit()
+        schedule_ids.append(schedule.schedule_id)
+
+    enqueued = []
+    monkeypatch.setattr(
+        Console, 'enqueue_query_jobs',
+        lambda trackers: enqueued.extend(
+            [tracker.schedule_id for tracker in trackers]
+        )
+    )
+    Console.schedule_update(enqueue_missed=True)
+
+    assert sorted(enqueued) == sorted(schedule_ids[:3])
+    assert Models.TrackJobRun.query.count() == 3
+    for schedule_id in schedule_ids:
+        assert Models.Schedule.query.get(schedule_id).next_run > \
+            datetime.datetime.now()
+
+    Console.schedule_update(enqueue_missed=True)
+    assert len(enqueued) == 3
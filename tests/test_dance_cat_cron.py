@@ -0,0 +1,118 @@
+"""Unit tests for DanceCats.Cron module."""
+
+from __future__ import print_function
+import datetime
+import random
+from DanceCats.Cron import CronExpression, CronExpressionError
+import pytest
+
+
+def brute_force_next_occurrence(cron, after, limit_minutes):
+    """Find the next occurrence by checking every minute."""
+    occurrence = after.replace(second=0, microsecond=0)
+    for _ in range(0, limit_minutes):
+        occurrence += datetime.timedelta(minutes=1)
+        is_day_of_month = cron.days_of_month & (1 << occurrence.day)
+        is_day_of_week = \
+            cron.days_of_week & (1 << ((occurrence.weekday() + 1) % 7))
+        if cron.is_any_day_of_month or cron.is_any_day_of_week:
+            is_day = is_day_of_month and is_day_of_week
+        else:
+            is_day = is_day_of_month or is_day_of_week
+        if cron.minutes & (1 << occurrence.minute) and \
+                cron.hours & (1 << occurrence.hour) and \
+                cron.months & (1 << occurrence.month) and is_day:
+            return occurrence
+    return None
+
+
+def test_compile_fields():
+    """Test fields are compiled into bitsets."""
+    cron = CronExpression('*/20 8-10,14 1 JAN-MAR/2 sun,7')
+
+    assert cron.minutes == (1 << 0) | (1 << 20) | (1 << 40)
+    assert cron.hours == (1 << 8) | (1 << 9) | (1 << 10) | (1 << 14)
+    assert cron.days_of_month == 1 << 1
+    assert cron.months == (1 << 1) | (1 << 3)
+    assert cron.days_of_week == 1
+    assert not cron.is_any_day_of_month
+    assert not cron.is_any_day_of_week
+
+
+@pytest.mark.parametrize('expression', [
+    '', '* * * *', '60 * * * *', '* * 0 * *', '5-1 * * * *',
+    '*/0 * * * *', 'a * * * *', '* * * * MON-FOO'
+])
+def test_invalid_expressions(expression):
+    """Test invalid expressions are rejected."""
+    with pytest.raises(CronExpressionError):
+        CronExpression(expression)
+
+
+def test_next_occurrence():
+    """Test next occurrences of business and calendar schedules."""
+    after = datetime.datetime(2016, 9, 1, 18, 30, 15)
+
+    assert CronExpression('*/15 8-18 * * MON-FRI').next_occurrences(
+        after, 3
+    ) == [
+        datetime.datetime(2016, 9, 1, 18, 45),
+        datetime.datetime(2016, 9, 2, 8, 0),
+        datetime.datetime(2016, 9, 2, 8, 15)
+    ]
+    assert CronExpression('0 0 29 2 *').next_occurrence(after) == \
+        datetime.datetime(2020, 2, 29)
+    assert CronExpression('0 0 1 * 1').next_occurrence(after) == \
+        datetime.datetime(2016, 9, 5)
+    assert CronExpression('0 0 30 2 *').next_occurrence(after) is None
+
+
+def test_stepped_wildcard_day():
+    """Test a stepped `*` day field restricts days as in Vixie cron."""
+    after = datetime.datetime(2016, 9, 1, 18, 30, 15)
+
+    cron = CronExpression('0 0 */2 * MON')
+    assert cron.is_any_day_of_month
+    assert cron.next_occurrences(after, 2) == [
+        datetime.datetime(2016, 9, 5),
+        datetime.datetime(2016, 9, 19)
+    ]
+    assert CronExpression('0 0 1 * */3').next_occurrence(after) == \
+        datetime.datetime(2016, 10, 1)
+
+
+def test_next_occurrence_as_brute_force():
+    """Test next occurrence is the same as checking every minute."""
+    generator = random.Random(13)
+
+    def random_field(lowest, highest):
+        first = generator.randint(lowest, highest)
+        last = generator.randint(first, highest)
+        return generator.choice([
+            '*',
+            str(first),
+            '{0}-{1}'.format(first, last),
+            '*/{0}'.format(generator.randint(1, highest - lowest + 1)),
+            '{0},{1}'.format(first, last)
+        ])
+
+    for _ in range(0, 50):
+        cron = CronExpression(' '.join([
+            random_field(0, 59),
+            random_field(0, 23),
+            random_field(1, 28),
+            generator.choice(['*', random_field(1, 12)]),
+            random_field(0, 6)
+        ]))
+        after = datetime.datetime(2016, 1, 1) + datetime.timedelta(
+            minutes=generator.randint(0, 2 * 366 * 1440),
+            seconds=generator.randint(0, 59)
+        )
+
+        # Only check the first 40 days to keep the brute force short.
+        occurrence = cron.next_occurrence(after)
+        if occurrence - after > datetime.timedelta(days=40):
+            occurrence = None
+        assert occurrence == brute_force_next_occurrence(
+            cron, after, 40 * 1440
+        ), (cron.expression, after)
@@ -0,0 +1,207 @@
+"""Unit tests for DanceCats.DatabaseConnector module."""
+
+from __future__ import print_function
+import sys
+import subprocess
+import datetime
+from decimal import Decimal
+import pymssql
+from eventlet import tpool
+from DanceCats import Constants
+from DanceCats import DatabaseConnector as database_connector
+from DanceCats.DatabaseConnector import DatabaseConnector
+
+
+class FakeCursor(object):
+    """DB-API like cursor which serves rows from memory."""
+
+    def __init__(self, columns, rows):
+        """Build description from columns' name and keep rows."""
+        self.description = tuple(
+            (column, None, None, None, None, None, None)
+            for column in columns
+        )
+        self.rows = list(rows)
+        self.fetch_sizes = []
+
+    def execute(self, query):
+        """Do nothing, rows are prepared."""
+        return None
+
+    def fetchone(self):
+        """Return the next row."""
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        """Return the next `size` rows."""
+        self.fetch_sizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        """Return all remaining rows."""
+        rows, self.rows = self.rows, []
+        return rows
+
+
+class FakeNamedCursor(FakeCursor):
+    """Cursor which only describe the result after the first fetch."""
+
+    def __init__(self, columns, rows):
+        """Hide the description until the first fetch."""
+        super(FakeNamedCursor, self).__init__(columns, rows)
+        self._description = self.description
+        self.description = None
+
+    def fetchmany(self, size=1):
+        """Describe the result and return the next `size` rows."""
+        self.description = self._description
+        return super(FakeNamedCursor, self).fetchmany(size)
+
+
+class FakeConnection(object):
+    """DB-API like connection which return the prepared cursor."""
+
+    def __init__(self, cursor):
+        """Keep the cursor."""
+        self._cursor = cursor
+        self.cursor_kwargs = None
+
+    def cursor(self, *args, **kwargs):
+        """Return the prepared cursor and record its options."""
+        self.cursor_kwargs = kwargs
+        return self._cursor
+
+    def close(self):
+        """Do nothing."""
+        return None
+
+
+def make_connector(columns, rows, cursor_class=FakeCursor, **kwargs):
+    """Return a PostgreSQL connector which is bound to a fake cursor."""
+    cursor = cursor_class(columns, rows)
+    connector = DatabaseConnector(Constants.DB_POSTGRESQL, {}, **kwargs)
+    connector.connection = FakeConnection(cursor)
+    connector.execute('select * from fake_table')
+    return connector, cursor
+
+
+def test_iter_rows_fetch_in_batches():
+    """Test iter_rows yields every row and fetches in bounded batches."""
+    rows = [(i, 'name %d' % i) for i in range(0, 25)]
+    connector, cursor = make_connector(('id', 'name'), rows)
+
+    assert list(connector.iter_rows(batch_size=10)) == rows
+    assert cursor.fetch_sizes == [10, 10, 10, 10]
+
+
+def test_iter_batches_use_default_batch_size():
+    """Test iter_batches fall back to the connector's batch size."""
+    rows = [(i,) for i in range(0, 7)]
+    connector, _ = make_connector(('id',), rows, batch_size=3)
+
+    assert [len(batch) for batch in connector.iter_batches()] == [3, 3, 1]
+
+
+def test_iter_rows_process_rows():
+    """Test iter_rows applies the same processing as fetch functions."""
+    rows = [
+        (1, 'secret', Decimal('1.5'), datetime.datetime(2016, 9, 1, 0, 0, 1)),
+        (2, None, None, None)
+    ]
+    columns = ('id', 'password', 'amount', 'created_on')
+
+    connector, _ = make_connector(columns, rows, sql_data_style=True)
+    assert list(connector.iter_rows()) == [
+        (1, None, '1.5', '2016-09-01 00:00:01'),
+        (2, None, 'NULL', 'NULL')
+    ]
+
+    connector, _ = make_connector(columns, rows, dict_format=True)
+    assert list(connector.iter_rows()) == [
+        {'id': 1, 'amount': Decimal('1.5'),
+         'created_on': datetime.datetime(2016, 9, 1, 0, 0, 1)},
+        {'id': 2, 'amount': None, 'created_on': None}
+    ]
+
+
+def test_server_side_cursor_keep_prefetched_rows():
+    """Test rows fetched to describe a named cursor are not lost."""
+    rows = [(i, 'name %d' % i) for i in range(0, 5)]
+    connector, cursor = make_connector(('id', 'name'), rows,
+                                       cursor_class=FakeNamedCursor,
+                                       server_side_cursor=True,
+                                       batch_size=2)
+
+    assert connector.columns_name == ('id', 'name')
+    assert cursor.fetch_sizes == [2]
+    assert connector.fetch() == rows[0]
+    assert connector.fetch_many(2) == rows[1:3]
+    assert connector.fetch_all() == rows[3:]
+
+
+def test_mysql_cursor_buffering():
+    """Test MySQL cursors are only unbuffered when streaming."""
+    for server_side_cursor, buffered in [(False, True), (True, False)]:
+        cursor = FakeCursor(('id',), [(1,)])
+        cursor.column_names = ('id',)
+        connector = DatabaseConnector(Constants.DB_MYSQL, {},
+                                      server_side_cursor=server_side_cursor)
+        connector.connection = FakeConnection(cursor)
+        connector.execute('select 1')
+        assert connector.connection.cursor_kwargs == {'buffered': buffered}
+        assert connector.fetch_all() == [(1,)]
+
+
+def test_row_processor_edge_cases():
+    """Test single kept column, all hidden columns and exhausted result."""
+    connector, _ = make_connector(('id', 'password'), [(1, 'secret')],
+                                  dict_format=True)
+    assert connector.fetch() == {'id': 1}
+    assert connector.fetch() is None
+
+    connector, _ = make_connector(('password',), [('secret',)],
+                                  dict_format=True)
+    assert connector.fetch_all() == [{}]
+
+    connector, _ = make_connector(('id', 'name'), [(1, None)],
+                                  sql_data_style=True)
+    assert connector.fetch_many(5) == [(1, 'NULL')]
+
+
+def test_blocking_driver_in_thread_pool(monkeypatch):
+    """Test SQL Server connections are run through the thread pool."""
+    cursor = FakeCursor(('id',), [(1,), (2,)])
+    monkeypatch.setattr(pymssql, 'connect',
+                        lambda **kwargs: FakeConnection(cursor))
+    monkeypatch.setattr(DatabaseConnector, 'thread_pool', tpool)
+
+    connector = DatabaseConnector(Constants.DB_SQLSERVER, {})
+    connector.connect()
+    assert isinstance(connector.connection, tpool.Proxy)
+    assert isinstance(connector.connection.cursor(), tpool.Proxy)
+
+    connector.execute('select id from fake_table')
+    assert connector.fetch_all() == [(1,), (2,)]
+    connector.close()
+
+
+def test_drivers_imported_on_first_use(monkeypatch):
+    """Test loading DanceCats does not import any database driver."""
+    loaded_drivers = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys\n'
+        'import DanceCats.Views, DanceCats.Socket, DanceCats.JobWorker\n'
+        'print(sorted(set(sys.modules) & '
+        'set(["pymssql", "psycopg2", "mysql.connector"])))'
+    ])
+    assert loaded_drivers.strip() == '[]'
+
+    monkeypatch.setattr(database_connector, '_drivers', {})
+    monkeypatch.setattr(database_connector, 'DRIVER_MODULES',
+                        dict(database_connector.DRIVER_MODULES))
+    assert database_connector.get_driver(Constants.DB_SQLSERVER) is pymssql
+    assert database_connector.get_driver(-1) is None
+
+    database_connector.register_driver(-1, 'sqlite3')
+    assert database_connector.get_driver(-1).__name__ == 'sqlite3'
@@ -0,0 +1,89 @@
+"""Unit tests for DanceCats.ExportCache module."""
+
+from __future__ import print_function
+import os
+import time
+from DanceCats import Constants
+from DanceCats import ExportCache
+from DanceCats import ResultStorage
+import pytest
+
+
+class FakeTracker(object):
+    """Minimal TrackJobRun Model object."""
+
+    def __init__(self, tracker_id, status=Constants.JOB_RAN_SUCCESS):
+        """Set tracker id and status."""
+        self.track_job_run_id = tracker_id
+        self.status = status
+        self.result_location = None
+
+
+@pytest.fixture
+def opened_readers(request, app, tmpdir, monkeypatch):
+    """Export into a temporary folder and record opened readers."""
+    app.config['EXPORT_CACHE_FOLDER'] = str(tmpdir.join('exports'))
+    request.addfinalizer(lambda: app.config.pop('EXPORT_CACHE_FOLDER'))
+
+    opened = []
+
+    def open_tracker_reader(tracker):
+        opened.append(tracker.track_job_run_id)
+        return ResultStorage.RowsResultReader(
+            ('id', 'name'), [(i, 'name %d' % i) for i in range(0, 50)]
+        )
+
+    monkeypatch.setattr(ResultStorage, 'open_tracker_reader',
+                        open_tracker_reader)
+    return opened
+
+
+def test_would_render_export_once(opened_readers):
+    """Test an export is rendered once per tracker and format."""
+    path = ExportCache.get_export(FakeTracker(1), 'xlsx')
+    assert os.path.getsize(path) > 0
+    assert ExportCache.get_export(FakeTracker(1), 'xlsx') == path
+    assert opened_readers == [1]
+
+    ExportCache.get_export(FakeTracker(1), 'ods')
+    assert opened_readers == [1, 1]
+
+    ExportCache.remove(1)
+    assert os.listdir(ExportCache.export_folder()) == []
+
+
+def test_would_not_export_unsuccessful_run(opened_readers):
+    """Test only results of successful runs are exported."""
+    assert ExportCache.get_export(None, 'xlsx') is None
+    for status in [Constants.JOB_RAN_FAILED, Constants.JOB_RESULT_EXPIRED]:
+        assert ExportCache.get_export(FakeTracker(1, status), 'xlsx') is None
+    assert opened_readers == []
+
+
+def test_would_render_expired_export_again(opened_readers, app):
+    """Test expired exports are rendered again."""
+    path = ExportCache.get_export(FakeTracker(1), 'xlsx')
+    expired_on = time.time() - \
+        app.config.get('JOB_RESULT_VALID_SECONDS', 86400) - 1
+    os.utime(path, (expired_on, expired_on))
+
+    ExportCache.get_export(FakeTracker(1), 'xlsx')
+    assert opened_readers == [1, 1]
+
+
+def test_would_evict_least_recently_used(opened_readers, app):
+    """Test exports are evicted by access time to fit the byte budget."""
+    first_path = ExportCache.get_export(FakeTracker(1), 'xlsx')
+    second_path = ExportCache.get_export(FakeTracker(2), 'xlsx')
+    os.utime(second_path, (time.time() - 10, os.path.getmtime(second_path)))
+    ExportCache.get_export(FakeTracker(1), 'xlsx')
+
+    app.config['EXPORT_CACHE_MAX_BYTES'] = \
+        os.path.getsize(first_path) + os.path.getsize(second_path) // 2
+    try:
+        ExportCache.evict()
+    finally:
+        app.config.pop('EXPORT_CACHE_MAX_BYTES')
+
+    assert os.path.exists(first_path)
+    assert not os.path.exists(second_path)
@@ -0,0 +1,45 @@
+"""Unit tests for DanceCats.Forms module."""
+
+from __future__ import print_function
+from werkzeug.datastructures import MultiDict
+from DanceCats import Constants
+from DanceCats.Forms import ScheduleForm
+import pytest
+
+
+@pytest.fixture
+def schedule_form(app):
+    """Return a function building a ScheduleForm from posted values."""
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    def build(**values):
+        posted = {
+            'next_run': '2016-09-01 08:00',
+            'second_offset': '0'
+        }
+        posted.update(values)
+        with app.test_request_context():
+            form = ScheduleForm(MultiDict(posted))
+            form.validate()
+            return form
+
+    return build
+
+
+def test_cron_expression(schedule_form):
+    """Test Cron schedules need a valid cron expression."""
+    cron = str(Constants.SCHEDULE_CRON)
+
+    form = schedule_form(schedule_type=cron, cron_expression='')
+    assert 'cron_expression' in form.errors
+    form = schedule_form(schedule_type=cron, cron_expression='   ')
+    assert 'cron_expression' in form.errors
+    form = schedule_form(schedule_type=cron, cron_expression='* * *')
+    assert 'cron_expression' in form.errors
+    form = schedule_form(schedule_type=cron,
+                         cron_expression='*/15 8-18 * * MON-FRI')
+    assert not form.errors
+
+    form = schedule_form(schedule_type=str(Constants.SCHEDULE_DAILY),
+                         cron_expression='')
+    assert not form.errors
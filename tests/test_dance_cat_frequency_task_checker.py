@@ -0,0 +1,274 @@
+"""Unit tests for DanceCats.FrequencyTaskChecker module."""
+
+from __future__ import print_function
+import datetime
+import math
+import uuid
+from DanceCats import db, rdb, Constants, Helpers, Models
+from DanceCats.FrequencyTaskChecker import FrequencyTaskChecker
+import pytest
+
+
+@pytest.fixture
+def checker(app_setup_to_add_job, freeze_datetime, monkeypatch):
+    """Return a checker which records enqueued schedules."""
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 0, 30))
+    job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+    job.connection_id = Models.Connection.query.first().connection_id
+    db.session.commit()
+
+    frequency_task_checker = FrequencyTaskChecker(interval=600,
+                                                  lease_seconds=3600)
+    frequency_task_checker.enqueued = []
+    monkeypatch.setattr(
+        frequency_task_checker, 'enqueue_trackers',
+        lambda trackers: frequency_task_checker.enqueued.extend(
+            [tracker.schedule_id for tracker in trackers]
+        )
+    )
+    return frequency_task_checker
+
+
+def add_schedule(job_id, user_id, start_time, **kwargs):
+    """Add an active schedule and return its id."""
+    kwargs.setdefault('is_active', True)
+    schedule = Models.Schedule(job_id, start_time, user_id, **kwargs)
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule.schedule_id
+
+
+def test_would_enqueue_due_schedules(checker, app_setup_to_add_job,
+                                     freeze_datetime):
+    """Test schedules are enqueued at their run in time order."""
+    job_id = app_setup_to_add_job['job_id']
+    user_id = app_setup_to_add_job['user_id']
+    hourly_id = add_schedule(job_id, user_id,
+                             datetime.datetime(2016, 9, 1, 10, 5),
+                             schedule_type=Constants.SCHEDULE_HOURLY)
+    once_id = add_schedule(job_id, user_id,
+                           datetime.datetime(2016, 9, 1, 10, 3))
+    add_schedule(job_id, user_id, datetime.datetime(2016, 9, 1, 10, 2),
+                 is_active=False)
+
+    checker.task_checker()
+    assert checker.enqueued == []
+    assert checker.seconds_to_next_run() == 150
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 3, 2, 400))
+    checker.task_checker()
+    assert checker.enqueued == [once_id]
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 5, 3))
+    checker.task_checker()
+    assert checker.enqueued == [once_id, hourly_id]
+    assert Models.Schedule.query.get(hourly_id).next_run == \
+        datetime.datetime(2016, 9, 1, 11, 5)
+    assert checker.seconds_to_next_run() == 600
+
+
+def test_would_refresh_changed_schedules(checker, app_setup_to_add_job,
+                                         freeze_datetime):
+    """Test edited and deactivated schedules are picked up."""
+    job_id = app_setup_to_add_job['job_id']
+    user_id = app_setup_to_add_job['user_id']
+    edited_id = add_schedule(job_id, user_id,
+                             datetime.datetime(2016, 9, 1, 10, 30),
+                             schedule_type=Constants.SCHEDULE_DAILY)
+    deactivated_id = add_schedule(job_id, user_id,
+                                  datetime.datetime(2016, 9, 1, 10, 2))
+    checker.task_checker()
+
+    edited_schedule = Models.Schedule.query.get(edited_id)
+    edited_schedule.update_start_time(datetime.datetime(2016, 9, 1, 10, 4))
+    Models.Schedule.query.get(deactivated_id).is_active = False
+    db.session.commit()
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 4, 2))
+    checker.task_checker()
+    assert checker.enqueued == [edited_id]
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 30, 2))
+    checker.task_checker()
+    assert checker.enqueued == [edited_id]
+
+
+def test_would_skip_missed_runs(checker, app_setup_to_add_job):
+    """Test runs missed while the checker was stopped are not enqueued."""
+    schedule_id = add_schedule(app_setup_to_add_job['job_id'],
+                               app_setup_to_add_job['user_id'],
+                               datetime.datetime(2016, 9, 1, 10, 5),
+                               schedule_type=Constants.SCHEDULE_HOURLY)
+    schedule = Models.Schedule.query.get(schedule_id)
+    schedule.next_run = datetime.datetime(2016, 8, 30, 10, 5)
+    db.session.commit()
+
+    checker.task_checker()
+    assert checker.enqueued == []
+    assert Models.Schedule.query.get(schedule_id).next_run == \
+        datetime.datetime(2016, 9, 1, 10, 5)
+
+
+def test_would_check_own_shard(checker, app_setup_to_add_job,
+                               freeze_datetime):
+    """Test a checker only enqueues schedules of its shard."""
+    schedule_ids = [
+        add_schedule(app_setup_to_add_job['job_id'],
+                     app_setup_to_add_job['user_id'],
+                     datetime.datetime(2016, 9, 1, 10, 3))
+        for _ in range(0, 4)
+    ]
+    checker.shard_index = 1
+    checker.shard_count = 2
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 3, 2))
+    checker.task_checker()
+    assert checker.enqueued == [
+        schedule_id for schedule_id in schedule_ids if schedule_id % 2 == 1
+    ]
+
+
+def test_would_not_enqueue_when_fenced(checker, app_setup_to_add_job,
+                                       freeze_datetime):
+    """Test a leader stops when a newer leader recorded its token."""
+    schedule_id = add_schedule(app_setup_to_add_job['job_id'],
+                               app_setup_to_add_job['user_id'],
+                               datetime.datetime(2016, 9, 1, 10, 3))
+    db.session.add(Models.FencingToken(checker.leader_lock.key, 2))
+    db.session.commit()
+    checker.leader_lock.token = 1
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 3, 2))
+    checker.task_checker()
+    assert checker.enqueued == []
+    assert not checker.leader_lock.is_leader
+    assert Models.Schedule.query.get(schedule_id).next_run == \
+        datetime.datetime(2016, 9, 1, 10, 3)
+
+
+def test_would_fence_older_leader_when_elected(checker,
+                                               app_setup_to_add_job,
+                                               freeze_datetime):
+    """Test an older leader stops as soon as a newer one is elected."""
+    schedule_id = add_schedule(app_setup_to_add_job['job_id'],
+                               app_setup_to_add_job['user_id'],
+                               datetime.datetime(2016, 9, 1, 10, 3))
+    newer_checker = FrequencyTaskChecker(interval=600, lease_seconds=3600)
+    newer_checker.leader_lock.key = checker.leader_lock.key = \
+        'dancecats:leader:test:{0}'.format(uuid.uuid4().hex)
+
+    assert newer_checker.elect()
+    token = newer_checker.leader_lock.token
+    assert Models.FencingToken.query.get(checker.leader_lock.key).token == \
+        token
+
+    checker.leader_lock.token = token - 1
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 3, 2))
+    checker.task_checker()
+    assert checker.enqueued == []
+    assert not checker.leader_lock.is_leader
+    assert Models.TrackJobRun.query.count() == 0
+
+    newer_checker.task_checker()
+    assert newer_checker.leader_lock.is_leader
+    assert Models.TrackJobRun.query.filter_by(
+        schedule_id=schedule_id, fencing_token=token
+    ).count() == 1
+    with app_setup_to_add_job['app'].app_context():
+        newer_checker.leader_lock.release(rdb.connection)
+
+
+def test_would_elect_one_leader_per_shard(app):
+    """Test one checker per shard checks schedules."""
+    checkers = [
+        FrequencyTaskChecker(shard_index=index % 2, shard_count=2)
+        for index in range(0, 4)
+    ]
+    checkers[0].leader_lock.key = checkers[2].leader_lock.key = \
+        'dancecats:leader:test:{0}'.format(uuid.uuid4().hex)
+    checkers[1].leader_lock.key = checkers[3].leader_lock.key = \
+        'dancecats:leader:test:{0}'.format(uuid.uuid4().hex)
+
+    assert [checker.elect() for checker in checkers] == \
+        [True, True, False, False]
+    assert checkers[0].elect()
+
+    with app.app_context():
+        checkers[0].leader_lock.release(rdb.connection)
+    assert checkers[2].elect()
+
+
+def test_would_enqueue_at_second_offset_and_jitter(checker,
+                                                   app_setup_to_add_job,
+                                                   freeze_datetime):
+    """Test runs are delayed by their second offset and job's jitter."""
+    job_id = app_setup_to_add_job['job_id']
+    schedule_id = add_schedule(job_id, app_setup_to_add_job['user_id'],
+                               datetime.datetime(2016, 9, 1, 10, 3),
+                               schedule_type=Constants.SCHEDULE_HOURLY,
+                               second_offset=50)
+    checker.jitter_seconds = 20
+    jitter = Helpers.spread_seconds(job_id, 20)
+    fire_time = datetime.datetime(2016, 9, 1, 10, 3, 50) + \
+        datetime.timedelta(seconds=jitter)
+
+    checker.task_checker()
+    assert checker.seconds_to_next_run() == 200 + jitter
+
+    freeze_datetime.freeze(fire_time - datetime.timedelta(seconds=1))
+    checker.task_checker()
+    assert checker.enqueued == []
+
+    freeze_datetime.freeze(fire_time)
+    checker.task_checker()
+    assert checker.enqueued == [schedule_id]
+    assert Models.Schedule.query.get(schedule_id).next_run == \
+        datetime.datetime(2016, 9, 1, 11, 3)
+
+
+def test_would_not_skip_runs_after_second_offset(checker,
+                                                 app_setup_to_add_job,
+                                                 freeze_datetime):
+    """Test an offset run does not skip the following minute's run."""
+    schedule_id = add_schedule(app_setup_to_add_job['job_id'],
+                               app_setup_to_add_job['user_id'],
+                               datetime.datetime(2016, 9, 1, 10, 3),
+                               schedule_type=Constants.SCHEDULE_CRON,
+                               cron_expression='* * * * *',
+                               second_offset=59)
+
+    freeze_datetime.freeze(datetime.datetime(2016, 9, 1, 10, 3, 59))
+    checker.task_checker()
+    assert checker.enqueued == [schedule_id]
+    assert Models.Schedule.query.get(schedule_id).next_run == \
+        datetime.datetime(2016, 9, 1, 10, 4)
+
+
+def test_would_record_enqueue_rate(app, checker):
+    """Test the enqueue rate is a decaying moving average."""
+    checker.rate_key = 'dancecats:metrics:test:{0}'.format(uuid.uuid4().hex)
+    app.config['FREQUENCY_RATE_WINDOW_SECONDS'] = 60
+    with app.app_context():
+        assert checker.get_enqueue_rate(rdb.connection) == 0.0
+        checker.record_enqueue_rate(rdb.connection, 30)
+        rate = checker.get_enqueue_rate(rdb.connection)
+        assert 0.49 < rate <= 0.5
+        _, updated_on = rdb.connection.hmget(checker.rate_key,
+                                             'rate', 'updatedOn')
+        assert abs(checker.get_enqueue_rate(
+            rdb.connection, float(updated_on) + 60
+        ) - 0.5 / math.e) < 1e-9
+
+
+def test_would_seed_fencing_token_once(app):
+    """Test a lock's row is inserted once and fences until seeded."""
+    key = 'dancecats:leader:test:{0}'.format(uuid.uuid4().hex)
+    assert not Models.FencingToken.check(key, 1)
+    db.session.rollback()
+
+    Models.FencingToken.seed(key)
+    Models.FencingToken.seed(key)
+    assert Models.FencingToken.check(key, 1)
+    db.session.commit()
+    assert not Models.FencingToken.check(key, 0)
+    assert Models.FencingToken.query.get(key).token == 1
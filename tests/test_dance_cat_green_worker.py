@@ -0,0 +1,43 @@
+"""Unit tests for DanceCats.GreenWorker module."""
+
+from __future__ import print_function
+import time
+import uuid
+import eventlet
+from rq import Queue
+from rq.job import JobStatus
+from DanceCats import rdb
+from DanceCats.GreenWorker import GreenWorker
+import pytest
+
+
+@pytest.fixture
+def queue(app, request):
+    """Return an empty queue which is removed after the test."""
+    with app.app_context():
+        test_queue = Queue(uuid.uuid4().hex, connection=rdb.connection)
+    request.addfinalizer(test_queue.empty)
+    return test_queue
+
+
+def test_concurrent_jobs(queue):
+    """Test jobs waiting on I/O run at the same time."""
+    rq_jobs = [queue.enqueue(eventlet.sleep, 0.3) for _ in range(0, 5)]
+
+    started_on = time.time()
+    assert GreenWorker([queue], pool_size=5,
+                       connection=queue.connection).work(burst=True)
+    assert time.time() - started_on < 1
+
+    for rq_job in rq_jobs:
+        assert rq_job.get_status() == JobStatus.FINISHED
+
+
+def test_job_timeout(queue):
+    """Test a job running longer than its timeout fails alone."""
+    slow_job = queue.enqueue(eventlet.sleep, 3, timeout=1)
+    fast_job = queue.enqueue(eventlet.sleep, 0)
+
+    GreenWorker([queue], connection=queue.connection).work(burst=True)
+    assert slow_job.get_status() == JobStatus.FAILED
+    assert fast_job.get_status() == JobStatus.FINISHED
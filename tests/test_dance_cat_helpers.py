@@ -6,9 +6,12 @@ import datetime
 from decimal import Decimal, getcontext as dicimal_get_context
 from Crypto.Cipher.AES import block_size as AES_block_size
 from Crypto import Random
-from DanceCats import Helpers
+from DanceCats import Helpers, Constants
 import pytest
 import time
+import zlib
+import random
+from dateutil.relativedelta import relativedelta
 
 
 def test_encrypt_password():
@@ -231,3 +234,123 @@ def test_is_valid_format_email():
         assert not Helpers.is_valid_format_email(email)
     with pytest.raises(TypeError):
         Helpers.is_valid_format_email(list)
+
+
+def test_iter_csv_and_json():
+    """Test results are generated one piece per chunk."""
+    header = ('id', 'name', 'amount')
+    chunks = [[(1, u'\xe9t\xe9', Decimal('1.5'))], [], [(2, None, 3)]]
+
+    assert list(Helpers.iter_csv(header, chunks)) == [
+        'id,name,amount\r\n',
+        '1,\xc3\xa9t\xc3\xa9,1.5\r\n',
+        '',
+        '2,,3\r\n'
+    ]
+    assert ''.join(Helpers.iter_json(header, chunks, repr)) == \
+        "{\"header\": ['id', 'name', 'amount'], \"rows\": " \
+        "[[1, u'\\xe9t\\xe9', Decimal('1.5')], [2, None, 3]]}"
+
+
+def test_iter_gzip():
+    """Test every piece is flushed and the stream is valid gzip."""
+    pieces = ['a' * 100, 'b' * 100, 'c']
+    compressed = list(Helpers.iter_gzip(iter(pieces)))
+
+    assert len(compressed) == len(pieces) + 1
+    assert zlib.decompress(''.join(compressed), 16 + zlib.MAX_WBITS) == \
+        ''.join(pieces)
+
+
+def loop_next_run_time(schedule_type, now, next_check, **kwargs):
+    """Next run time found by stepping, as Schedule used to do."""
+    next_run_time = now.replace(second=0)
+    if schedule_type == Constants.SCHEDULE_HOURLY:
+        next_run_time += relativedelta(minute=kwargs['minute_of_hour'])
+        step = relativedelta(hours=1)
+    elif schedule_type == Constants.SCHEDULE_DAILY:
+        next_run_time += relativedelta(minute=kwargs['minute_of_hour'],
+                                       hour=kwargs['hour_of_day'])
+        step = relativedelta(days=1)
+    elif schedule_type == Constants.SCHEDULE_WEEKLY:
+        next_run_time += relativedelta(minute=kwargs['minute_of_hour'],
+                                       hour=kwargs['hour_of_day'],
+                                       weekday=kwargs['day_of_week'])
+        step = relativedelta(weeks=1)
+    else:
+        next_run_time += relativedelta(minute=kwargs['minute_of_hour'],
+                                       hour=kwargs['hour_of_day'],
+                                       day=kwargs['day_of_month'])
+        step = relativedelta(months=1)
+
+    while next_check >= next_run_time:
+        next_run_time += step
+    return next_run_time
+
+
+@pytest.mark.parametrize('schedule_type, max_interval_days', [
+    (Constants.SCHEDULE_HOURLY, 40),
+    (Constants.SCHEDULE_DAILY, 800),
+    (Constants.SCHEDULE_WEEKLY, 3000),
+    (Constants.SCHEDULE_MONTHLY, 3000)
+])
+def test_next_run_time(schedule_type, max_interval_days):
+    """Test next run time is the same as stepping one run at a time."""
+    generator = random.Random(schedule_type)
+    for _ in range(0, 500):
+        now = datetime.datetime(2000, 1, 1) + datetime.timedelta(
+            days=generator.randint(0, 365 * 40),
+            seconds=generator.randint(0, 86399),
+            microseconds=generator.choice([0, generator.randint(0, 999999)])
+        )
+        next_check = now + generator.choice([
+            datetime.timedelta(seconds=generator.choice([0, 1, 59, 60])),
+            datetime.timedelta(seconds=generator.randint(
+                0, max_interval_days * 86400
+            ))
+        ])
+        schedule = {
+            'minute_of_hour': generator.choice(
+                [0, 59, now.minute, generator.randint(0, 59)]
+            ),
+            'hour_of_day': generator.choice(
+                [0, 23, now.hour, generator.randint(0, 23)]
+            ),
+            'day_of_week': generator.randint(0, 6),
+            'day_of_month': generator.choice(
+                [1, 28, 29, 30, 31, generator.randint(1, 31)]
+            )
+        }
+
+        assert Helpers.next_run_time(
+            schedule_type, now, next_check, **schedule
+        ) == loop_next_run_time(
+            schedule_type, now, next_check, **schedule
+        ), (now, next_check, schedule)
+
+
+def test_next_run_time_on_exact_run():
+    """Test a run equal to next_check is skipped."""
+    now = datetime.datetime(2016, 1, 31, 10, 30, 45)
+    next_check = datetime.datetime(2016, 3, 29, 10, 30)
+
+    assert Helpers.next_run_time(
+        Constants.SCHEDULE_MONTHLY, now, next_check,
+        minute_of_hour=30, hour_of_day=10, day_of_month=31
+    ) == datetime.datetime(2016, 4, 29, 10, 30)
+    assert Helpers.next_run_time(
+        Constants.SCHEDULE_HOURLY, now, next_check, minute_of_hour=30
+    ) == datetime.datetime(2016, 3, 29, 11, 30)
+
+    with pytest.raises(ValueError):
+        Helpers.next_run_time(Constants.SCHEDULE_ONCE, now, next_check)
+
+
+def test_spread_seconds():
+    """Test keys are spread stably inside the window."""
+    assert Helpers.spread_seconds(12, 0) == 0
+    spreads = [Helpers.spread_seconds(key, 30) for key in range(0, 200)]
+    assert spreads == [Helpers.spread_seconds(key, 30)
+                       for key in range(0, 200)]
+    assert min(spreads) >= 0 and max(spreads) <= 30
+    assert len(set(spreads)) > 20
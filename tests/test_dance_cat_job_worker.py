@@ -0,0 +1,277 @@
+"""Unit tests for DanceCats.JobWorker module."""
+
+from __future__ import print_function
+import time
+from rq import Queue
+from DanceCats import db, rdb, mail, Constants, Models, QueryCache, \
+    ResultStorage, JobWorker
+from DanceCats.JobWorker import enqueue_query_jobs, job_worker_query, \
+    job_worker_send_mail_result, connection_semaphore, query_queue_name, \
+    query_queue_names, job_flight
+import pytest
+
+
+@pytest.fixture
+def app_setup_to_run_job(app_setup_to_add_job, request):
+    """Setup data to the point run a job, its flight is removed after."""
+    app = app_setup_to_add_job['app']
+
+    def remove_flight():
+        with app.app_context():
+            flight = job_flight(app_setup_to_add_job['job_id'])
+            rdb.connection.delete(flight.key, flight.followers_key)
+
+    remove_flight()
+    request.addfinalizer(remove_flight)
+    return app_setup_to_add_job
+
+
+def test_enqueue_query_jobs(app_setup_to_run_job):
+    """Test trackers are enqueued as query jobs named by tracker id."""
+    app = app_setup_to_run_job['app']
+    second_job = Models.QueryDataJob(
+        'second job', 'select 2', app_setup_to_run_job['user_id']
+    )
+    db.session.add(second_job)
+    db.session.commit()
+    trackers = [Models.TrackJobRun(app_setup_to_run_job['job_id']),
+                Models.TrackJobRun(second_job.job_id)]
+    db.session.add_all(trackers)
+    db.session.commit()
+
+    with app.app_context():
+        queue = rdb.queue['default']
+        queue.empty()
+        enqueue_query_jobs(trackers)
+
+        assert queue.job_ids == [
+            str(tracker.track_job_run_id) for tracker in trackers
+        ]
+        rq_job = queue.fetch_job(str(trackers[0].track_job_run_id))
+        assert rq_job.func == job_worker_query
+        assert rq_job.kwargs == {
+            'job_id': app_setup_to_run_job['job_id'],
+            'tracker_id': trackers[0].track_job_run_id
+        }
+        assert rq_job.timeout == \
+            app.config.get('JOB_WORKER_EXECUTE_TIMEOUT', 3600)
+        queue.empty()
+        flight = job_flight(second_job.job_id)
+        rdb.connection.delete(flight.key, flight.followers_key)
+
+
+def test_single_flight(app_setup_to_run_job):
+    """Test runs of a job in flight are completed with its result."""
+    app = app_setup_to_run_job['app']
+    job = Models.QueryDataJob.query.get(app_setup_to_run_job['job_id'])
+    job.connection_id = Models.Connection.query.first().connection_id
+    job[Constants.JOB_FEATURE_RESULT_CACHE_SECONDS] = 60
+    trackers = [Models.TrackJobRun(job.job_id) for _ in range(0, 3)]
+    db.session.add_all(trackers)
+    db.session.commit()
+    job_id = job.job_id
+    tracker_ids = [tracker.track_job_run_id for tracker in trackers]
+
+    with app.app_context():
+        cache_writer = QueryCache.open_writer(
+            QueryCache.cache_key(job.connection_id, job.query_string), 60
+        )
+        cache_writer.write_header(('id',))
+        cache_writer.write_rows([(1,)])
+        cache_writer.close(rdb.connection)
+
+        queue = rdb.queue['default']
+        queue.empty()
+        enqueue_query_jobs(trackers[:2])
+        enqueue_query_jobs(trackers[2:])
+        assert queue.job_ids == [str(tracker_ids[0])]
+        assert job_flight(job_id).leader(rdb.connection) == \
+            str(tracker_ids[0])
+        # The flight expires with the leader's RQ job.
+        assert 0 < rdb.connection.ttl(job_flight(job_id).key) <= \
+            app.config.get('JOB_WORKER_ENQUEUE_TIMEOUT', 1800)
+        queue.empty()
+
+    result_location = job_worker_query(job_id, tracker_ids[0])
+    assert result_location is not None
+    for tracker_id in tracker_ids:
+        tracker = Models.TrackJobRun.query.get(tracker_id)
+        assert tracker.status == Constants.JOB_RAN_SUCCESS
+        assert tracker.result_location == result_location
+
+    with app.app_context():
+        assert job_flight(job_id).leader(rdb.connection) is None
+        queue.empty()
+    ResultStorage.remove(result_location)
+
+
+def test_flight_landed_when_enqueue_fails(app_setup_to_run_job,
+                                          monkeypatch):
+    """Test a flight is not held by a tracker which was not enqueued."""
+    app = app_setup_to_run_job['app']
+    job_id = app_setup_to_run_job['job_id']
+    tracker = Models.TrackJobRun(job_id)
+    db.session.add(tracker)
+    db.session.commit()
+
+    def fail_push(trackers, job_connection_ids):
+        raise RuntimeError('Redis is gone')
+
+    monkeypatch.setattr(JobWorker, 'push_query_jobs', fail_push)
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            enqueue_query_jobs([tracker])
+        assert job_flight(job_id).leader(rdb.connection) is None
+
+
+def test_enqueue_query_jobs_by_connection(app_setup_to_run_job, monkeypatch):
+    """Test jobs go to the queue of their connection."""
+    app = app_setup_to_run_job['app']
+    monkeypatch.setitem(app.config, 'JOB_WORKER_QUERY_QUEUES', 2)
+    job = Models.QueryDataJob.query.get(app_setup_to_run_job['job_id'])
+    job.connection_id = Models.Connection.query.first().connection_id
+    tracker = Models.TrackJobRun(job.job_id)
+    db.session.add(tracker)
+    db.session.commit()
+    queue_name = 'query_{0}'.format(job.connection_id % 2)
+
+    assert query_queue_names() == ['query_0', 'query_1']
+    assert query_queue_name(job.connection_id) == queue_name
+
+    with app.app_context():
+        queue = Queue(queue_name, connection=rdb.connection)
+        queue.empty()
+        enqueue_query_jobs([tracker])
+        assert queue.job_ids == [str(tracker.track_job_run_id)]
+        assert queue_name in [
+            known_queue.name for known_queue in
+            Queue.all(connection=rdb.connection)
+        ]
+        queue.empty()
+
+
+def test_busy_connection(app_setup_to_add_job, monkeypatch):
+    """Test a job is parked and enqueued again when its connection is busy."""
+    app = app_setup_to_add_job['app']
+    monkeypatch.setitem(app.config, 'JOB_WORKER_RETRY_DELAY_SECONDS', 60)
+    job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+    connection = Models.Connection.query.first()
+    connection.max_concurrent_jobs = 1
+    job.connection_id = connection.connection_id
+    tracker = Models.TrackJobRun(job.job_id)
+    db.session.add(tracker)
+    db.session.commit()
+    job_id, tracker_id = job.job_id, tracker.track_job_run_id
+
+    semaphore = connection_semaphore(connection)
+    assert semaphore.limit == 1
+    with app.app_context():
+        queue = rdb.queue['default']
+        queue.empty()
+        rdb.connection.delete(JobWorker.PARKED_JOBS_KEY)
+        assert semaphore.acquire(rdb.connection, 'running')
+
+        assert job_worker_query(job_id, tracker_id) is None
+        assert Models.TrackJobRun.query.get(tracker_id).status == \
+            Constants.JOB_QUEUED
+        assert len(queue.jobs) == 0
+        assert JobWorker.enqueue_parked_jobs(rdb.connection) == []
+
+        rq_jobs = JobWorker.enqueue_parked_jobs(rdb.connection,
+                                                time.time() + 60)
+        assert [rq_job.id for rq_job in queue.jobs] == \
+            [rq_job.id for rq_job in rq_jobs]
+        assert queue.jobs[0].kwargs == {'job_id': job_id,
+                                        'tracker_id': tracker_id}
+        # The job keeps the enqueue timeout left since it was scheduled.
+        assert queue.jobs[0].ttl <= \
+            app.config.get('JOB_WORKER_ENQUEUE_TIMEOUT', 1800)
+        assert rdb.connection.zcard(JobWorker.PARKED_JOBS_KEY) == 0
+        queue.empty()
+
+        # Gives up when less than the delay is left to wait.
+        monkeypatch.setitem(app.config, 'JOB_WORKER_ENQUEUE_TIMEOUT', 60)
+        assert job_worker_query(job_id, tracker_id) is None
+        assert rdb.connection.zcard(JobWorker.PARKED_JOBS_KEY) == 0
+        assert Models.TrackJobRun.query.get(tracker_id).status == \
+            Constants.JOB_DIED_IN_QUEUE
+
+        semaphore.release(rdb.connection, 'running')
+
+
+def test_slot_released_on_error(app_setup_to_add_job, monkeypatch):
+    """Test the connection's slot is released when the job fails early."""
+    app = app_setup_to_add_job['app']
+    job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+    connection = Models.Connection.query.first()
+    connection.max_concurrent_jobs = 1
+    job.connection_id = connection.connection_id
+    tracker = Models.TrackJobRun(job.job_id)
+    db.session.add(tracker)
+    db.session.commit()
+    job_id, tracker_id = job.job_id, tracker.track_job_run_id
+    semaphore = connection_semaphore(connection)
+
+    def fail_update(self):
+        raise RuntimeError('Database is gone')
+
+    monkeypatch.setattr(Models.QueryDataJob, 'update_executed_times',
+                        fail_update)
+    assert job_worker_query(job_id, tracker_id) is None
+
+    tracker = Models.TrackJobRun.query.get(tracker_id)
+    assert tracker.status == Constants.JOB_RAN_FAILED
+    assert 'Database is gone' in tracker.error_string
+    with app.app_context():
+        assert semaphore.count(rdb.connection) == 0
+
+
+def test_cached_result(app_setup_to_add_job):
+    """Test a job with a cached result does not query the database."""
+    app = app_setup_to_add_job['app']
+    job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+    connection = Models.Connection.query.first()
+    connection.max_concurrent_jobs = 1
+    job.connection_id = connection.connection_id
+    job[Constants.JOB_FEATURE_RESULT_CACHE_SECONDS] = 60
+    tracker = Models.TrackJobRun(job.job_id)
+    db.session.add(tracker)
+    db.session.commit()
+    job_id, tracker_id = job.job_id, tracker.track_job_run_id
+
+    with app.app_context():
+        cache_writer = QueryCache.open_writer(
+            QueryCache.cache_key(job.connection_id, job.query_string), 60
+        )
+        cache_writer.write_header(('id', 'name'))
+        cache_writer.write_rows([(1, 'one'), (2, 'two')])
+        cache_writer.close(rdb.connection)
+        # Cached results are served while the connection is busy.
+        semaphore = connection_semaphore(connection)
+        assert semaphore.acquire(rdb.connection, 'running')
+
+    result_location = job_worker_query(job_id, tracker_id)
+    with app.app_context():
+        semaphore.release(rdb.connection, 'running')
+    assert result_location is not None
+    tracker = Models.TrackJobRun.query.get(tracker_id)
+    assert tracker.status == Constants.JOB_RAN_SUCCESS
+
+    result_reader = ResultStorage.open_reader(result_location)
+    assert result_reader.header == ('id', 'name')
+    assert list(result_reader.iter_rows()) == [(1, 'one'), (2, 'two')]
+    ResultStorage.remove(result_location)
+
+
+def test_mail_without_result(app_setup_to_add_job, monkeypatch):
+    """Test no mail is sent when the tracker has no result to attach."""
+    tracker = Models.TrackJobRun(app_setup_to_add_job['job_id'])
+    tracker.complete(is_success=False, run_duration=0, error_string='fail')
+    db.session.add(tracker)
+    db.session.commit()
+    tracker_id = tracker.track_job_run_id
+
+    sent = []
+    monkeypatch.setattr(mail, 'send', sent.append)
+    job_worker_send_mail_result(tracker_id, 'test job', ['a@b.c'])
+    assert sent == []
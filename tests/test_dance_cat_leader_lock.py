@@ -0,0 +1,39 @@
+"""Unit tests for DanceCats.LeaderLock module."""
+
+from __future__ import print_function
+import time
+import uuid
+from DanceCats.LeaderLock import LeaderLock
+
+
+def test_only_one_leader(connection):
+    """Test the lock is held by one process and renewed by it."""
+    name = uuid.uuid4().hex
+    leader = LeaderLock(name)
+    follower = LeaderLock(name)
+
+    token = leader.acquire(connection)
+    assert token is not None
+    assert follower.acquire(connection) is None
+    assert leader.acquire(connection) == token
+    assert leader.is_leader
+    assert not follower.is_leader
+
+    leader.release(connection)
+    assert not leader.is_leader
+    assert follower.acquire(connection) > token
+
+
+def test_lose_leadership_after_lease(connection):
+    """Test a leader which did not renew in time loses the lock."""
+    name = uuid.uuid4().hex
+    leader = LeaderLock(name, lease_seconds=0.05)
+    follower = LeaderLock(name, lease_seconds=0.05)
+
+    token = leader.acquire(connection)
+    time.sleep(0.1)
+    assert follower.acquire(connection) > token
+    assert leader.acquire(connection) is None
+
+    leader.release(connection)
+    assert follower.acquire(connection) is not None
@@ -0,0 +1,158 @@
+"""Unit tests for DanceCats.QueryCache module."""
+
+from __future__ import print_function
+import datetime
+import time
+import uuid
+from decimal import Decimal
+from DanceCats import QueryCache
+import pytest
+
+
+@pytest.fixture
+def connection_id(connection, request):
+    """Return a connection id whose cached results are removed after."""
+    test_connection_id = uuid.uuid4().int % 1000000
+    request.addfinalizer(
+        lambda: QueryCache.invalidate(connection, test_connection_id)
+    )
+    return test_connection_id
+
+
+def cache(connection, key, header, batches, ttl=60):
+    """Store a result in the cache."""
+    cache_writer = QueryCache.open_writer(key, ttl)
+    cache_writer.write_header(header)
+    for rows in batches:
+        cache_writer.write_rows(rows)
+    return cache_writer.close(connection)
+
+
+def test_normalize_query():
+    """Test comments and white spaces do not change the key."""
+    assert QueryCache.normalize_query(
+        "/* QUERY STRING */\nSELECT  *\n\tFROM t -- all\nWHERE a = 'x  y';"
+    ) == "SELECT * FROM t WHERE a = 'x  y'"
+    assert QueryCache.normalize_query(
+        "select '--not a comment', \"a  b\" from t"
+    ) == "select '--not a comment', \"a  b\" from t"
+    assert QueryCache.normalize_query(
+        "select $$a  -- b$$, $x$ $$ $x$  from t"
+    ) == "select $$a  -- b$$, $x$ $$ $x$ from t"
+    assert QueryCache.normalize_query(
+        "select 'a  -- b"
+    ) == "select 'a  -- b"
+
+    assert QueryCache.cache_key(1, 'select 1') == \
+        QueryCache.cache_key(1, ' select   1 ;')
+    assert QueryCache.cache_key(1, 'select 1') != \
+        QueryCache.cache_key(2, 'select 1')
+    assert QueryCache.cache_key(1, 'select 1') != \
+        QueryCache.cache_key(1, 'select 1', {'preview': 10})
+
+
+def test_escaped_quote_not_ending_literal():
+    """Test a quote escaped by a backslash does not end a literal."""
+    assert QueryCache.cache_key(1, "SELECT 'a\\' -- x', 1\nFROM t") != \
+        QueryCache.cache_key(1, "SELECT 'a\\' -- y', 2\nFROM t")
+    assert QueryCache.normalize_query(
+        "select 'it\\'s  -- x',  \"a\\\"  b\"  -- c\nfrom t"
+    ) == "select 'it\\'s  -- x', \"a\\\"  b\" from t"
+
+
+def test_cache_result(connection, connection_id):
+    """Test a cached result is returned as it was written."""
+    key = QueryCache.cache_key(connection_id, 'select * from t')
+    batches = [
+        [(1, u'\xe9t\xe9', Decimal('1.5'), datetime.date(2016, 9, 1))],
+        [(2, None, Decimal('2'), None)]
+    ]
+    assert QueryCache.get(connection, key) is None
+    assert cache(connection, key, ('id', 'name', 'price', 'day'), batches)
+
+    assert QueryCache.get(connection, key) == \
+        (('id', 'name', 'price', 'day'), batches)
+    assert 0 < connection.ttl(key) <= 60
+
+    assert not cache(connection, key, ('id',), [[(1,)]], ttl=0)
+    assert QueryCache.open_writer(None, 60).is_caching is False
+
+
+def test_large_result_not_cached(app, connection, connection_id,
+                                 monkeypatch):
+    """Test results larger than the entry limit are not cached."""
+    monkeypatch.setitem(app.config, 'QUERY_CACHE_MAX_ENTRY_BYTES', 200)
+    key = QueryCache.cache_key(connection_id, 'select * from large')
+    rows = [(uuid.uuid4().hex,) for _ in range(0, 20)]
+
+    assert not cache(connection, key, ('id',), [rows])
+    assert QueryCache.get(connection, key) is None
+
+
+def test_least_recently_used_evicted(app, connection, connection_id,
+                                     monkeypatch):
+    """Test the least recently used results are evicted first."""
+    connection.delete(QueryCache.LRU_KEY, QueryCache.SIZES_KEY)
+    keys = [QueryCache.cache_key(connection_id, 'select {0}'.format(i))
+            for i in range(0, 3)]
+    rows = [(uuid.uuid4().hex,) for _ in range(0, 10)]
+    for key in keys[:2]:
+        cache(connection, key, ('id',), [rows])
+    entry_bytes = int(connection.hget(QueryCache.SIZES_KEY, keys[0]))
+    monkeypatch.setitem(app.config, 'QUERY_CACHE_MAX_BYTES',
+                        connection.hlen(QueryCache.SIZES_KEY) * entry_bytes)
+
+    assert QueryCache.get(connection, keys[0]) is not None
+    cache(connection, keys[2], ('id',), [rows])
+
+    assert QueryCache.get(connection, keys[0]) is not None
+    assert QueryCache.get(connection, keys[1]) is None
+    assert QueryCache.get(connection, keys[2]) is not None
+
+
+def test_max_age(connection, connection_id, monkeypatch):
+    """Test results older than the reader's max age are not returned."""
+    key = QueryCache.cache_key(connection_id, 'select * from aged')
+    cache(connection, key, ('id',), [[(1,)]], ttl=3600)
+    assert QueryCache.get(connection, key, 60) is not None
+
+    written_at = time.time()
+    monkeypatch.setattr(QueryCache.time, 'time', lambda: written_at + 120)
+    assert QueryCache.get(connection, key, 60) is None
+    assert QueryCache.get(connection, key, 3600) is not None
+    assert QueryCache.get(connection, key) is not None
+
+
+def test_expired_not_counted(app, connection, connection_id, monkeypatch):
+    """Test expired results are removed from the cache's size."""
+    connection.delete(QueryCache.LRU_KEY, QueryCache.SIZES_KEY)
+    keys = [QueryCache.cache_key(connection_id, 'select {0}'.format(i))
+            for i in range(0, 2)]
+    rows = [(uuid.uuid4().hex,) for _ in range(0, 10)]
+    cache(connection, keys[0], ('id',), [rows])
+    entry_bytes = int(connection.hget(QueryCache.SIZES_KEY, keys[0]))
+    monkeypatch.setitem(app.config, 'QUERY_CACHE_MAX_BYTES', entry_bytes)
+
+    # Expire the first result without reading it.
+    connection.delete(keys[0])
+    cache(connection, keys[1], ('id',), [rows])
+
+    assert connection.hkeys(QueryCache.SIZES_KEY) == [keys[1]]
+    assert connection.zrange(QueryCache.LRU_KEY, 0, -1) == [keys[1]]
+    assert QueryCache.get(connection, keys[1]) is not None
+
+
+def test_invalidate(connection, connection_id):
+    """Test results are removed by query or by connection."""
+    keys = [QueryCache.cache_key(connection_id, 'select {0}'.format(i))
+            for i in range(0, 3)]
+    for key in keys:
+        cache(connection, key, ('id',), [[(1,)]])
+
+    QueryCache.invalidate(connection, connection_id, 'select 0')
+    assert QueryCache.get(connection, keys[0]) is None
+    assert QueryCache.get(connection, keys[1]) is not None
+
+    QueryCache.invalidate(connection, connection_id)
+    assert QueryCache.get(connection, keys[1]) is None
+    assert QueryCache.get(connection, keys[2]) is None
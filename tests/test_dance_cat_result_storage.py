@@ -0,0 +1,165 @@
+"""Unit tests for DanceCats.ResultStorage module."""
+
+from __future__ import print_function
+import datetime
+import os
+from decimal import Decimal
+from DanceCats import db
+from DanceCats import Models
+from DanceCats import Constants
+from DanceCats import ResultStorage
+import pytest
+
+
+HEADER = ('id', 'name', 'amount', 'created_on')
+ROWS = [
+    (i, u'name %d' % i, Decimal(i) / 4,
+     datetime.datetime(2016, 9, 1) + datetime.timedelta(minutes=i))
+    for i in range(0, 25)
+]
+
+
+def set_config(request, app, **kwargs):
+    """Update app config for the test only."""
+    def restore():
+        for key in kwargs:
+            app.config.pop(key)
+
+    app.config.update(kwargs)
+    request.addfinalizer(restore)
+
+
+@pytest.fixture
+def result_folder(request, app, tmpdir):
+    """Write results into a temporary folder."""
+    set_config(request, app,
+               JOB_RESULT_STORAGE=ResultStorage.STORAGE_FILE,
+               JOB_RESULT_FOLDER=str(tmpdir.join('results')),
+               JOB_RESULT_CHUNK_ROWS=10)
+    return app.config['JOB_RESULT_FOLDER']
+
+
+@pytest.fixture
+def redis_storage(request, app):
+    """Write results into the embedded Redis."""
+    set_config(request, app,
+               JOB_RESULT_STORAGE=ResultStorage.STORAGE_REDIS,
+               JOB_RESULT_CHUNK_ROWS=10)
+    return ResultStorage.redis_connection()
+
+
+def write_result(tracker_id, batch_size=10):
+    """Write HEADER and ROWS in batches and return the location."""
+    writer = ResultStorage.open_writer(tracker_id)
+    writer.write_header(HEADER)
+    for i in range(0, len(ROWS), batch_size):
+        writer.write_rows(ROWS[i:i + batch_size])
+    writer.write_rows([])
+    assert writer.row_count == len(ROWS)
+    return writer.close()
+
+
+def test_would_read_written_result(result_folder):
+    """Test a written result is read back in its groups."""
+    reader = ResultStorage.open_reader(write_result(1))
+
+    assert reader.header == HEADER
+    assert [len(rows) for rows in reader.iter_chunks()] == [10, 10, 5]
+    assert list(reader.iter_rows()) == ROWS
+
+
+def test_would_read_only_wanted_columns(result_folder):
+    """Test reading a subset of columns in the wanted order."""
+    reader = ResultStorage.open_reader(write_result(1))
+
+    assert list(reader.iter_rows(columns=[3, 0])) == \
+        [(row[3], row[0]) for row in ROWS]
+    assert list(reader.iter_rows(columns=[])) == [()] * len(ROWS)
+
+
+def test_would_chunk_rows_by_config(result_folder, app):
+    """Test chunks do not depend on the size of written batches."""
+    app.config['JOB_RESULT_CHUNK_ROWS'] = 7
+    reader = ResultStorage.open_reader(write_result(1, batch_size=3))
+
+    assert [len(rows) for rows in reader.iter_chunks()] == [7, 7, 7, 4]
+    assert list(reader.iter_rows()) == ROWS
+
+
+def test_would_stream_result_from_redis(redis_storage, app):
+    """Test a result is stored in a Redis list and read chunk by chunk."""
+    location = write_result(1, batch_size=4)
+    assert location.startswith(ResultStorage.REDIS_LOCATION_PREFIX)
+
+    key = location[len(ResultStorage.REDIS_LOCATION_PREFIX):]
+    assert redis_storage.llen(key) == 4
+    assert 0 < redis_storage.ttl(key) <= \
+        app.config.get('JOB_RESULT_VALID_SECONDS', 86400)
+
+    reader = ResultStorage.open_reader(location)
+    assert reader.header == HEADER
+    assert [len(rows) for rows in reader.iter_chunks()] == [10, 10, 5]
+    assert list(reader.iter_rows()) == ROWS
+    assert list(reader.iter_rows(columns=[2, 1])) == \
+        [(row[2], row[1]) for row in ROWS]
+
+    ResultStorage.remove(location)
+    assert ResultStorage.open_reader(location) is None
+
+
+def test_would_read_redis_result_in_windows(redis_storage, app,
+                                            monkeypatch):
+    """Test chunks are read the same across several list ranges."""
+    app.config['JOB_RESULT_CHUNK_ROWS'] = 3
+    monkeypatch.setattr(ResultStorage, 'REDIS_READ_CHUNKS', 2)
+    reader = ResultStorage.open_reader(write_result(1))
+
+    assert reader.header == HEADER
+    assert [len(rows) for rows in reader.iter_chunks()] == [3] * 8 + [1]
+    assert list(reader.iter_rows()) == ROWS
+    assert list(reader.iter_rows(columns=[0])) == [(row[0],) for row in ROWS]
+
+
+def test_would_discard_redis_result(redis_storage):
+    """Test a discarded Redis result is deleted."""
+    writer = ResultStorage.open_writer(1)
+    writer.write_header(HEADER)
+    writer.write_rows(ROWS)
+    writer.discard()
+    assert not redis_storage.exists(writer.key)
+
+
+def test_would_remove_result(result_folder):
+    """Test discarded and removed results are gone."""
+    writer = ResultStorage.open_writer(1)
+    writer.write_header(HEADER)
+    writer.discard()
+    assert os.listdir(result_folder) == []
+
+    location = write_result(2)
+    ResultStorage.remove(location)
+    assert ResultStorage.open_reader(location) is None
+
+
+def test_would_remove_expired_result(result_folder, app_setup_to_add_job):
+    """Test expiring a tracker removes its result."""
+    tracker = Models.TrackJobRun(app_setup_to_add_job['job_id'])
+    db.session.add(tracker)
+    db.session.commit()
+
+    tracker.start()
+    tracker.complete(is_success=True, run_duration=10,
+                     result_location=write_result(tracker.track_job_run_id))
+    db.session.commit()
+    assert not tracker.check_expiration()
+    assert ResultStorage.open_tracker_reader(tracker) is not None
+
+    tracker.ran_on -= datetime.timedelta(
+        seconds=app_setup_to_add_job['app'].config.get(
+            'JOB_RESULT_VALID_SECONDS', 86400
+        ) + 1
+    )
+    assert tracker.check_expiration()
+    assert tracker.status == Constants.JOB_RESULT_EXPIRED
+    assert tracker.result_location is None
+    assert os.listdir(result_folder) == []
@@ -0,0 +1,103 @@
+"""Unit tests for DanceCats.Retention module."""
+
+from __future__ import print_function
+import os
+import datetime
+from DanceCats import db, Constants, Models
+from DanceCats import Retention, ResultStorage
+
+
+def add_tracker(job_id, scheduled_on, status, duration=0,
+                error_string=None, result_location=None):
+    """Add a completed tracker of a job."""
+    tracker = Models.TrackJobRun(job_id)
+    tracker.scheduled_on = scheduled_on
+    tracker.ran_on = scheduled_on
+    tracker.status = status
+    tracker.duration = duration
+    tracker.error_string = error_string
+    tracker.result_location = result_location
+    db.session.add(tracker)
+    db.session.commit()
+    return tracker.track_job_run_id
+
+
+def test_compact_trackers(app_setup_to_add_job, tmpdir):
+    """Test old trackers are archived and counted by job and day."""
+    app = app_setup_to_add_job['app']
+    job_id = app_setup_to_add_job['job_id']
+    app.config.update({
+        'TRACKER_RETENTION_DAYS': 30,
+        'TRACKER_ARCHIVE_RETENTION_DAYS': 365,
+        'TRACKER_COMPACT_BATCH_SIZE': 2
+    })
+    now = datetime.datetime(2016, 10, 1, 12, 0, 0)
+    old_day = datetime.datetime(2016, 8, 1, 8, 0, 0)
+
+    result_path = str(tmpdir.join('result'))
+    open(result_path, 'w').close()
+    failed_id = add_tracker(job_id, old_day, Constants.JOB_RAN_FAILED,
+                            duration=5, error_string='x' * 300)
+    add_tracker(job_id, old_day, Constants.JOB_RAN_SUCCESS, duration=3,
+                result_location=ResultStorage.FILE_LOCATION_PREFIX +
+                result_path)
+    add_tracker(job_id, old_day + datetime.timedelta(hours=1),
+                Constants.JOB_RAN_SUCCESS, duration=7)
+    add_tracker(job_id, old_day + datetime.timedelta(days=1),
+                Constants.JOB_DIED_IN_QUEUE)
+    recent_id = add_tracker(job_id, now - datetime.timedelta(days=1),
+                            Constants.JOB_RAN_SUCCESS)
+
+    assert Retention.compact_trackers(now) == (4, 0)
+
+    assert [tracker.track_job_run_id
+            for tracker in Models.TrackJobRun.query.all()] == [recent_id]
+    assert Models.TrackJobRunArchive.query.count() == 4
+    failed_archive = Models.TrackJobRunArchive.query.get(failed_id)
+    assert failed_archive.status == Constants.JOB_RAN_FAILED
+    assert failed_archive.error_summary == 'x' * 255
+    assert not os.path.exists(result_path)
+
+    first_day = Models.JobRunDaily.query.get((job_id, old_day.date()))
+    assert (first_day.runs, first_day.succeeded, first_day.failed) == \
+        (3, 2, 1)
+    assert first_day.total_duration == 15
+    assert first_day.max_duration == 7
+    second_day = Models.JobRunDaily.query.get(
+        (job_id, old_day.date() + datetime.timedelta(days=1))
+    )
+    assert (second_day.runs, second_day.succeeded, second_day.failed) == \
+        (1, 0, 1)
+
+    # Later runs on an already counted day are added to its counts.
+    add_tracker(job_id, old_day, Constants.JOB_RAN_SUCCESS, duration=1)
+    assert Retention.compact_trackers(now) == (1, 0)
+    db.session.expire_all()
+    assert Models.JobRunDaily.query.get((job_id, old_day.date())).runs == 4
+
+
+def test_prune_archive(app_setup_to_add_job):
+    """Test archived trackers are removed and daily counts are kept."""
+    app = app_setup_to_add_job['app']
+    job_id = app_setup_to_add_job['job_id']
+    app.config.update({
+        'TRACKER_RETENTION_DAYS': 30,
+        'TRACKER_ARCHIVE_RETENTION_DAYS': 365
+    })
+    now = datetime.datetime(2016, 10, 1, 12, 0, 0)
+    add_tracker(job_id, now - datetime.timedelta(days=400),
+                Constants.JOB_RAN_SUCCESS)
+    add_tracker(job_id, now - datetime.timedelta(days=100),
+                Constants.JOB_RAN_SUCCESS)
+
+    assert Retention.compact_trackers(now) == (2, 1)
+    assert Models.TrackJobRun.query.count() == 0
+    assert Models.TrackJobRunArchive.query.count() == 1
+    assert Models.JobRunDaily.query.count() == 2
+
+    app.config['TRACKER_RETENTION_DAYS'] = 0
+    app.config['TRACKER_ARCHIVE_RETENTION_DAYS'] = 0
+    add_tracker(job_id, now - datetime.timedelta(days=400),
+                Constants.JOB_RAN_SUCCESS)
+    assert Retention.compact_trackers(now) == (0, 0)
+    assert Models.TrackJobRun.query.count() == 1
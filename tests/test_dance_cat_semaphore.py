@@ -0,0 +1,40 @@
+"""Unit tests for DanceCats.Semaphore module."""
+
+from __future__ import print_function
+import time
+import uuid
+from DanceCats.Semaphore import Semaphore
+
+
+def test_bounded_holders(connection):
+    """Test no more than limit holders get a slot."""
+    semaphore = Semaphore(uuid.uuid4().hex, 2)
+
+    assert semaphore.acquire(connection, 'first')
+    assert semaphore.acquire(connection, 'second')
+    assert not semaphore.acquire(connection, 'third')
+    assert semaphore.acquire(connection, 'first')
+    assert semaphore.count(connection) == 2
+
+    semaphore.release(connection, 'first')
+    assert semaphore.acquire(connection, 'third')
+    assert not semaphore.acquire(connection, 'first')
+
+
+def test_expired_holders(connection):
+    """Test slots of holders whose lease ended are given to others."""
+    semaphore = Semaphore(uuid.uuid4().hex, 1, lease_seconds=0.2)
+
+    assert semaphore.acquire(connection, 'first')
+    assert not semaphore.acquire(connection, 'second')
+    time.sleep(0.3)
+    assert semaphore.count(connection) == 0
+    assert semaphore.acquire(connection, 'second')
+
+
+def test_no_limit(connection):
+    """Test a semaphore without limit never blocks."""
+    semaphore = Semaphore(uuid.uuid4().hex, 0)
+
+    for holder in range(0, 10):
+        assert semaphore.acquire(connection, holder)
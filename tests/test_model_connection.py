@@ -195,3 +195,48 @@ class TestConnectionModel(object):
             ).db_config_generator()
         for key, value in expected_values.items():
             assert out_version_config[key] == value
+
+    def test_would_cache_db_config(self, app_setup_to_add_user,
+                                   monkeypatch):
+        """Test configs are generated again only after edit or TTL."""
+        decrypted_passwords = []
+        aes_decrypt = Helpers.aes_decrypt
+
+        def counting_aes_decrypt(*args):
+            decrypted_passwords.append(args[0])
+            return aes_decrypt(*args)
+
+        monkeypatch.setattr(Helpers, 'aes_decrypt', counting_aes_decrypt)
+        connection = Models.Connection(
+            db_type=Constants.DB_MYSQL,
+            password=self.db_password,
+            **self.connection_skeleton
+        )
+        db.session.add(connection)
+        db.session.commit()
+
+        db_config = connection.db_config_generator()
+        db_config['password'] = 'changed'
+        assert connection.db_config_generator()['password'] == \
+            self.db_password
+        assert len(decrypted_passwords) == 1
+
+        connection.port = 4567
+        db.session.commit()
+        assert connection.db_config_generator()['port'] == 4567
+        assert len(decrypted_passwords) == 2
+
+        connection.encrypt_password('unsaved')
+        assert connection.db_config_generator()['password'] == 'unsaved'
+        db.session.rollback()
+        assert len(decrypted_passwords) == 3
+
+        Models.Connection.forget_db_config(connection.connection_id)
+        connection.db_config_generator()
+        assert len(decrypted_passwords) == 4
+
+        monkeypatch.setitem(app_setup_to_add_user['app'].config,
+                            'CONNECTION_CONFIG_CACHE_SECONDS', 0)
+        connection.db_config_generator()
+        connection.db_config_generator()
+        assert len(decrypted_passwords) == 6
@@ -581,3 +581,48 @@ class TestScheduleModel(object):
             freeze_datetime.freeze(cur_time)
             schedule.update_next_run(interval=60)
             assert schedule.next_run == expected_next_run
+
+    def test_would_schedule_cron_update_next_run(
+            self, app_setup_to_add_job, freeze_datetime
+    ):
+        """Test Models.Schedule.update_next_run of Cron Schedule type."""
+        freeze_datetime.freeze(self.start_time_beautifully)
+        with pytest.raises(ValueError):
+            Models.Schedule(
+                schedule_type=Constants.SCHEDULE_CRON,
+                cron_expression='* * *',
+                start_time=self.start_time_ugly,
+                **self.active_schedule_skeleton
+            )
+
+        # Every 30 minutes from 9 to 17 on weekdays.
+        # 2016-09-03 is a Saturday.
+        schedule = Models.Schedule(
+            schedule_type=Constants.SCHEDULE_CRON,
+            cron_expression='0,30 9-17 * * MON-FRI',
+            start_time=self.start_time_ugly,
+            **self.active_schedule_skeleton
+        )
+        db.session.add(schedule)
+        db.session.commit()
+        assert schedule.next_run == datetime.datetime(2016, 9, 5, 9, 0)
+        assert len(schedule.occurrences) == 20
+        assert Models.ScheduleOccurrence.query.filter_by(
+            schedule_id=schedule.schedule_id
+        ).count() == 20
+
+        freeze_datetime.freeze(datetime.datetime(2016, 9, 5, 8, 59, 30))
+        schedule.update_next_run(interval=60)
+        db.session.commit()
+        assert schedule.next_run == datetime.datetime(2016, 9, 5, 9, 30)
+        assert len(schedule.occurrences) == 19
+
+        # Occurrences are materialized again when half of them passed.
+        freeze_datetime.freeze(datetime.datetime(2016, 9, 6, 9, 59, 30))
+        schedule.update_next_run(interval=60)
+        db.session.commit()
+        assert schedule.next_run == datetime.datetime(2016, 9, 6, 10, 30)
+        assert len(schedule.occurrences) == 20
+        assert Models.ScheduleOccurrence.query.filter_by(
+            schedule_id=schedule.schedule_id
+        ).count() == 20
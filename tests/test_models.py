@@ -6,6 +6,7 @@ from DanceCats import db
 from DanceCats import Models
 from DanceCats import Constants
 import pytest
+from sqlalchemy import event
 import sqlalchemy.exc as sqlalchemy_exc
 
 
@@ -181,3 +182,87 @@ class TestAllowedEmailModel(object):
     def test_should_not_add_invalid_email_address(self, app):
         with pytest.raises(ValueError):
             Models.AllowedEmail(allowed_email='Invalid')
+
+
+class TestJobFeatureModel(object):
+    """ Unit tests for Models.JobFeature class. """
+
+    def test_should_save_feature_in_its_type(self, app_setup_to_add_job):
+        job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+        job[Constants.JOB_FEATURE_QUERY_TIME_OUT] = 120
+        job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] = False
+        db.session.commit()
+
+        job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+        assert job[Constants.JOB_FEATURE_QUERY_TIME_OUT] == 120
+        assert job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] is False
+
+        job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] = True
+        db.session.commit()
+        assert job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] is True
+
+    def test_should_not_save_invalid_feature(self, app_setup_to_add_job):
+        job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+        with pytest.raises(ValueError):
+            job[Constants.JOB_FEATURE_SERVER_SIDE_CURSOR] = 'yes'
+        with pytest.raises(ValueError):
+            job['unknownFeature'] = 1
+
+
+class TestQueryDataJobModel(object):
+    """ Unit tests for Models.QueryDataJob class. """
+
+    def test_should_list_jobs_in_one_query(self, app_setup_to_add_job,
+                                           user_email):
+        connection = Models.Connection.query.first()
+        job = Models.QueryDataJob.query.get(app_setup_to_add_job['job_id'])
+        job.connection_id = connection.connection_id
+        other_job = Models.QueryDataJob('another job', 'select 1',
+                                        app_setup_to_add_job['user_id'])
+        deleted_job = Models.QueryDataJob('deleted job', 'select 2',
+                                          app_setup_to_add_job['user_id'])
+        deleted_job.is_deleted = True
+        db.session.add_all([other_job, deleted_job,
+                            Models.Job('plain job', 'echo',
+                                       app_setup_to_add_job['user_id'])])
+        db.session.commit()
+
+        statements = []
+
+        def count_statement(*args):
+            statements.append(args[2])
+
+        event.listen(db.engine, 'before_cursor_execute',
+                     count_statement)
+        try:
+            rows = Models.QueryDataJob.list_query('name', False).all()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         count_statement)
+
+        assert len(statements) == 1
+        assert [row.name for row in rows] == ['another job', 'test job']
+        assert rows[0].connection_name is None
+        assert rows[1].connection_name == connection.name
+        assert rows[1].user_email == user_email
+
+        rows = Models.QueryDataJob.list_query('connection_name').all()
+        assert [row.id for row in rows] == [job.job_id, other_job.job_id]
+
+
+class TestTrackJobRunModel(object):
+    """ Unit tests for Models.TrackJobRun class. """
+
+    def test_should_find_latest_tracker_by_index(self, app_setup_to_add_job):
+        query = Models.TrackJobRun.query.filter_by(
+            job_id=app_setup_to_add_job['job_id']
+        ).order_by(Models.TrackJobRun.ran_on.desc()).limit(1)
+        compiled = query.statement.compile(dialect=db.engine.dialect)
+        plan = db.engine.execute(
+            'EXPLAIN QUERY PLAN ' + str(compiled),
+            [compiled.params[name] for name in compiled.positiontup]
+        ).fetchall()
+
+        assert 'ix_track_job_run_job_ran_on' in ' '.join(
+            str(list(step)[-1]) for step in plan
+        )